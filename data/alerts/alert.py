@@ -1,8 +1,12 @@
 '''Entry point for business logic dealing with alerts.
 '''
+import json
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Dict, List, NamedTuple, Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
+import numpy as np
+import pandas as pd
 from pydruid.utils.aggregators import filtered as filtered_aggregator, longmax
 from pydruid.utils.filters import Filter
 
@@ -36,6 +40,10 @@ from web.python_client.alerts_service.model import (
 
 NUM_DAYS_OF_BACK_CHECK = 1
 
+# Maximum number of alert definitions whose fields are computed by a single
+# batched query.
+MAX_ALERT_DEFINITIONS_PER_QUERY = 50
+
 
 # For an alert definition, the min_date is the latest time all fields have data. The max_date is
 # the latest time at least one field has data. Note: min_date and max_date could be equal. Both
@@ -342,6 +350,234 @@ def check_if_alert_triggered(
     return check_single_alert(alert_def, datasource_name, latest_date, query_client)
 
 
+class AlertQueryGroup(NamedTuple):
+    '''A set of alert definitions that can be checked with a single query since they
+    share the same granularity, interval, grouping dimensions and dimension filter.
+    '''
+
+    alert_defs: List[AlertDefinition]
+    granularity: str
+    interval: str
+    dimensions_to_pull: List[str]
+    dimension_filter: Optional[Filter]
+
+
+def get_alert_check_interval(
+    alert_def: AlertDefinition, latest_date: AlertLatestDate
+) -> str:
+    '''Return the interval covering every period `check_if_alert_triggered` checks
+    for the alert definition. For day granularity alerts, this spans the
+    NUM_DAYS_OF_BACK_CHECK days before the latest date as well.
+    '''
+    if alert_def.time_granularity == 'day':
+        return build_time_interval(
+            latest_date.min_date - timedelta(days=NUM_DAYS_OF_BACK_CHECK),
+            latest_date.min_date + timedelta(days=1),
+        )
+    return get_interval_bounds(latest_date, alert_def.time_granularity)
+
+
+def _get_batched_field_id(field: Field, alert_def_idx: int) -> str:
+    # NOTE: Alert definitions in the same group can use the same field with
+    # different calculations, so each definition's fields are given a unique ID.
+    return f'{field.id}__alert_{alert_def_idx}'
+
+
+def _has_strict_null_fields(alert_def: AlertDefinition) -> bool:
+    return all(
+        field.id in field.calculation.to_druid(field.id).strict_null_fields
+        for field in alert_def.fields
+    )
+
+
+def build_alert_query_groups(
+    alert_defs: List[AlertDefinition],
+    latest_dates: Dict[str, Optional[AlertLatestDate]],
+) -> List[AlertQueryGroup]:
+    '''Group the alert definitions that have a latest date into the groups that can
+    share a single query.'''
+    grouped_alert_defs: Dict[Tuple, List[AlertDefinition]] = defaultdict(list)
+    group_info = {}
+    for alert_def in alert_defs:
+        latest_date = latest_dates.get(alert_def.uri)
+        if latest_date is None:
+            continue
+
+        dimensions_to_pull = get_relevant_dimensions(alert_def)
+        dimension_filter = build_druid_filters(get_dimension_value_filters(alert_def))
+        interval = get_alert_check_interval(alert_def, latest_date)
+        serialized_filter = (
+            json.dumps(
+                Filter.build_filter(dimension_filter), sort_keys=True, default=str
+            )
+            if dimension_filter
+            else None
+        )
+        key = (
+            alert_def.time_granularity,
+            interval,
+            tuple(dimensions_to_pull),
+            serialized_filter,
+            # NOTE: Druid returns a row if any field in the query has data.
+            # Fields without strict null handling would report 0 instead of
+            # null for rows that only exist because of another definition's
+            # fields, so those definitions are queried on their own.
+            None if _has_strict_null_fields(alert_def) else alert_def.uri,
+        )
+        grouped_alert_defs[key].append(alert_def)
+        group_info[key] = (
+            alert_def.time_granularity,
+            interval,
+            dimensions_to_pull,
+            dimension_filter,
+        )
+
+    groups = []
+    for key, group_alert_defs in grouped_alert_defs.items():
+        for idx in range(0, len(group_alert_defs), MAX_ALERT_DEFINITIONS_PER_QUERY):
+            groups.append(
+                AlertQueryGroup(
+                    group_alert_defs[idx : idx + MAX_ALERT_DEFINITIONS_PER_QUERY],
+                    *group_info[key],
+                )
+            )
+    return groups
+
+
+def build_query_from_alert_group(
+    group: AlertQueryGroup, datasource_name
+) -> GroupByQueryBuilder:
+    calculations = [
+        field.calculation.to_druid(_get_batched_field_id(field, idx))
+        for idx, alert_def in enumerate(group.alert_defs)
+        for field in alert_def.fields
+    ]
+    return GroupByQueryBuilder(
+        datasource=datasource_name,
+        granularity=group.granularity,
+        grouping_fields=group.dimensions_to_pull,
+        dimension_filter=group.dimension_filter,
+        intervals=[group.interval],
+        calculation=CalculationMerger(calculations),
+        optimize=True,
+    )
+
+
+def _get_column_values(df: pd.DataFrame, column: str) -> np.ndarray:
+    if column not in df:
+        return np.full(len(df), np.nan)
+    return df[column].to_numpy(dtype=float, na_value=np.nan)
+
+
+def run_checks_for_group(
+    group: AlertQueryGroup, query_results
+) -> Dict[str, List[AlertNotification]]:
+    '''Evaluate the checks of every alert definition in the group against the
+    group's query results. Checks are evaluated as comparisons over whole result
+    columns, and the notifications produced match the ones `run_checks` would
+    produce for each separate query `check_if_alert_triggered` issues, in the same
+    order.
+    '''
+    events = [query_result['event'] for query_result in query_results]
+    output: Dict[str, List[AlertNotification]] = {
+        alert_def.uri: [] for alert_def in group.alert_defs
+    }
+    if not events:
+        return output
+
+    df = pd.DataFrame.from_records(events)
+    row_count = len(events)
+    if group.granularity == 'day':
+        # Each day is reported with the single day interval it would have been
+        # queried with, latest day first.
+        row_dates = [
+            datetime.strptime(query_result['timestamp'][:10], '%Y-%m-%d').date()
+            for query_result in query_results
+        ]
+        query_intervals = [
+            build_time_interval(row_date, row_date + timedelta(days=1))
+            for row_date in row_dates
+        ]
+        period_order = -np.array([row_date.toordinal() for row_date in row_dates])
+    else:
+        query_intervals = [group.interval] * row_count
+        period_order = np.zeros(row_count, dtype=int)
+
+    current_time_string = datetime.now().strftime(DRUID_DATE_FORMAT)
+    for idx, alert_def in enumerate(group.alert_defs):
+        field_ids = [_get_batched_field_id(field, idx) for field in alert_def.fields]
+        left_values = _get_column_values(df, field_ids[0])
+        has_data = ~np.isnan(left_values)
+        check_args = {ThresholdCheck.TYPE: (left_values,)}
+        if len(field_ids) > 1:
+            right_values = _get_column_values(df, field_ids[1])
+            has_data &= ~np.isnan(right_values)
+            check_args[ComparativeCheck.TYPE] = (left_values, right_values)
+
+        checks = alert_def.checks
+        triggered = np.zeros((row_count, len(checks)), dtype=bool)
+        for check_idx, check in enumerate(checks):
+            triggered[:, check_idx] = has_data & check.evaluate(*check_args[check.type])
+
+        (rows, check_idxs) = np.nonzero(triggered)
+        if not len(rows):
+            continue
+
+        alert_def_ref = RefObject(ref=alert_def.uri)
+        notifications = output[alert_def.uri]
+        for order_idx in np.lexsort((check_idxs, rows, period_order[rows])):
+            row = rows[order_idx]
+            query_data = events[row]
+            right_value = query_data[field_ids[1]] if len(field_ids) > 1 else None
+            notifications.append(
+                AlertNotification(
+                    alert_definition=alert_def_ref,
+                    dimension_info={
+                        dimension_name: {
+                            'dimension_name': dimension_name,
+                            'dimension_val': query_data.get(dimension_name) or '',
+                        }
+                        for dimension_name in group.dimensions_to_pull
+                    },
+                    generation_date=current_time_string,
+                    reported_val=str(query_data[field_ids[0]]),
+                    compared_val=None if right_value is None else str(right_value),
+                    query_interval=query_intervals[row],
+                )
+            )
+    return output
+
+
+def check_alerts_triggered(
+    alert_defs: List[AlertDefinition],
+    datasource_name,
+    latest_dates: Dict[str, Optional[AlertLatestDate]],
+    query_client,
+) -> List[AlertNotification]:
+    '''Batched version of calling `check_if_alert_triggered` for each alert
+    definition that has a latest date. Compatible alert definitions are checked
+    with a single query that covers every period being checked (including the
+    day granularity back check), instead of one query per definition and period.
+    '''
+    groups = build_alert_query_groups(alert_defs, latest_dates)
+    queries = [build_query_from_alert_group(group, datasource_name) for group in groups]
+    if hasattr(query_client, 'run_queries'):
+        query_results = query_client.run_queries(queries)
+    else:
+        query_results = [query_client.run_query(query) for query in queries]
+
+    notifications_by_uri = {}
+    for group, query_result in zip(groups, query_results):
+        notifications_by_uri.update(
+            run_checks_for_group(group, query_result.result or [])
+        )
+
+    notifications = []
+    for alert_def in alert_defs:
+        notifications.extend(notifications_by_uri.get(alert_def.uri, []))
+    return notifications
+
+
 # Build the aggregation level filters including alert level filters and calculation level filters.
 # Include alert level filters here to be able to issue a single query for the time bounds on all
 # alerts.
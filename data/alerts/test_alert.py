@@ -0,0 +1,176 @@
+import json
+import random
+from datetime import date, datetime, timedelta
+
+import related
+
+from data.alerts.alert import (
+    AlertLatestDate,
+    check_alerts_triggered,
+    check_if_alert_triggered,
+)
+from db.druid.test_utils.in_memory_query_client import (
+    InMemoryQueryClient,
+    TIME_COLUMN,
+)
+from web.python_client.alerts_service.model import AlertDefinition
+
+DATASOURCE = 'test'
+STATES = ['State A', 'State B']
+MUNICIPALITIES = ['Municipality 1', 'Municipality 2', 'Municipality 3']
+FIELDS = ['field_1', 'field_2', 'field_3']
+LATEST_DATE = AlertLatestDate(max_date=date(2021, 3, 10), min_date=date(2021, 3, 9))
+
+
+def _build_rows():
+    generator = random.Random(4)
+    rows = []
+    for day in range(70):
+        timestamp = datetime(2021, 1, 1) + timedelta(days=day)
+        for state in STATES:
+            for municipality in MUNICIPALITIES:
+                for field in FIELDS:
+                    # Fields do not report every day so that some rows only have
+                    # data for some of the fields.
+                    if generator.random() < 0.3:
+                        continue
+                    rows.append(
+                        {
+                            TIME_COLUMN: timestamp,
+                            'StateName': state,
+                            'MunicipalityName': f'{state} {municipality}',
+                            'field': field,
+                            'sum': float(generator.randint(0, 10)),
+                            'count': 1,
+                        }
+                    )
+    return rows
+
+
+def _build_field(field_id, metric='sum'):
+    return {
+        'id': field_id,
+        'calculation': {
+            'type': 'SUM',
+            'metric': metric,
+            'filter': {'type': 'SELECTOR', 'dimension': 'field', 'value': field_id},
+        },
+    }
+
+
+def _build_alert_def(
+    uri, time_granularity, fields, checks, *, filters=(), metric='sum'
+):
+    return related.to_model(
+        AlertDefinition,
+        {
+            '$uri': uri,
+            'userId': 'user',
+            'title': uri,
+            'timeGranularity': time_granularity,
+            'dimensionName': 'MunicipalityName',
+            'checks': checks,
+            'fields': [_build_field(field_id, metric) for field_id in fields],
+            'filters': list(filters),
+        },
+    )
+
+
+def _build_alert_defs():
+    threshold_check = {'type': 'THRESHOLD', 'operation': '>', 'threshold': 6}
+    comparative_check = {'type': 'COMPARATIVE', 'operation': '<'}
+    state_filter = {
+        'id': 'state_filter',
+        'dimension': 'StateName',
+        'dimensionValues': [
+            {
+                'id': 'state_a',
+                'dimension': 'StateName',
+                'name': 'State A',
+                'filter': {
+                    'type': 'SELECTOR',
+                    'dimension': 'StateName',
+                    'value': 'State A',
+                },
+            }
+        ],
+    }
+    return [
+        _build_alert_def('day_threshold', 'day', ['field_1'], [threshold_check]),
+        _build_alert_def(
+            'day_comparative',
+            'day',
+            ['field_1', 'field_2'],
+            [comparative_check, {**threshold_check, 'threshold': 2}],
+        ),
+        # The same field computed with a different calculation by another
+        # definition checked in the same query.
+        _build_alert_def(
+            'day_same_field',
+            'day',
+            ['field_1'],
+            [{**threshold_check, 'threshold': 0}],
+            metric='count',
+        ),
+        _build_alert_def(
+            'day_filtered',
+            'day',
+            ['field_3'],
+            [threshold_check],
+            filters=[state_filter],
+        ),
+        _build_alert_def('week_threshold', 'week', ['field_2'], [threshold_check]),
+        _build_alert_def(
+            'month_comparative', 'month', ['field_3', 'field_1'], [comparative_check]
+        ),
+        _build_alert_def('no_data', 'day', ['field_2'], [threshold_check]),
+    ]
+
+
+def _serialize_notifications(notifications):
+    output = []
+    for notification in notifications:
+        serialized_notification = related.to_dict(notification)
+        # The generation date is the time the notification was built.
+        serialized_notification.pop('generationDate', None)
+        output.append(json.dumps(serialized_notification, sort_keys=True))
+    return output
+
+
+def test_batched_alert_checks_match_per_definition_checks():
+    rows = _build_rows()
+    alert_defs = _build_alert_defs()
+    latest_dates = {alert_def.uri: LATEST_DATE for alert_def in alert_defs}
+    latest_dates['no_data'] = None
+
+    query_client = InMemoryQueryClient(rows)
+    expected = []
+    for alert_def in alert_defs:
+        if latest_dates[alert_def.uri] is not None:
+            expected.extend(
+                check_if_alert_triggered(
+                    alert_def, DATASOURCE, latest_dates[alert_def.uri], query_client
+                )
+            )
+    per_definition_query_count = len(query_client.query_dicts)
+
+    batched_query_client = InMemoryQueryClient(rows)
+    actual = check_alerts_triggered(
+        alert_defs, DATASOURCE, latest_dates, batched_query_client
+    )
+
+    assert len(expected) > 20
+    assert _serialize_notifications(actual) == _serialize_notifications(expected)
+    # The day alerts without filters share a query, and the day alerts no longer
+    # need a query for each back checked day.
+    assert per_definition_query_count == 10
+    assert len(batched_query_client.query_dicts) == 4
+
+
+def test_batched_alert_checks_without_rows():
+    alert_defs = _build_alert_defs()
+    latest_dates = {alert_def.uri: LATEST_DATE for alert_def in alert_defs}
+    query_client = InMemoryQueryClient([])
+    assert not check_alerts_triggered(
+        alert_defs, DATASOURCE, latest_dates, query_client
+    )
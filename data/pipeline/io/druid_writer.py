@@ -1,9 +1,13 @@
 import json
+import multiprocessing
 
-from collections import defaultdict
+from collections import defaultdict, deque
 from datetime import datetime
+from itertools import islice
 
 from log import LOG
+from util.file.file_config import FilePattern
+from util.file.shard import ShardWriter, fwrite
 
 # When we are running inside PyPy, we can use the optimized StringBuilder type to
 # help serialize JSON.
@@ -24,6 +28,13 @@ except ImportError:
 INFINITY = float('inf')
 NAN = float('nan')
 
+# Number of input rows each worker process converts at a time when running the
+# DruidWriter in parallel.
+DEFAULT_PARALLEL_BATCH_SIZE = 200000
+
+# State shared with the forked worker processes of `DruidWriter.run_parallel`.
+_PARALLEL_WORKER_STATE = {}
+
 
 class RowMetaData:
     def __init__(self):
@@ -38,6 +49,13 @@ class RowMetaData:
         if row.date > self.end_date:
             self.end_date = row.date
 
+    def merge(self, other):
+        self.count += other.count
+        if other.start_date < self.start_date:
+            self.start_date = other.start_date
+        if other.end_date > self.end_date:
+            self.end_date = other.end_date
+
 
 class ErrorHandler:
     '''Class to log and optionally raise errors that are found during conversion
@@ -97,6 +115,21 @@ class ErrorHandler:
         if track_failed_matches:
             self.failed_matches[key] += 1
 
+    def create_empty_copy(self):
+        '''Build a new ErrorHandler with the same settings and no stats.'''
+        return ErrorHandler(
+            self.allow_missing_date,
+            self.allow_empty_data,
+            self.allow_missing_canonical_match,
+        )
+
+    def merge(self, other):
+        '''Add the stats collected by `other` into this ErrorHandler.'''
+        self.missing_date_count += other.missing_date_count
+        self.empty_data_count += other.empty_data_count
+        for key, count in other.failed_matches.items():
+            self.failed_matches[key] += count
+
     def print_stats(self):
         if self.missing_date_count:
             LOG.info('Rows missing a date: %s', self.missing_date_count)
@@ -203,11 +236,52 @@ class DruidWriter:
     ):
         LOG.info('Starting processing')
 
+        (
+            input_row_count,
+            output_row_count,
+            datasource_field_metadata,
+        ) = cls._process_rows(
+            base_row_cls,
+            metadata_collector,
+            input_file,
+            output_file,
+            error_handler,
+            parse_row,
+            write_output_rows,
+            track_failed_matches,
+        )
+        if output_metadata_digest_writer:
+            write_metadata_digest(
+                output_metadata_digest_writer, datasource_field_metadata
+            )
+
+        LOG.info('Finished processing')
+        LOG.info('Input rows processed: %s', input_row_count)
+        LOG.info('Output rows written: %s', output_row_count)
+        error_handler.print_stats()
+
+    @classmethod
+    def _process_rows(
+        cls,
+        base_row_cls,
+        metadata_collector,
+        input_rows,
+        output_file,
+        error_handler,
+        parse_row,
+        write_output_rows,
+        track_failed_matches,
+        log_progress=True,
+    ):
+        '''Convert the input rows into Druid rows and write them to `output_file`.
+        Return the number of input rows processed, the number of output rows written
+        and the metadata collected for each field.
+        '''
         input_row_count = output_row_count = 0
         unmapped_keys = set(base_row_cls.UNMAPPED_KEYS)
         has_unmapped_keys = bool(unmapped_keys)
         datasource_field_metadata = defaultdict(RowMetaData)
-        for input_row in input_file:
+        for input_row in input_rows:
             (row, has_data, parsed_extras) = parse_row(input_row)
             input_row_count += 1
             if not row.date:
@@ -250,19 +324,112 @@ class DruidWriter:
             rows_written = write_output_rows(row, output_file, parsed_extras)
             output_row_count += rows_written
 
-            if (input_row_count % 20000) == 0:
+            if log_progress and (input_row_count % 20000) == 0:
                 LOG.info('Rows processed: %s', input_row_count)
+        return (input_row_count, output_row_count, datasource_field_metadata)
+
+    @classmethod
+    def run_parallel(
+        cls,
+        base_row_cls,
+        metadata_collector,
+        input_file,
+        output_file_pattern,
+        shard_size,
+        num_workers,
+        file_opener=fwrite,
+        use_optimizations=True,
+        error_handler=None,
+        output_metadata_digest_writer=None,
+        track_failed_matches=True,
+        batch_size=DEFAULT_PARALLEL_BATCH_SIZE,
+    ):
+        '''Convert rows stored in `input_file` into Druid output rows using
+        `num_workers` processes.
+
+        The input rows are split into batches of `batch_size` rows. Each batch is
+        converted by a worker process and written to its own set of output shards
+        (built from `output_file_pattern` with the batch number and shard number as
+        the placeholder value, for example `processed_rows.3_0.json.gz`). Worker
+        processes are forked so that the `metadata_collector` mapping is shared
+        read-only with every worker instead of being rebuilt or copied.
+
+        The error stats and field metadata each batch produces are merged in batch
+        order, so the stats and the metadata digest are the same as if the rows
+        were processed serially.
+
+        See `run` for a description of the remaining arguments.
+        '''
+        assert num_workers > 0, 'At least one worker process is required'
+        error_handler = error_handler or ErrorHandler()
+        (parse_row, write_output_rows) = (
+            Parser.optimized_parser(base_row_cls)
+            if use_optimizations
+            else Parser.safe_parser(base_row_cls)
+        )
+
+        # NOTE: The worker state is stored globally before the worker
+        # processes are forked so that it is inherited by each worker. This avoids
+        # pickling the (very large) metadata collector and the parser closures.
+        _PARALLEL_WORKER_STATE.update(
+            base_row_cls=base_row_cls,
+            metadata_collector=metadata_collector,
+            output_file_pattern=output_file_pattern,
+            shard_size=shard_size,
+            file_opener=file_opener,
+            error_handler=error_handler,
+            parse_row=parse_row,
+            write_output_rows=write_output_rows,
+            track_failed_matches=track_failed_matches,
+        )
+
+        LOG.info('Starting processing with %s worker processes', num_workers)
+        input_row_count = output_row_count = 0
+        datasource_field_metadata = defaultdict(RowMetaData)
+
+        def merge_batch_result(pending_result):
+            nonlocal input_row_count, output_row_count
+            (
+                batch_input_count,
+                batch_output_count,
+                batch_error_handler,
+                batch_field_metadata,
+            ) = pending_result.get()
+            input_row_count += batch_input_count
+            output_row_count += batch_output_count
+            error_handler.merge(batch_error_handler)
+            for field, metadata in batch_field_metadata.items():
+                datasource_field_metadata[field].merge(metadata)
+            LOG.info('Rows processed: %s', input_row_count)
+
+        try:
+            with multiprocessing.get_context('fork').Pool(num_workers) as pool:
+                # Limit the number of batches that are waiting to be processed so
+                # that the full input is never held in memory.
+                pending_results = deque()
+                input_rows = iter(input_file)
+                batch_num = 0
+                while True:
+                    batch = list(islice(input_rows, batch_size))
+                    if not batch:
+                        break
+
+                    if len(pending_results) >= num_workers * 2:
+                        merge_batch_result(pending_results.popleft())
+                    pending_results.append(
+                        pool.apply_async(_process_batch, (batch_num, batch))
+                    )
+                    batch_num += 1
+
+                while pending_results:
+                    merge_batch_result(pending_results.popleft())
+        finally:
+            _PARALLEL_WORKER_STATE.clear()
+
         if output_metadata_digest_writer:
-            output_metadata_digest_writer.writeheader()
-            for field in datasource_field_metadata:
-                output_metadata_digest_writer.writerow(
-                    {
-                        'indicator_id': field,
-                        'count': datasource_field_metadata[field].count,
-                        'start_date': datasource_field_metadata[field].start_date,
-                        'end_date': datasource_field_metadata[field].end_date,
-                    }
-                )
+            write_metadata_digest(
+                output_metadata_digest_writer, datasource_field_metadata
+            )
 
         LOG.info('Finished processing')
         LOG.info('Input rows processed: %s', input_row_count)
@@ -270,6 +437,50 @@ class DruidWriter:
         error_handler.print_stats()
 
 
+def _process_batch(batch_num, input_rows):
+    '''Convert a batch of input rows inside a worker process and write the output
+    rows to this batch's own output shards.'''
+    state = _PARALLEL_WORKER_STATE
+    error_handler = state['error_handler'].create_empty_copy()
+    file_pattern = state['output_file_pattern']
+    output_file_pattern = FilePattern(
+        file_pattern.build(f'{batch_num}_{file_pattern.placeholder}'),
+        file_pattern.placeholder,
+    )
+    with ShardWriter(
+        output_file_pattern, state['shard_size'], state['file_opener']
+    ) as output_file:
+        (
+            input_row_count,
+            output_row_count,
+            datasource_field_metadata,
+        ) = DruidWriter._process_rows(  # pylint: disable=protected-access
+            state['base_row_cls'],
+            state['metadata_collector'],
+            input_rows,
+            output_file,
+            error_handler,
+            state['parse_row'],
+            state['write_output_rows'],
+            state['track_failed_matches'],
+            log_progress=False,
+        )
+    return (input_row_count, output_row_count, error_handler, datasource_field_metadata)
+
+
+def write_metadata_digest(output_metadata_digest_writer, datasource_field_metadata):
+    output_metadata_digest_writer.writeheader()
+    for field in datasource_field_metadata:
+        output_metadata_digest_writer.writerow(
+            {
+                'indicator_id': field,
+                'count': datasource_field_metadata[field].count,
+                'start_date': datasource_field_metadata[field].start_date,
+                'end_date': datasource_field_metadata[field].end_date,
+            }
+        )
+
+
 class Parser:
     '''Class providing the various serialization/deserialization methods that
     are supported.
@@ -68,64 +68,69 @@ class Resampler:
     def _compare_date(self, raw_date):
         return self._convert_date_str(raw_date) < self.last_date
 
+    def _parse_line(self, line):
+        json_line = json.loads(line)
+
+        # Handle different ways that data is stored for druid.
+        # If there is a field key in the json line, it is *not nested*.
+        data = {}
+        if json_line.get(FIELD_COLUMN):
+            field = json_line[FIELD_COLUMN]
+            value = json_line[VALUE_COLUMN]
+
+            # If the field is storing a list of values then it is operating as a
+            # multi-value dimension where all the fields should receive the same
+            # value. This generally only happens when multiple fields have a value
+            # of 0 for the same date and dimensions.
+            if isinstance(field, list):
+                for f in field:
+                    data[f] = value
+            else:
+                # Common case: field is a string and value is a number.
+                data[field] = value
+        else:
+            # Otherwise, we should have a `data` dictionary containing the
+            # nested values.
+            data.update(json_line[DATA_COLUMN])
+            del json_line[DATA_COLUMN]
+        return (json_line, data)
+
+    def _add_row(self, json_line, data, row_key_prefix):
+        raw_date = json_line[self.date_field]
+        for field, value in data.items():
+            row_key = f'{row_key_prefix}__{field}'
+
+            # If this field is not part of the set of fields we should resample,
+            # then it will be collected differently.
+            collection = (
+                self._rows_to_resample
+                if field in self.fields and self._compare_date(raw_date)
+                else self._non_resampled_rows
+            )
+            if row_key not in collection:
+                collection[row_key] = {}
+
+            rows = collection[row_key]
+
+            # If this unique `dimension + field` combination has already been seen,
+            # accumulate the value since we are collapsing rows.
+            if raw_date in rows:
+                rows[raw_date][VALUE_COLUMN] += value
+            else:
+                # Store the row as non-nested format.
+                rows[raw_date] = {
+                    **json_line,
+                    FIELD_COLUMN: field,
+                    VALUE_COLUMN: value,
+                }
+
     def read_lines(self, lines):
         # Read in all the lines if a line has a field we are
         # resampling then add the line to the _data grouped with
         # other lines that have the same key.
         for line in lines:
-            json_line = json.loads(line)
-
-            # Handle different ways that data is stored for druid.
-            # If there is a field key in the json line, it is *not nested*.
-            data = {}
-            if json_line.get(FIELD_COLUMN):
-                field = json_line[FIELD_COLUMN]
-                value = json_line[VALUE_COLUMN]
-
-                # If the field is storing a list of values then it is operating as a
-                # multi-value dimension where all the fields should receive the same
-                # value. This generally only happens when multiple fields have a value
-                # of 0 for the same date and dimensions.
-                if isinstance(field, list):
-                    for f in field:
-                        data[f] = value
-                else:
-                    # Common case: field is a string and value is a number.
-                    data[field] = value
-            else:
-                # Otherwise, we should have a `data` dictionary containing the
-                # nested values.
-                data.update(json_line[DATA_COLUMN])
-                del json_line[DATA_COLUMN]
-
-            row_key_prefix = self._build_row_key_prefix(json_line)
-            raw_date = json_line[self.date_field]
-            for field, value in data.items():
-                row_key = f'{row_key_prefix}__{field}'
-
-                # If this field is not part of the set of fields we should resample,
-                # then it will be collected differently.
-                collection = (
-                    self._rows_to_resample
-                    if field in self.fields and self._compare_date(raw_date)
-                    else self._non_resampled_rows
-                )
-                if row_key not in collection:
-                    collection[row_key] = {}
-
-                rows = collection[row_key]
-
-                # If this unique `dimension + field` combination has already been seen,
-                # accumulate the value since we are collapsing rows.
-                if raw_date in rows:
-                    rows[raw_date][VALUE_COLUMN] += value
-                else:
-                    # Store the row as non-nested format.
-                    rows[raw_date] = {
-                        **json_line,
-                        FIELD_COLUMN: field,
-                        VALUE_COLUMN: value,
-                    }
+            (json_line, data) = self._parse_line(line)
+            self._add_row(json_line, data, self._build_row_key_prefix(json_line))
 
     def _build_raw_output_row(self, row):
         # JSON serialize the row but exclude the date and closing brace of the
@@ -182,3 +187,40 @@ class Resampler:
                         line_ending,
                     )
                     cur_date += one_time_chunk
+
+    def stream_output_rows(
+        self, lines, newline=True, alternate_end_date_function=lambda y, x: x
+    ):
+        '''Read the lines and emit the output rows one dimension key at a time, so
+        that only the rows of a single key are held in memory. The lines must be
+        grouped by dimension key (for example, sorted by the dimension values).
+
+        The output rows are the same as calling `read_lines` followed by
+        `build_output_rows`, except they are ordered by dimension key.
+        '''
+        current_key_prefix = None
+        # NOTE: Only the key prefixes are stored for completed keys so that lines
+        # that are not grouped by dimension key can be detected.
+        completed_key_prefixes = set()
+        for line in lines:
+            (json_line, data) = self._parse_line(line)
+            row_key_prefix = self._build_row_key_prefix(json_line)
+            if row_key_prefix != current_key_prefix:
+                if current_key_prefix is not None:
+                    yield from self._flush_key(newline, alternate_end_date_function)
+                    completed_key_prefixes.add(current_key_prefix)
+
+                if row_key_prefix in completed_key_prefixes:
+                    raise ValueError(
+                        'Input lines must be grouped by dimension key. Found '
+                        f'ungrouped line for key: {row_key_prefix}'
+                    )
+                current_key_prefix = row_key_prefix
+            self._add_row(json_line, data, row_key_prefix)
+
+        yield from self._flush_key(newline, alternate_end_date_function)
+
+    def _flush_key(self, newline, alternate_end_date_function):
+        yield from self.build_output_rows(newline, alternate_end_date_function)
+        self._rows_to_resample = {}
+        self._non_resampled_rows = {}
@@ -0,0 +1,303 @@
+'''Out-of-core storage for rows that are being rolled up.
+
+When a source has more unique dimension + date combinations than can be held in
+memory, the partially aggregated rows are periodically spilled to LZ4 compressed
+"runs" sorted by their rollup key. Once all input has been read, the runs are
+k-way merged so that the partial aggregates for the same key are combined, and the
+combined rows are then re-sorted on disk into the order in which each key was first
+seen. This produces the same row order as the in-memory rollup.
+
+Each spilled entry is a JSON list with the form:
+    [row_key, first_seq, row_count, first_row_value_count, base_row_dict]
+where `first_seq` is the position at which the key was first seen in the input,
+`row_count` is the number of input rows aggregated into the entry, and
+`first_row_value_count` is the number of values the first input row contributed
+(they are always the first values stored in the row's data).
+
+Float addition is not associative, so combining partial sums from different runs
+would round differently than adding the values one row at a time. When spilling is
+enabled, the rows held in memory and the spilled entries are therefore summed with
+`rollup_values`, which sums floats exactly, and the sum is rounded once when the
+row is written with `finalize_rollup_data`. The output is then the same no matter
+how the rows were split into runs. The default in-memory rollup (without a row
+budget) keeps plain float addition.
+'''
+import heapq
+import json
+import math
+import os
+import shutil
+import tempfile
+
+from contextlib import ExitStack
+from itertools import groupby
+from operator import itemgetter
+
+from util.file.compression.lz4 import LZ4Reader, LZ4Writer
+
+# Maximum number of runs that are merged at the same time. Each open run uses a
+# separate decompression process, so larger merges are done in multiple passes.
+DEFAULT_MAX_MERGE_FAN_IN = 32
+
+ROW_KEY_IDX = 0
+FIRST_SEQ_IDX = 1
+ROW_COUNT_IDX = 2
+FIRST_ROW_VALUE_COUNT_IDX = 3
+BASE_ROW_IDX = 4
+
+_get_row_key = itemgetter(ROW_KEY_IDX)
+_get_first_seq = itemgetter(FIRST_SEQ_IDX)
+
+# Every finite float is an integer multiple of the smallest positive float,
+# 2 ** -1074, so floats can be summed exactly as integers at this scale.
+_EXACT_SUM_SCALE_BITS = 1074
+_EXACT_SUM_SCALE = 1 << _EXACT_SUM_SCALE_BITS
+
+
+class ExactSum:
+    '''The exact sum of int and float values. Rolled up values that include a
+    float are stored as an ExactSum until the row is written.'''
+
+    __slots__ = ('scaled_total', 'special_total')
+
+    def __init__(self, scaled_total=0, special_total=None):
+        # The sum of the finite values, scaled by _EXACT_SUM_SCALE.
+        self.scaled_total = scaled_total
+        # The sum of the NaN and infinite values, if any were added. The order
+        # these are added in does not change their sum.
+        self.special_total = special_total
+
+    def add(self, value):
+        value_type = type(value)
+        if value_type is int:
+            self.scaled_total += value << _EXACT_SUM_SCALE_BITS
+        elif value_type is ExactSum or value_type is list:
+            if value_type is list:
+                value = ExactSum.from_json(value)
+            self.scaled_total += value.scaled_total
+            if value.special_total is not None:
+                self.add(value.special_total)
+        elif math.isfinite(value):
+            # NOTE: The denominator is a power of two no larger than the scale, so
+            # the scaled value is exact.
+            (numerator, denominator) = value.as_integer_ratio()
+            self.scaled_total += numerator << (
+                _EXACT_SUM_SCALE_BITS + 1 - denominator.bit_length()
+            )
+        elif self.special_total is None:
+            self.special_total = value
+        else:
+            self.special_total += value
+        return self
+
+    def to_float(self):
+        '''Return the sum correctly rounded to the nearest float.'''
+        if self.special_total is not None:
+            return self.special_total
+        try:
+            return self.scaled_total / _EXACT_SUM_SCALE
+        except OverflowError:
+            return math.copysign(math.inf, self.scaled_total)
+
+    def to_json(self):
+        '''Serialize the sum as a list. Data values are otherwise always numbers, so
+        a list value in a spilled entry is always an ExactSum.'''
+        if self.special_total is None:
+            return [self.scaled_total]
+        return [self.scaled_total, repr(self.special_total)]
+
+    @classmethod
+    def from_json(cls, value):
+        if len(value) == 1:
+            return cls(value[0])
+        return cls(value[0], float(value[1]))
+
+
+def _encode_exact_sum(value):
+    if isinstance(value, ExactSum):
+        return value.to_json()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def add_rollup_value(total, value):
+    '''Add `value` to the rolled up `total` and return the new total. Ints are
+    summed normally. Sums including a float are stored as an ExactSum.'''
+    if type(total) is int and type(value) is int:
+        return total + value
+    if type(total) is ExactSum:
+        return total.add(value)
+    return ExactSum().add(total).add(value)
+
+
+def rollup_values(data, values):
+    '''Add each of `values` to the rolled up value with the same key in `data`.'''
+    for key, value in values.items():
+        total = data.get(key, 0)
+        # NOTE: Checking for ints inline since they are the most common values.
+        if type(total) is int and type(value) is int:
+            data[key] = total + value
+        else:
+            data[key] = add_rollup_value(total, value)
+
+
+def finalize_rollup_data(data):
+    '''Replace the exact sums stored in the rolled up `data` with floats.'''
+    for key, value in data.items():
+        if type(value) is ExactSum:
+            data[key] = value.to_float()
+        elif type(value) is list:
+            data[key] = ExactSum.from_json(value).to_float()
+    return data
+
+
+# Reuse the same encoder/decoder instead of using loads and dumps since those
+# versions construct a new encoder/decoder each time they are called.
+_JSON_ENCODER = json.JSONEncoder(
+    check_circular=False, allow_nan=False, default=_encode_exact_sum
+)
+_DECODE_JSON = json.JSONDecoder().decode
+
+
+def combine_entries(entry, later_entry, tracer_field=None):
+    '''Roll up the values of `later_entry` into `entry`. The values are combined in
+    the same order the in-memory rollup combines the values of individual rows, so
+    the order of the keys in the output data matches the in-memory output.
+    '''
+    data = entry[BASE_ROW_IDX]['data']
+    later_data = later_entry[BASE_ROW_IDX]['data']
+
+    # The in-memory rollup sets the tracer field once the second row for a key has
+    # been aggregated. If `entry` holds a single row, the second row is the first
+    # row of `later_entry`. Otherwise, the tracer field has already been set.
+    tracer_idx = (
+        later_entry[FIRST_ROW_VALUE_COUNT_IDX] if entry[ROW_COUNT_IDX] == 1 else None
+    )
+    for idx, (key, value) in enumerate(later_data.items()):
+        if tracer_field and idx == tracer_idx:
+            data[tracer_field] = 1
+        data[key] = add_rollup_value(data.get(key, 0), value)
+
+    if tracer_field:
+        data[tracer_field] = 1
+
+    entry[ROW_COUNT_IDX] += later_entry[ROW_COUNT_IDX]
+    return entry
+
+
+class RollupSpiller:
+    '''Spill sorted partial aggregates to disk and merge them back together.'''
+
+    def __init__(
+        self,
+        tracer_field=None,
+        spill_dir=None,
+        max_merge_fan_in=DEFAULT_MAX_MERGE_FAN_IN,
+    ):
+        assert max_merge_fan_in > 1, 'At least two runs must be merged at once'
+        self.tracer_field = tracer_field
+        self.spill_dir = spill_dir
+        self.max_merge_fan_in = max_merge_fan_in
+
+        self.spill_count = 0
+        self.merge_pass_count = 0
+
+        self._tmp_dir = None
+        self._run_count = 0
+        self._runs = []
+
+    @property
+    def has_spilled(self):
+        return bool(self._runs)
+
+    def _new_run_path(self):
+        if not self._tmp_dir:
+            self._tmp_dir = tempfile.mkdtemp(prefix='rollup_', dir=self.spill_dir)
+        self._run_count += 1
+        return os.path.join(self._tmp_dir, f'run_{self._run_count}.lz4')
+
+    def _write_run(self, entries):
+        path = self._new_run_path()
+        with LZ4Writer(path) as f_out:
+            for entry in entries:
+                f_out.write(_JSON_ENCODER.encode(entry))
+                f_out.write('\n')
+        return path
+
+    def spill(self, entries):
+        '''Write the provided entries to a new run sorted by row key.'''
+        self._runs.append(self._write_run(sorted(entries, key=_get_row_key)))
+        self.spill_count += 1
+
+    def _iter_merged(self, stack, paths, sort_key, combine):
+        runs = [
+            map(_DECODE_JSON, stack.enter_context(LZ4Reader(path))) for path in paths
+        ]
+        # NOTE: heapq.merge is stable, so entries with the same key are
+        # produced in the order the runs were written.
+        merged = heapq.merge(*runs, key=sort_key)
+        if not combine:
+            yield from merged
+            return
+
+        for _, entries in groupby(merged, key=sort_key):
+            entry = next(entries)
+            for later_entry in entries:
+                entry = combine_entries(entry, later_entry, self.tracer_field)
+            yield entry
+
+    def _reduce_runs(self, paths, sort_key, combine):
+        '''Merge groups of adjacent runs until there are few enough runs left to
+        merge them all at once.'''
+        while len(paths) > self.max_merge_fan_in:
+            reduced_paths = []
+            for idx in range(0, len(paths), self.max_merge_fan_in):
+                group = paths[idx : idx + self.max_merge_fan_in]
+                with ExitStack() as stack:
+                    reduced_paths.append(
+                        self._write_run(
+                            self._iter_merged(stack, group, sort_key, combine)
+                        )
+                    )
+                for path in group:
+                    os.remove(path)
+            paths = reduced_paths
+            self.merge_pass_count += 1
+        return paths
+
+    def _merge(self, paths, sort_key, combine):
+        paths = self._reduce_runs(paths, sort_key, combine)
+        self.merge_pass_count += 1
+        with ExitStack() as stack:
+            yield from self._iter_merged(stack, paths, sort_key, combine)
+
+    def iter_merged_rows(self, max_entries):
+        '''Combine all spilled entries with the same row key and yield the base row
+        dicts in the order each row key was first seen. `max_entries` bounds the
+        number of combined entries held in memory while they are re-sorted.
+        '''
+        try:
+            seq_runs = []
+            buffer = []
+            for entry in self._merge(self._runs, _get_row_key, True):
+                buffer.append(entry)
+                if len(buffer) >= max_entries:
+                    buffer.sort(key=_get_first_seq)
+                    seq_runs.append(self._write_run(buffer))
+                    buffer = []
+            if buffer:
+                buffer.sort(key=_get_first_seq)
+                seq_runs.append(self._write_run(buffer))
+                buffer = []
+
+            for entry in self._merge(seq_runs, _get_first_seq, False):
+                base_row_dict = entry[BASE_ROW_IDX]
+                finalize_rollup_data(base_row_dict['data'])
+                yield base_row_dict
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        if self._tmp_dir:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+        self._runs = []
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# Compare the throughput and peak memory usage of the batch and streaming
+# resampler modes on synthetic weekly stock data grouped by facility. Each mode is
+# run in a separate process so that peak RSS is measured independently. The output
+# rows of both modes are also checked for equality on a smaller input.
+#
+# Usage:
+#   ./data/pipeline/scripts/benchmark_resampler.py --rows 10000000
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pylib.base.flags import Flags
+
+from data.pipeline.resampler import Resampler
+from log import LOG
+
+DATE_FIELD = 'date'
+DATE_FORMAT = '%Y-%m-%d'
+DIMENSIONS = ['RegionName', 'DistrictName', 'FacilityName']
+RESAMPLED_FIELDS = ['stock_1', 'stock_2', 'stock_3']
+OTHER_FIELDS = ['consumption']
+LAST_DATE = '2022-01-01'
+
+
+def build_synthetic_lines(row_count, weeks_per_key=52):
+    '''Build weekly rows grouped by facility. Half of the rows are stored in the
+    nested format and half in the flat format.'''
+    start_date = datetime(2021, 1, 4)
+    dates = [
+        (start_date + timedelta(weeks=week)).strftime(DATE_FORMAT)
+        for week in range(weeks_per_key)
+    ]
+    fields = RESAMPLED_FIELDS + OTHER_FIELDS
+    for idx in range(row_count):
+        key_idx = idx // weeks_per_key
+        row = {
+            'RegionName': f'Region {key_idx % 20}',
+            'DistrictName': f'District {key_idx % 400}',
+            'FacilityName': f'Facility {key_idx}',
+            DATE_FIELD: dates[idx % weeks_per_key],
+        }
+        if idx % 2:
+            row['field'] = fields[idx % len(fields)]
+            row['val'] = idx % 100
+        else:
+            row['data'] = {field: idx % 100 for field in fields}
+        yield json.dumps(row)
+
+
+def build_resampler():
+    return Resampler(
+        RESAMPLED_FIELDS, DATE_FIELD, DATE_FORMAT, DIMENSIONS, LAST_DATE, 'day'
+    )
+
+
+def run_batch(lines):
+    resampler = build_resampler()
+    resampler.read_lines(lines)
+    return resampler.build_output_rows()
+
+
+def run_streaming(lines):
+    return build_resampler().stream_output_rows(lines)
+
+
+def _run_benchmark(implementation, row_count, output_queue):
+    start = time.perf_counter()
+    output_row_count = sum(1 for _ in implementation(build_synthetic_lines(row_count)))
+    elapsed = time.perf_counter() - start
+    # NOTE: ru_maxrss is reported in kilobytes on Linux.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    output_queue.put((output_row_count, elapsed, peak_rss))
+
+
+def main():
+    Flags.PARSER.add_argument(
+        '--rows', type=int, default=10000000, help='Number of synthetic input rows'
+    )
+    Flags.PARSER.add_argument(
+        '--verify_rows',
+        type=int,
+        default=100000,
+        help='Number of synthetic input rows to compare the output of both modes on',
+    )
+    Flags.InitArgs()
+
+    verify_lines = list(build_synthetic_lines(Flags.ARGS.verify_rows))
+    if Counter(run_batch(verify_lines)) != Counter(run_streaming(verify_lines)):
+        LOG.error('Streaming output rows do not match the batch output rows')
+        return 1
+    LOG.info('Streaming output rows match the batch output rows')
+
+    context = multiprocessing.get_context('fork')
+    for (name, implementation) in (('batch', run_batch), ('streaming', run_streaming)):
+        output_queue = context.Queue()
+        process = context.Process(
+            target=_run_benchmark,
+            args=(implementation, Flags.ARGS.rows, output_queue),
+        )
+        process.start()
+        (output_row_count, elapsed, peak_rss) = output_queue.get()
+        process.join()
+        LOG.info(
+            '%s: %s input rows, %s output rows in %.2fs (%.0f input rows/s), '
+            'peak RSS: %.1f MB',
+            name,
+            Flags.ARGS.rows,
+            output_row_count,
+            elapsed,
+            Flags.ARGS.rows / elapsed if elapsed else 0,
+            peak_rss / 1024,
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
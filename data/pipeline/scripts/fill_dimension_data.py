@@ -7,7 +7,11 @@ import sys
 from pylib.base.flags import Flags
 
 from config.datatypes import BaseRowType, DimensionFactoryType
-from data.pipeline.io.druid_writer import DruidWriter, ErrorHandler
+from data.pipeline.io.druid_writer import (
+    DEFAULT_PARALLEL_BATCH_SIZE,
+    DruidWriter,
+    ErrorHandler,
+)
 from util.file.compression.lz4 import LZ4Reader
 from util.file.compression.pigz import PigzWriter
 from util.file.file_config import FilePattern
@@ -102,12 +106,25 @@ def main():
         'have an entry in location_mapping_file '
         'will be skipped.',
     )
+    Flags.PARSER.add_argument(
+        '--num_workers',
+        type=int,
+        default=1,
+        help='Number of worker processes to convert rows with. When greater than 1, '
+        'each worker writes its own output shards and the output file pattern '
+        'placeholder is replaced with "{batch number}_{shard number}".',
+    )
+    Flags.PARSER.add_argument(
+        '--parallel_batch_size',
+        type=int,
+        default=DEFAULT_PARALLEL_BATCH_SIZE,
+        help='Number of input rows sent to a worker process at a time. Only used '
+        'when --num_workers is greater than 1.',
+    )
     Flags.InitArgs()
 
     file_pattern = FilePattern(Flags.ARGS.output_file_pattern)
-    with LZ4Reader(Flags.ARGS.input_file) as input_file, ShardWriter(
-        file_pattern, Flags.ARGS.shard_size, PigzWriter
-    ) as output_writer, open(
+    with LZ4Reader(Flags.ARGS.input_file) as input_file, open(
         Flags.ARGS.metadata_digest_file, 'w'
     ) as metadata_digest_file:
         metadata_collector = DimensionFactoryType.create_metadata_collector(
@@ -120,18 +137,38 @@ def main():
             allow_empty_data=Flags.ARGS.ignore_empty_data,
             allow_missing_canonical_match=Flags.ARGS.ignore_missing_canonical_match,
         )
-        DruidWriter.run(
-            BaseRowType,
-            metadata_collector,
-            input_file,
-            output_writer,
-            Flags.ARGS.use_experimental_parser,
-            error_handler,
-            csv.DictWriter(
-                metadata_digest_file,
-                fieldnames=['indicator_id', 'count', 'start_date', 'end_date'],
-            ),
+        metadata_digest_writer = csv.DictWriter(
+            metadata_digest_file,
+            fieldnames=['indicator_id', 'count', 'start_date', 'end_date'],
         )
+        if Flags.ARGS.num_workers > 1:
+            DruidWriter.run_parallel(
+                BaseRowType,
+                metadata_collector,
+                input_file,
+                file_pattern,
+                Flags.ARGS.shard_size,
+                Flags.ARGS.num_workers,
+                PigzWriter,
+                Flags.ARGS.use_experimental_parser,
+                error_handler,
+                metadata_digest_writer,
+                batch_size=Flags.ARGS.parallel_batch_size,
+            )
+            return 0
+
+        with ShardWriter(
+            file_pattern, Flags.ARGS.shard_size, PigzWriter
+        ) as output_writer:
+            DruidWriter.run(
+                BaseRowType,
+                metadata_collector,
+                input_file,
+                output_writer,
+                Flags.ARGS.use_experimental_parser,
+                error_handler,
+                metadata_digest_writer,
+            )
     return 0
 
 
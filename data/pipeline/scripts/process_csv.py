@@ -63,6 +63,11 @@ from data.pipeline.datatypes.dimension_collector_io import (
     write_hierarchical_dimensions,
     write_non_hierarchical_dimensions,
 )
+from data.pipeline.rollup_spiller import (
+    RollupSpiller,
+    finalize_rollup_data,
+    rollup_values,
+)
 
 from log import LOG
 from util.file.ambiguous_file import AmbiguousFile
@@ -193,6 +198,8 @@ class Aggregator:
     OBJECTS_WRITTEN_COUNT_LABEL = 'objects written'
     FIELDS_COUNT_LABEL = 'fields'
     LOCATIONS_COUNT_LABEL = 'locations'
+    ROLLUP_SPILLS_COUNT_LABEL = 'rollup spills'
+    ROLLUP_MERGE_PASSES_COUNT_LABEL = 'rollup merge passes'
 
     def __init__(
         self,
@@ -211,6 +218,8 @@ class Aggregator:
         val_clean_regex_str=None,
         delimiter=',',
         multi_value_dimensions=None,
+        rollup_row_budget=None,
+        rollup_spill_dir=None,
     ):
         self.dimensions = dimensions or []
         self.multi_value_dimensions = (
@@ -254,6 +263,19 @@ class Aggregator:
         self.row_handlers = []
         self._rows = {}
 
+        # When a rollup row budget is set, the rows being rolled up are spilled to
+        # disk once the budget is reached instead of being held in memory until all
+        # input has been read.
+        self.rollup_row_budget = rollup_row_budget
+        self._rollup_spiller = (
+            RollupSpiller(tracer_field, rollup_spill_dir)
+            if enable_rollup and rollup_row_budget
+            else None
+        )
+        # Mapping from row key to the [first_seq, row_count, first_row_value_count]
+        # metadata the spiller needs to merge spilled rows.
+        self._row_stats = {}
+
     def register_col_handler(self, colname, fn):
         self.col_handlers[colname] = fn
 
@@ -323,17 +345,57 @@ class Aggregator:
         LOG.info('Finished reading file. Lines read: %d', count)
         self.counts[self.ROWS_READ_COUNT_LABEL] = count
 
+    def _spill_rows(self):
+        """
+        Spill the rows currently being rolled up to disk and release them from memory.
+        """
+        entries = (
+            [row_key, *self._row_stats[row_key], baserow.to_dict()]
+            for row_key, baserow in self._rows.items()
+        )
+        self._rollup_spiller.spill(entries)
+        LOG.info('Spilled %d rollup rows to disk', len(self._rows))
+        self._rows = {}
+        self._row_stats = {}
+        gc.collect()
+
+    def _write_spilled_rows(self, f_out, unique_fields):
+        """
+        Merge the rows spilled to disk and write them to the output file in the same
+        order the in-memory rollup would have written them.
+        """
+        if self._rows:
+            self._spill_rows()
+
+        written_count = 0
+        for row_dict in self._rollup_spiller.iter_merged_rows(self.rollup_row_budget):
+            written_count += 1
+            row = BaseRowType.from_dict(row_dict)
+            self._write_row(row, written_count, f_out, unique_fields, True)
+        LOG.info('Finished writing output rows. Rows written: %d', written_count)
+        self.counts[self.OBJECTS_WRITTEN_COUNT_LABEL] = written_count
+        self.counts[self.ROLLUP_SPILLS_COUNT_LABEL] = self._rollup_spiller.spill_count
+        self.counts[
+            self.ROLLUP_MERGE_PASSES_COUNT_LABEL
+        ] = self._rollup_spiller.merge_pass_count
+
     def _write_remaining_rows(self, f_out, unique_fields):
         """
         Write all remaining rows to the output file. There should be rows here if rollup
          is enabled.
         """
+        if self._rollup_spiller and self._rollup_spiller.has_spilled:
+            self._write_spilled_rows(f_out, unique_fields)
+            return
+
         written_count = 0
         keys = list(self._rows.keys())
         for key in keys:
             # Remove the row from the rows collection since it is no longer used
             # after being written to an output file. This will free up memory.
             row = self._rows.pop(key)
+            if self._rollup_spiller:
+                finalize_rollup_data(row.data)
             written_count += 1
             self._write_row(row, written_count, f_out, unique_fields, True)
         LOG.info('Finished writing output rows. Rows written: %d', written_count)
@@ -634,15 +696,30 @@ class Aggregator:
         if row_key not in self._rows:
             baserow = self._create_base_row(row, date_str, values)
             self._rows[row_key] = baserow
+            if self._rollup_spiller:
+                self._row_stats[row_key] = [
+                    self.counts[self.ROWS_STORED_COUNT_LABEL],
+                    1,
+                    len(values),
+                ]
+                if len(self._rows) >= self.rollup_row_budget:
+                    self._spill_rows()
             return
 
+        if self._rollup_spiller:
+            self._row_stats[row_key][1] += 1
+
         # Rollup new values into the existing baserow.
         # NOTE: This assumes that all fields can be combined by
         # summing. If that is not the case, this will need to be refactored.
         baserow_data = self._rows[row_key].data
-
-        for key, value in values.items():
-            baserow_data[key] = value + baserow_data.get(key, 0)
+        if self._rollup_spiller:
+            # NOTE: Rows that might be spilled are summed exactly so that the
+            # output does not depend on how the rows were split across spills.
+            rollup_values(baserow_data, values)
+        else:
+            for key, value in values.items():
+                baserow_data[key] = value + baserow_data.get(key, 0)
 
         if self.tracer_field:
             baserow_data[self.tracer_field] = 1
@@ -845,6 +922,25 @@ def setup_flags():
         default=',',
         help='Delimiter to use when parsing the input file.',
     )
+    Flags.PARSER.add_argument(
+        '--rollup_row_budget',
+        type=int,
+        required=False,
+        default=None,
+        help='Maximum number of rolled up rows to hold in memory. When the budget is '
+        'reached, the rows are spilled to disk and merged once all input has been read. '
+        'Rolled up float values are summed exactly and rounded once, so they can '
+        'differ in the last digits from the default rollup. If not set, all rows are '
+        'rolled up in memory.',
+    )
+    Flags.PARSER.add_argument(
+        '--rollup_spill_dir',
+        type=str,
+        required=False,
+        default=None,
+        help='Directory to store spilled rollup rows in. Defaults to the system '
+        'temporary directory.',
+    )
     Flags.PARSER.add_argument(
         '--multi_value_dimensions',
         nargs='*',
@@ -911,6 +1007,8 @@ def main():
         val_clean_regex_str=Flags.ARGS.val_clean_regex,
         delimiter=delimiter,
         multi_value_dimensions=multi_value_dimensions,
+        rollup_row_budget=Flags.ARGS.rollup_row_budget,
+        rollup_spill_dir=Flags.ARGS.rollup_spill_dir,
     )
     if rename_cols:
         agg.set_col_rename(rename_cols)
@@ -119,6 +119,14 @@ def main():
         default='day',
         help='The resampling frequency (day, week)',
     )
+    Flags.PARSER.add_argument(
+        '--streaming',
+        action='store_true',
+        default=False,
+        help='Resample one dimension key at a time to bound memory usage. Input '
+        'rows must be grouped by the dimension values (for example, by sorting '
+        'the input externally by dimension values).',
+    )
 
     Flags.InitArgs()
     LOG.info('Starting resampling')
@@ -149,8 +157,6 @@ def main():
             last_date,
             Flags.ARGS.frequency,
         )
-        resampler.read_lines(input_file)
-        LOG.info('Finished reading input lines')
         alt_end_fn = lambda y, x: x
         location_resample_end_dates = Flags.ARGS.location_resample_end_dates
         if location_resample_end_dates:
@@ -161,10 +167,21 @@ def main():
                     row, base_end_date, alternate_end_dates
                 )
 
-        for output in resampler.build_output_rows(
-            newline=True,
-            alternate_end_date_function=alt_end_fn,
-        ):
+        if Flags.ARGS.streaming:
+            output_rows = resampler.stream_output_rows(
+                input_file,
+                newline=True,
+                alternate_end_date_function=alt_end_fn,
+            )
+        else:
+            resampler.read_lines(input_file)
+            LOG.info('Finished reading input lines')
+            output_rows = resampler.build_output_rows(
+                newline=True,
+                alternate_end_date_function=alt_end_fn,
+            )
+
+        for output in output_rows:
             output_writer.write(output)
 
     LOG.info('Finished resampling')
@@ -0,0 +1,119 @@
+import math
+import random
+
+import pytest
+
+from data.pipeline.datatypes.base_row import BaseRow
+from data.pipeline.rollup_spiller import (
+    RollupSpiller,
+    finalize_rollup_data,
+    rollup_values,
+)
+
+FIELDS = [f'field_{idx}' for idx in range(8)]
+
+
+def _build_input_rows(row_count=3000, key_count=40):
+    generator = random.Random(1)
+    rows = []
+    for _ in range(row_count):
+        values = {}
+        for field in generator.sample(FIELDS, generator.randint(1, 5)):
+            kind = generator.random()
+            if kind < 0.4:
+                values[field] = generator.randint(-10, 1000)
+            elif kind < 0.7:
+                values[field] = generator.choice([0.1, 0.2, 0.3, 0.7, 1.1, -0.3])
+            else:
+                values[field] = generator.random() * 10 ** generator.randint(-8, 16)
+        rows.append((f'key_{generator.randrange(key_count)}', values))
+    return rows
+
+
+def _build_base_row_dict(row_key, values):
+    return BaseRow({'key': row_key}, dict(values), '2021-01-01', 'test').to_dict()
+
+
+def _serialize(base_row_dicts):
+    return ''.join(BaseRow.from_dict(row).to_json(True) for row in base_row_dicts)
+
+
+def _rollup_in_memory(input_rows, tracer_field):
+    # Matches process_csv with a row budget that is never reached.
+    rows = {}
+    for (row_key, values) in input_rows:
+        if row_key not in rows:
+            rows[row_key] = _build_base_row_dict(row_key, values)
+            continue
+
+        data = rows[row_key]['data']
+        rollup_values(data, values)
+        if tracer_field:
+            data[tracer_field] = 1
+
+    for row in rows.values():
+        finalize_rollup_data(row['data'])
+    return _serialize(rows.values())
+
+
+def _rollup_with_spills(input_rows, tracer_field, row_budget, tmp_path):
+    spiller = RollupSpiller(tracer_field, str(tmp_path), max_merge_fan_in=3)
+    rows = {}
+    row_stats = {}
+    for (seq, (row_key, values)) in enumerate(input_rows):
+        if row_key not in rows:
+            rows[row_key] = _build_base_row_dict(row_key, values)
+            row_stats[row_key] = [seq, 1, len(values)]
+            if len(rows) >= row_budget:
+                spiller.spill(
+                    [key, *row_stats[key], row] for (key, row) in rows.items()
+                )
+                rows = {}
+                row_stats = {}
+            continue
+
+        row_stats[row_key][1] += 1
+        data = rows[row_key]['data']
+        rollup_values(data, values)
+        if tracer_field:
+            data[tracer_field] = 1
+
+    if rows:
+        spiller.spill([key, *row_stats[key], row] for (key, row) in rows.items())
+    output = _serialize(spiller.iter_merged_rows(row_budget))
+    return (output, spiller)
+
+
+@pytest.mark.parametrize('tracer_field', [None, 'tracer'])
+@pytest.mark.parametrize('row_budget', [5, 17])
+def test_spilled_rollup_matches_in_memory_rollup(tmp_path, tracer_field, row_budget):
+    input_rows = _build_input_rows()
+    expected = _rollup_in_memory(input_rows, tracer_field)
+    (actual, spiller) = _rollup_with_spills(
+        input_rows, tracer_field, row_budget, tmp_path
+    )
+
+    assert spiller.spill_count > 3
+    assert spiller.merge_pass_count > 2
+    assert actual == expected
+
+
+def test_rollup_values_sums_floats_exactly():
+    values = [0.1, 0.2, 0.3, 1e16, 1, -1e16, 0.7]
+    data = {}
+    for value in values:
+        rollup_values(data, {'field': value})
+    reversed_data = {}
+    for value in reversed(values):
+        rollup_values(reversed_data, {'field': value})
+
+    assert finalize_rollup_data(data) == {'field': math.fsum(values)}
+    assert finalize_rollup_data(reversed_data) == {'field': math.fsum(values)}
+
+
+def test_rollup_values_keeps_int_sums():
+    data = {'ints': 1, 'mixed': 2}
+    rollup_values(data, {'ints': 2, 'mixed': 0.5, 'new': 3})
+    assert finalize_rollup_data(data) == {'ints': 3, 'mixed': 2.5, 'new': 3}
+    assert type(data['ints']) is int
+    assert type(data['new']) is int
@@ -14,3 +14,9 @@ class BadIndexingPathException(BaseDruidException):
 
 class DruidQueryError(BaseDruidException):
     pass
+
+
+# Exception to raise when a query is cancelled before it completes (for example,
+# because its deadline passed).
+class DruidQueryCancelledError(DruidQueryError):
+    pass
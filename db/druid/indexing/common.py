@@ -16,20 +16,26 @@ from util.connections.connection_manager import get_connection_values
 
 INDEX_URL = f'{DruidConfig.router_endpoint()}/druid/indexer/v1/task'
 
+SEGMENT_GRANULARITY = 'MONTH'
+
 
 def build_data_schema(
     datasource_name: str,
     start_date: datetime,
     end_date: datetime,
+    intervals: Optional[List[str]] = None,
 ) -> dict:
+    '''Build the data schema for an indexing task. If `intervals` are provided, only
+    data within those intervals will be indexed instead of the full date range.
+    '''
     dimensions = build_dimension_spec_dimensions(DIMENSIONS, UNFILTERABLE_DIMENSIONS)
     return {
         'dataSource': datasource_name,
         'dimensionsSpec': {'dimensions': dimensions},
         'granularitySpec': {
-            'intervals': [build_time_interval(start_date, end_date)],
+            'intervals': intervals or [build_time_interval(start_date, end_date)],
             'queryGranularity': {'type': 'none'},
-            'segmentGranularity': 'MONTH',
+            'segmentGranularity': SEGMENT_GRANULARITY,
             'type': 'uniform',
         },
         'metricsSpec': [
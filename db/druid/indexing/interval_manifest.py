@@ -0,0 +1,214 @@
+'''Track which segment intervals each indexed file contributes data to so that
+only the intervals containing changed data need to be reindexed.
+
+The manifest is stored as JSON in the task hash directory and has the format:
+    {
+        'files': {
+            '/path/to/processed_rows.json.gz': {
+                'hash': '<file hash>',
+                'intervals': ['2021-01-01/2021-02-01', ...],
+            },
+            ...
+        }
+    }
+'''
+import json
+import os
+import pathlib
+import re
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config.datatypes import BaseRowType
+from db.druid.indexing.common import SEGMENT_GRANULARITY
+from db.druid.util import DRUID_DATE_FORMAT, build_time_interval
+from log import LOG
+from util.file.ambiguous_file import AmbiguousFile
+from util.file.directory_util import compute_file_hash
+
+# NOTE: Segment intervals are computed by month since that is the segment
+# granularity used when building the indexing task data schema.
+assert SEGMENT_GRANULARITY == 'MONTH', 'Only MONTH segment granularity is supported'
+
+# Extract the year and month of the row date without decoding the whole row.
+ROW_MONTH_PATTERN = re.compile(
+    r'"%s"\s*:\s*"(\d{4})-(\d{2})' % re.escape(BaseRowType.DATE_FIELD)
+)
+
+
+def _get_month_start(year: int, month: int) -> date:
+    # NOTE: Normalize month overflow so callers can pass `month + 1`.
+    return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def get_segment_interval(year: int, month: int) -> str:
+    '''Build the segment interval containing the given month.'''
+    return build_time_interval(
+        _get_month_start(year, month), _get_month_start(year, month + 1)
+    )
+
+
+def _parse_row_month(line: str) -> Optional[Tuple[int, int]]:
+    match = ROW_MONTH_PATTERN.search(line)
+    if match:
+        return (int(match.group(1)), int(match.group(2)))
+
+    # Fall back to fully decoding the row for dates that are not stored as
+    # ISO strings, like millisecond timestamps.
+    row_date = json.loads(line).get(BaseRowType.DATE_FIELD)
+    if row_date is None:
+        return None
+    if isinstance(row_date, (int, float)):
+        row_datetime = datetime.utcfromtimestamp(row_date / 1000.0)
+    else:
+        row_datetime = datetime.strptime(row_date[:10], DRUID_DATE_FORMAT)
+    return (row_datetime.year, row_datetime.month)
+
+
+def compute_file_intervals(filename: str) -> List[str]:
+    '''Find the segment intervals that the rows in the file contribute to.'''
+    months = set()
+    with AmbiguousFile(filename) as input_file:
+        for line in input_file:
+            if not line.strip():
+                continue
+            month = _parse_row_month(line)
+            if month:
+                months.add(month)
+    return sorted(get_segment_interval(year, month) for (year, month) in months)
+
+
+def build_interval_manifest(
+    files: List[str],
+    previous_manifest: Optional[dict] = None,
+    file_hashes: Optional[Dict[str, str]] = None,
+) -> dict:
+    '''Build the manifest for the files being indexed. Files whose hash matches the
+    previous manifest reuse the intervals stored there instead of being reread.
+    Precomputed `file_hashes` can optionally be provided.
+    '''
+    previous_files = (previous_manifest or {}).get('files', {})
+    manifest_files = {}
+    for filename in files:
+        file_hash = (
+            file_hashes[filename] if file_hashes else compute_file_hash(filename)
+        )
+        previous_entry = previous_files.get(filename)
+        if previous_entry and previous_entry['hash'] == file_hash:
+            intervals = previous_entry['intervals']
+        else:
+            intervals = compute_file_intervals(filename)
+        manifest_files[filename] = {'hash': file_hash, 'intervals': intervals}
+    return {'files': manifest_files}
+
+
+def get_changed_intervals(previous_manifest: dict, current_manifest: dict) -> List[str]:
+    '''Find the segment intervals that need to be rebuilt. An interval is changed
+    if a file contributing to it was added, removed, or had its contents change.
+    '''
+    previous_files = previous_manifest['files']
+    current_files = current_manifest['files']
+    changed_intervals: Set[str] = set()
+    for filename in set(previous_files) | set(current_files):
+        previous_entry = previous_files.get(filename)
+        current_entry = current_files.get(filename)
+        if (
+            previous_entry
+            and current_entry
+            and previous_entry['hash'] == current_entry['hash']
+        ):
+            continue
+
+        # NOTE: The intervals the file previously contributed to must be rebuilt
+        # too since the data the file held for them could have been removed.
+        for entry in (previous_entry, current_entry):
+            if entry:
+                changed_intervals.update(entry['intervals'])
+    return sorted(changed_intervals)
+
+
+def get_files_for_intervals(manifest: dict, intervals: Iterable[str]) -> List[str]:
+    '''Find the files that contribute data to any of the intervals. All of these
+    files must be reindexed since the rebuilt intervals are fully overwritten.
+    '''
+    intervals = set(intervals)
+    return sorted(
+        filename
+        for filename, entry in manifest['files'].items()
+        if intervals.intersection(entry['intervals'])
+    )
+
+
+def merge_intervals(
+    intervals: Iterable[str],
+    min_date: Optional[datetime] = None,
+    max_date: Optional[datetime] = None,
+) -> List[str]:
+    '''Merge adjacent intervals into a single interval and clip the result to the
+    optional min and max dates.
+    '''
+    merged_intervals: List[List[date]] = []
+    for interval in sorted(intervals):
+        (start, end) = [
+            datetime.strptime(value, DRUID_DATE_FORMAT).date()
+            for value in interval.split('/')
+        ]
+        if merged_intervals and merged_intervals[-1][1] >= start:
+            merged_intervals[-1][1] = max(merged_intervals[-1][1], end)
+        else:
+            merged_intervals.append([start, end])
+
+    output = []
+    for (start, end) in merged_intervals:
+        if min_date:
+            start = max(start, min_date.date())
+        if max_date:
+            end = min(end, max_date.date())
+        if start < end:
+            output.append(build_time_interval(start, end))
+    return output
+
+
+def get_manifest_storage_path(datasource_name: str, task_hash_dir: str) -> str:
+    # NOTE: Incremental indexing updates an existing datasource in place, so the
+    # manifest is stored per datasource instead of per datasource version.
+    return os.path.join(task_hash_dir, f'{datasource_name}.manifest.json')
+
+
+def load_interval_manifest(datasource_name: str, task_hash_dir: str) -> Optional[dict]:
+    manifest_path = get_manifest_storage_path(datasource_name, task_hash_dir)
+    if not os.path.isfile(manifest_path):
+        LOG.info('No interval manifest exists for datasource: %s', datasource_name)
+        return None
+
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def store_interval_manifest(
+    manifest: dict, datasource_name: str, task_hash_dir: str
+) -> None:
+    manifest_path = get_manifest_storage_path(datasource_name, task_hash_dir)
+    pathlib.Path(os.path.dirname(manifest_path)).mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+
+def build_rebuild_report(
+    previous_manifest: dict, current_manifest: dict, changed_intervals: List[str]
+) -> Dict[str, List[str]]:
+    '''Summarize the changed files, the segment intervals that will be rebuilt and
+    the files that will be reindexed to rebuild them.'''
+    previous_files = previous_manifest['files']
+    current_files = current_manifest['files']
+    return {
+        'addedFiles': sorted(set(current_files) - set(previous_files)),
+        'removedFiles': sorted(set(previous_files) - set(current_files)),
+        'modifiedFiles': sorted(
+            filename
+            for filename in set(previous_files) & set(current_files)
+            if previous_files[filename]['hash'] != current_files[filename]['hash']
+        ),
+        'intervals': changed_intervals,
+        'filesToIndex': get_files_for_intervals(current_manifest, changed_intervals),
+    }
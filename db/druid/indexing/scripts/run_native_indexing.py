@@ -3,6 +3,14 @@
 # It takes in a number of concurrent subtasks and a list of files to index.
 # Druid will create a supervisor task called index_parallel and creates
 # worker tasks to process groups of files. It does not use Hadoop.
+#
+# In incremental mode, a manifest of the MONTH segment intervals each data file
+# contributes to is stored for the datasource. On the next run, only the
+# intervals that changed files contribute to are overwritten in the existing
+# datasource. Use --dry_run to list the intervals that would be rebuilt and
+# --index_url to submit the task to a different indexer endpoint (like
+# `stub_indexer.py`).
+import json
 import sys
 
 from datetime import datetime, timedelta
@@ -19,12 +27,23 @@ from db.druid.indexing.common import (
     build_tuning_config,
     build_datasource_version,
 )
+from db.druid.indexing.interval_manifest import (
+    build_interval_manifest,
+    build_rebuild_report,
+    get_changed_intervals,
+    get_files_for_intervals,
+    load_interval_manifest,
+    merge_intervals,
+    store_interval_manifest,
+)
 from db.druid.indexing.minio_task_builder import (
     store_task_hash as store_minio_task_hash,
     build_files_to_index as build_minio_files_to_index,
 )
 from db.druid.indexing.task_runner_util import (
+    DEFAULT_HASH_PROCESSES,
     build_datasource_name,
+    compute_file_hashes,
     get_current_datasource_for_site,
     run_task,
     task_contains_new_data,
@@ -146,14 +165,45 @@ def main():
         default='/home/share',
         help='Path to the shared druid folder on the druid server',
     )
+    Flags.PARSER.add_argument(
+        '--incremental',
+        action='store_true',
+        default=False,
+        help='Only reindex the segment intervals of the existing datasource that '
+        'the changed data files contribute to. The datasource specified by '
+        '--datasource_name (or the current datasource for the deployment) is '
+        'updated in place. If no interval manifest exists for it yet, a full '
+        'datasource is built instead.',
+    )
+    Flags.PARSER.add_argument(
+        '--rebuild_report_file',
+        type=str,
+        default='',
+        help='File to store the JSON report of the intervals being rebuilt in '
+        'during incremental indexing',
+    )
+    Flags.PARSER.add_argument(
+        '--hash_processes',
+        type=int,
+        default=DEFAULT_HASH_PROCESSES,
+        help='Number of processes to use when hashing data files that have changed',
+    )
+    Flags.PARSER.add_argument(
+        '--index_url',
+        type=str,
+        default=INDEX_URL,
+        help='Druid indexer task endpoint to submit the indexing task to',
+    )
     Flags.InitArgs()
 
-    datasource_name = build_datasource_name(DEPLOYMENT_NAME, Flags.ARGS.datasource_name)
     start_date = datetime.strptime(Flags.ARGS.min_data_date, DRUID_DATE_FORMAT)
     end_date = datetime.strptime(Flags.ARGS.max_data_date, DRUID_DATE_FORMAT)
 
     task_hash_dir = Flags.ARGS.task_hash_dir
     using_minio = Flags.ARGS.file_system == 'minio'
+    if Flags.ARGS.incremental and using_minio:
+        raise ValueError('Incremental indexing only supports the local file system')
+
     if using_minio:
         files_to_index = build_minio_files_to_index(
             Flags.ARGS.data_files, DEPLOYMENT_NAME
@@ -161,22 +211,90 @@ def main():
     else:
         files_to_index = build_files_to_index(Flags.ARGS.data_files)
 
-    (cur_datasource, cur_version) = get_current_datasource_for_site(DEPLOYMENT_NAME)
-    if not Flags.ARGS.force and not task_contains_new_data(
-        cur_datasource,
-        cur_version,
-        files_to_index,
-        task_hash_dir,
-        storage=Flags.ARGS.file_system,
-    ):
-        cur_version = build_datasource_version(cur_version)
+    # NOTE: The file hashes are computed once and reused for both the new data
+    # check and the task hash stored after indexing.
+    file_hashes = None
+    if not using_minio:
+        file_hashes = compute_file_hashes(
+            files_to_index, task_hash_dir, Flags.ARGS.hash_processes
+        )
+
+    datasource_name = build_datasource_name(DEPLOYMENT_NAME, Flags.ARGS.datasource_name)
+    all_files = files_to_index
+    intervals = None
+    interval_manifest = previous_manifest = None
+    if Flags.ARGS.incremental:
+        target_datasource = (
+            Flags.ARGS.datasource_name
+            or get_current_datasource_for_site(DEPLOYMENT_NAME)[0]
+        )
+        # NOTE: Forcing the task skips the manifest comparison so that a full
+        # datasource is built.
+        if target_datasource and not Flags.ARGS.force:
+            previous_manifest = load_interval_manifest(target_datasource, task_hash_dir)
+        interval_manifest = build_interval_manifest(
+            files_to_index, previous_manifest, file_hashes
+        )
+
+    if previous_manifest:
+        changed_intervals = get_changed_intervals(previous_manifest, interval_manifest)
+        if not changed_intervals:
+            LOG.info(
+                '##### Skipping indexing since no intervals of the existing '
+                'datasource contain changed data. #####'
+            )
+            LOG.info('##### Current datasource: %s #####', target_datasource)
+            return 0
+
+        rebuild_report = build_rebuild_report(
+            previous_manifest, interval_manifest, changed_intervals
+        )
         LOG.info(
-            '##### Skipping indexing since existing datasource '
-            'contains the same data specified in this task. #####'
+            '##### Rebuilding %s intervals of datasource %s from %s files #####',
+            len(changed_intervals),
+            target_datasource,
+            len(rebuild_report['filesToIndex']),
         )
-        LOG.info('##### Current datasource: %s #####', cur_datasource)
-        LOG.info('##### Current version: %s #####', cur_version)
-        return 0
+        for interval in changed_intervals:
+            LOG.info('Interval to rebuild: %s', interval)
+        if Flags.ARGS.rebuild_report_file:
+            with open(Flags.ARGS.rebuild_report_file, 'w') as report_file:
+                json.dump(rebuild_report, report_file, indent=2)
+
+        intervals = merge_intervals(changed_intervals, start_date, end_date)
+        if not intervals:
+            LOG.info(
+                '##### Skipping indexing since the changed intervals are outside '
+                'of the data date range. #####'
+            )
+            return 0
+
+        datasource_name = target_datasource
+        files_to_index = get_files_for_intervals(interval_manifest, changed_intervals)
+    else:
+        (cur_datasource, cur_version) = get_current_datasource_for_site(DEPLOYMENT_NAME)
+        if not Flags.ARGS.force and not task_contains_new_data(
+            cur_datasource,
+            cur_version,
+            files_to_index,
+            task_hash_dir,
+            storage=Flags.ARGS.file_system,
+            file_hashes=file_hashes,
+        ):
+            cur_version = build_datasource_version(cur_version)
+            LOG.info(
+                '##### Skipping indexing since existing datasource '
+                'contains the same data specified in this task. #####'
+            )
+            LOG.info('##### Current datasource: %s #####', cur_datasource)
+            LOG.info('##### Current version: %s #####', cur_version)
+            # The current datasource already holds this data, so record the
+            # manifest for it to allow the next run to be incremental.
+            if interval_manifest and not Flags.ARGS.dry_run:
+                store_interval_manifest(
+                    interval_manifest, cur_datasource, task_hash_dir
+                )
+            return 0
 
     if Flags.ARGS.concurrent_subtasks <= 0:
         raise ValueError('Native Indexing must have at least one concurrent subtask')
@@ -187,16 +305,26 @@ def main():
     max_num_files = get_max_number_of_files(
         files_to_index, Flags.ARGS.concurrent_subtasks
     )
+    io_config = build_io_config(
+        files_to_index,
+        Flags.ARGS.use_nested_json_format,
+        max_num_files,
+        Flags.ARGS.local_server_shared_folder,
+        Flags.ARGS.druid_server_shared_folder,
+    )
+    if intervals:
+        # Overwrite the segments of the rebuilt intervals in the existing
+        # datasource. Segments fully contained in an interval that no longer has
+        # any data are dropped.
+        io_config['appendToExisting'] = False
+        io_config['dropExisting'] = True
+
     indexing_task = {
         'spec': {
-            'dataSchema': build_data_schema(datasource_name, start_date, end_date),
-            'ioConfig': build_io_config(
-                files_to_index,
-                Flags.ARGS.use_nested_json_format,
-                max_num_files,
-                Flags.ARGS.local_server_shared_folder,
-                Flags.ARGS.druid_server_shared_folder,
+            'dataSchema': build_data_schema(
+                datasource_name, start_date, end_date, intervals
             ),
+            'ioConfig': io_config,
             'tuningConfig': build_tuning_config(
                 Flags.ARGS.concurrent_subtasks,
                 Flags.ARGS.partitioning_type != 'dynamic',
@@ -209,7 +337,7 @@ def main():
     dry_run = Flags.ARGS.dry_run
     task_id = run_task(
         indexing_task,
-        INDEX_URL,
+        Flags.ARGS.index_url,
         dry_run=dry_run,
         druid_config=DruidConfig,
     )
@@ -224,10 +352,19 @@ def main():
                 files_to_index, datasource_name, datasource_version, task_hash_dir
             )
         else:
+            # NOTE: The hash covers every data file, including the ones that did
+            # not need to be reindexed during an incremental update.
             store_task_hash(
-                files_to_index, datasource_name, datasource_version, task_hash_dir
+                all_files,
+                datasource_name,
+                datasource_version,
+                task_hash_dir,
+                file_hashes,
             )
 
+        if interval_manifest:
+            store_interval_manifest(interval_manifest, datasource_name, task_hash_dir)
+
     # NOTE: If we need more task information we should add it a
     # single flag and file rather than having the multiple flags we have here.
     write_task_metadata(
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Run a local stub of the Druid indexer task endpoint. Each task submitted is
+# written to the output directory and a task ID in the same format that Druid
+# uses is returned. This allows the indexing scripts to be tested without a
+# Druid cluster.
+#
+# Usage:
+#   ./db/druid/indexing/scripts/stub_indexer.py --port 8090 --output_dir /tmp/tasks
+#   ./db/druid/indexing/scripts/run_native_indexing.py \
+#       --index_url http://localhost:8090/druid/indexer/v1/task ...
+import json
+import os
+import sys
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from pylib.base.flags import Flags
+
+from log import LOG
+
+TASK_PATH = '/druid/indexer/v1/task'
+
+
+def build_task_id(task_definition: dict) -> str:
+    datasource = (
+        task_definition.get('spec', {}).get('dataSchema', {}).get('dataSource', '')
+    )
+    timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return f'{task_definition["type"]}_{datasource}_{timestamp}'
+
+
+def build_request_handler(output_dir: str):
+    class StubIndexerRequestHandler(BaseHTTPRequestHandler):
+        def do_POST(self):  # pylint: disable=invalid-name
+            if self.path.rstrip('/') != TASK_PATH:
+                self.send_error(404)
+                return
+
+            content_length = int(self.headers.get('Content-Length', 0))
+            task_definition = json.loads(self.rfile.read(content_length))
+            task_id = build_task_id(task_definition)
+            with open(os.path.join(output_dir, f'{task_id}.json'), 'w') as task_file:
+                json.dump(task_definition, task_file, indent=2)
+            LOG.info('Received task: %s', task_id)
+
+            response = json.dumps({'task': task_id}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+    return StubIndexerRequestHandler
+
+
+def main():
+    Flags.PARSER.add_argument(
+        '--port', type=int, default=8090, help='Port to listen for tasks on'
+    )
+    Flags.PARSER.add_argument(
+        '--output_dir',
+        type=str,
+        required=True,
+        help='Directory to write the submitted task definitions to',
+    )
+    Flags.InitArgs()
+
+    os.makedirs(Flags.ARGS.output_dir, exist_ok=True)
+    server = HTTPServer(
+        ('localhost', Flags.ARGS.port), build_request_handler(Flags.ARGS.output_dir)
+    )
+    LOG.info(
+        'Stub indexer listening on: http://localhost:%s%s',
+        server.server_port,
+        TASK_PATH,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
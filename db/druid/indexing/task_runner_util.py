@@ -1,10 +1,11 @@
 import datetime
 import json
+import multiprocessing
 import os
 import pathlib
 
 from glob import glob
-from typing import List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import requests
 
@@ -18,6 +19,11 @@ from log import LOG
 from util.druid import get_druid_request_params
 from util.file.directory_util import compute_file_hash
 
+FILE_HASH_MANIFEST_FILENAME = 'file_hash_manifest.json'
+
+# Default number of processes used to hash files that have changed.
+DEFAULT_HASH_PROCESSES = min(8, os.cpu_count() or 1)
+
 
 def build_dimension_spec_dimensions(
     dimensions: List[str],
@@ -70,15 +76,93 @@ def get_hash_storage_path(
     return os.path.join(task_hash_dir, filename)
 
 
+def _get_file_signature(filename: str) -> List[int]:
+    # NOTE: A file is assumed to be untouched if its size, modification time
+    # and inode have not changed.
+    file_stat = os.stat(filename)
+    return [file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino]
+
+
+def _load_file_hash_manifest(manifest_path: str) -> dict:
+    if not os.path.isfile(manifest_path):
+        return {}
+
+    try:
+        with open(manifest_path) as manifest_file:
+            return json.load(manifest_file)
+    except ValueError:
+        LOG.warning('Ignoring invalid file hash manifest: %s', manifest_path)
+        return {}
+
+
+def compute_file_hashes(
+    files: List[str],
+    task_hash_dir: str,
+    num_processes: int = DEFAULT_HASH_PROCESSES,
+) -> Dict[str, str]:
+    '''Compute the hash of each file. Hashes are cached in a manifest stored in
+    the task hash directory and reused for files whose size, modification time and
+    inode are unchanged. The remaining files are hashed in parallel.
+    '''
+    manifest_path = os.path.join(task_hash_dir, FILE_HASH_MANIFEST_FILENAME)
+    manifest = _load_file_hash_manifest(manifest_path)
+
+    output = {}
+    signatures = {}
+    files_to_hash = []
+    for filename in set(files):
+        signature = _get_file_signature(filename)
+        entry = manifest.get(filename)
+        if entry and entry['signature'] == signature:
+            output[filename] = entry['hash']
+        else:
+            signatures[filename] = signature
+            files_to_hash.append(filename)
+
+    LOG.info(
+        'Reusing %s cached file hashes. Hashing %s files',
+        len(output),
+        len(files_to_hash),
+    )
+    if not files_to_hash:
+        return output
+
+    num_processes = min(num_processes, len(files_to_hash))
+    if num_processes > 1:
+        with multiprocessing.get_context('fork').Pool(num_processes) as pool:
+            file_hashes = pool.map(compute_file_hash, files_to_hash, chunksize=1)
+    else:
+        file_hashes = [compute_file_hash(filename) for filename in files_to_hash]
+
+    for filename, file_hash in zip(files_to_hash, file_hashes):
+        output[filename] = file_hash
+        manifest[filename] = {'hash': file_hash, 'signature': signatures[filename]}
+
+    # NOTE: The manifest is only stored if the task hash directory has been set
+    # up. Entries for files that no longer exist are dropped.
+    if os.path.isdir(task_hash_dir):
+        manifest = {
+            filename: entry
+            for filename, entry in manifest.items()
+            if filename in output or os.path.isfile(filename)
+        }
+        temp_manifest_path = f'{manifest_path}.tmp'
+        with open(temp_manifest_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, sort_keys=True)
+        os.replace(temp_manifest_path, manifest_path)
+    return output
+
+
 def task_contains_new_data(
     cur_datasource: Optional[str],
     cur_version: Optional[str],
     files: List[Union[str, MinioObject]],
     task_hash_dir: str,
     storage: str = 'local',
+    file_hashes: Optional[Dict[str, str]] = None,
 ) -> bool:
     '''Check to see if the current datasource contains the same data that we are trying
-    to index.
+    to index. Precomputed `file_hashes` for local files can optionally be provided.
     '''
     # If no datasource exists yet for this deployment, we definitely have new data.
     if not cur_datasource or not cur_version:
@@ -103,7 +187,9 @@ def task_contains_new_data(
     if storage == 'minio':
         new_file_hash = sorted([f.ETag for f in files])  # type: ignore[union-attr]
     else:
-        new_file_hash = sorted(compute_file_hash(f) for f in files)
+        if file_hashes is None:
+            file_hashes = compute_file_hashes(files, task_hash_dir)  # type: ignore[arg-type]
+        new_file_hash = sorted(file_hashes[f] for f in files)  # type: ignore[index]
     return cur_file_hash != new_file_hash
 
 
@@ -112,14 +198,19 @@ def store_task_hash(
     datasource_name: str,
     datasource_version: str,
     task_hash_dir: str,
+    file_hashes: Optional[Dict[str, str]] = None,
 ):
-    '''Store a task hash that represents the files that are indexed in a datasource.'''
+    '''Store a task hash that represents the files that are indexed in a datasource.
+    Precomputed `file_hashes` can optionally be provided.
+    '''
     hash_filename = get_hash_storage_path(
         datasource_name, datasource_version, task_hash_dir
     )
     pathlib.Path(os.path.dirname(hash_filename)).mkdir(parents=True, exist_ok=True)
+    if file_hashes is None:
+        file_hashes = compute_file_hashes(files, task_hash_dir)
     with open(hash_filename, 'w') as hash_file:
-        hash_file.write('\n'.join(sorted(compute_file_hash(f) for f in files)))
+        hash_file.write('\n'.join(sorted(file_hashes[f] for f in files)))
 
 
 def run_task(
@@ -11,7 +11,9 @@ from pydruid.utils.filters import Dimension, Filter
 from db.druid.aggregations.query_dependent_aggregation import QueryDependentAggregation
 from db.druid.aggregations.query_modifying_aggregation import QueryModifyingAggregation
 from db.druid.calculations.base_calculation import BaseCalculation
+from db.druid.query_builder_util.array_result import ColumnarResultBuilder
 from db.druid.query_builder_util.optimization import apply_optimizations
+from db.druid.query_builder_util.optimization.field_pivot import build_field_pivot
 from db.druid.util import (
     build_query_filter_from_aggregations,
     EmptyFilter,
@@ -131,6 +133,7 @@ class GroupByQueryBuilder(BaseDruidQuery):
         subtotal_dimensions=None,
         subtotal_result_label='TOTAL',
         filter_non_aggregated_rows=True,
+        field_pivot_min_fields=0,
     ):
         super().__init__(datasource, granularity, intervals)
         self.dimensions = grouping_fields
@@ -222,6 +225,13 @@ class GroupByQueryBuilder(BaseDruidQuery):
 
         self.having = None
         self.optimize = optimize
+        self.filter_non_aggregated_rows = filter_non_aggregated_rows
+
+        # Queries computing a sum over at least this many fields are rewritten to
+        # group on the field dimension instead of using one filtered aggregation per
+        # field. Zero disables the rewrite.
+        self.field_pivot_min_fields = field_pivot_min_fields
+        self.field_pivot = None
 
     @property
     def dimensions(self):
@@ -265,11 +275,12 @@ class GroupByQueryBuilder(BaseDruidQuery):
         # optimizations will improve performance and produce the same results
         elif self.optimize:
             apply_optimizations(self)
+            self.field_pivot = build_field_pivot(self, self.field_pivot_min_fields)
 
             # If we don't have any dimensions to group by, we can use a
             # timeseries query. Timeseries queries do not support `having` clauses,
-            # though.
-            if not self.dimensions and not self.having:
+            # though. Pivoted queries always group on the field dimension.
+            if not self.dimensions and not self.having and not self.field_pivot:
                 # Note: not calling query_builder.timeseries because
                 # we don't need to perform their validation step which
                 # only allows specific fields in the query (I just don't
@@ -294,6 +305,8 @@ class GroupByQueryBuilder(BaseDruidQuery):
 
         # Wrap the pydruid query with our own class so we can add enhancements.
         query = PydruidQueryWrapper(self._druid_query_builder.groupby(self))
+        if self.field_pivot:
+            self.field_pivot.rewrite_query(query.query_dict)
 
         # NOTE: SubtotalsSpec is not supported directly by pydruid.
         # Attach the values here.
@@ -307,20 +320,100 @@ class GroupByQueryBuilder(BaseDruidQuery):
     # and handle quirks in the druid JSON encoding.
     def parse(self, result):
         if not result:
-            return result
+            return []
+
+        # NOTE: Handle differences between groupby and timeseries
+        # response format.
+        result = iter(result)
+        try:
+            first_line = next(result)
+        except StopIteration:
+            return []
+
+        rows = chain((first_line,), result)
+
+        # NOTE: GIANT HACK. Druid 0.16.0 has CHANGED the groupby response
+        # format. Previously, dimension values that were null would be included in the
+        # response. Now, they are omitted:
+        # https://github.com/apache/incubator-druid/issues/8631
+        # To work around this and provide a consistent interface, we have switched the
+        # response format to array based rows. These rows will receive the full list
+        # of values and nothing will be omitted. Array based results are parsed
+        # lazily so that callers exporting to pandas can skip building a dict for
+        # each row.
+        if isinstance(first_line, list):
+            # NOTE: Pivoted query rows are converted back into the rows the original
+            # query would have produced so that they can be parsed the same way.
+            if self.field_pivot:
+                rows = self.field_pivot.unpivot_rows(rows)
+            return ArrayQueryResult(self, rows)
+        return self.parse_rows(rows)
+
+    def _build_dimension_names(self):
+        return [
+            dimension._output_name
+            if isinstance(dimension, DimensionSpec)
+            else dimension
+            for dimension in self.dimensions
+        ]
 
+    def _build_array_header(self):
+        header = []
+        if self.granularity != 'all':
+            header.append('timestamp')
+
+        header.extend(self._build_dimension_names())
+        header.extend(list(self.aggregations.keys()))
+        header.extend(list(self.post_aggregations.keys()))
+        return header
+
+    def _build_first_timestamp_ms(self):
+        # When the granularity is "all", there will be no timestamp returned in the
+        # Druid rows. For backwards compatibility reasons, we need to still populate
+        # a timestamp. Use the first date of the query intervals as the
+        # representative timestamp.
+        first_date = unpack_time_interval(self.intervals[0])[0]
+        return (
+            datetime(
+                first_date.year,
+                first_date.month,
+                first_date.day,
+                tzinfo=timezone.utc,
+            ).timestamp()
+            * 1000
+        )
+
+    def _build_strict_field_map(self):
         # Mapping from field name to the count field that should be used to
         # detect if the field value should be null.
-        strict_field_map = {
+        return {
             field: self.calculation.count_field_name(field)
             for field in self.calculation.strict_null_fields
         }
 
+    def parse_dataframe(self, rows):
+        '''Build a pandas DataFrame directly from array based result rows. The
+        values are collected into per-column buffers instead of per-row dicts, and the
+        null and NaN/Infinity handling performed by `parse_rows` is applied to whole
+        columns at once.
+        '''
+        return ColumnarResultBuilder(
+            header=self._build_array_header(),
+            dimensions=self._build_dimension_names(),
+            strict_field_map=self._build_strict_field_map(),
+            format_timestamp=_timestamp_to_date_str,
+            default_timestamp_ms=self._build_first_timestamp_ms(),
+            subtotals=self.subtotals,
+        ).build_dataframe(rows)
+
+    def parse_rows(self, result):
+        '''Convert the raw druid result rows into the non-array based druid result
+        format that pydruid expects.'''
+        strict_field_map = self._build_strict_field_map()
+
         numeric_fields = set(self.aggregations.keys())
         numeric_fields.update(iter(self.post_aggregations.keys()))
 
-        # NOTE: Handle differences between groupby and timeseries
-        # response format.
         result = iter(result)
         try:
             first_line = next(result)
@@ -328,55 +421,20 @@ class GroupByQueryBuilder(BaseDruidQuery):
             return
         key = 'event' if 'event' in first_line else 'result'
 
-        # NOTE: GIANT HACK. Druid 0.16.0 has CHANGED the groupby response
-        # format. Previously, dimension values that were null would be included in the
-        # response. Now, they are omitted:
-        # https://github.com/apache/incubator-druid/issues/8631
-        # To work around this and provide a consistent interface, we have switched the
-        # response format to array based rows. These rows will receive the full list
-        # of values and nothing will be omitted.
-        # TODO: Eventually use this array result to improve performance of
-        # exporting to pandas.
         array_based_result = isinstance(first_line, list)
         header = []
         first_timestamp_ms = None
         if array_based_result:
             key = 'event'
-
-            # When the granularity is "all", there will be no timestamp returned in the
-            # Druid rows. For backwards compatibility reasons, we need to still populate
-            # a timestamp. Use the first date of the query intervals as the
-            # representative timestamp.
-            first_date = unpack_time_interval(self.intervals[0])[0]
-            first_timestamp_ms = (
-                datetime(
-                    first_date.year,
-                    first_date.month,
-                    first_date.day,
-                    tzinfo=timezone.utc,
-                ).timestamp()
-                * 1000
-            )
-            if self.granularity != 'all':
-                header.append('timestamp')
-
-            for dimension in self.dimensions:
-                if isinstance(dimension, DimensionSpec):
-                    header.append(dimension._output_name)
-                else:
-                    header.append(dimension)
-
-            header.extend(list(self.aggregations.keys()))
-            header.extend(list(self.post_aggregations.keys()))
+            first_timestamp_ms = self._build_first_timestamp_ms()
+            header = self._build_array_header()
 
         # Create a copy of the result data with our modifications applied.
         previous_output = None
         for row in chain((first_line,), result):
             if array_based_result:
-                # TODO: It would be a lot faster to just leave results in an
-                # array format. Refactor call sites to either explicitly ask for a dict
-                # representation, migrate to just using pandas, or call a different
-                # method. Also handle timeseries differences.
+                # NOTE: Callers that only need a DataFrame should use
+                # `parse_dataframe` which skips building this dict entirely.
                 event = dict(zip(header, row))
                 # The timestamp returned in the array based result is in milliseconds
                 # since epoch.
@@ -567,7 +625,6 @@ class SubtotalConfig:
             return None
 
         event = row['event']
-        prev_event = prev_row['event']
 
         # Quick test to see if we are at the start of the subtotal section. The subtotal
         # section will start with the final dimension value being None.
@@ -580,23 +637,42 @@ class SubtotalConfig:
         ):
             return None
 
+        prev_event = prev_row['event']
+        return self.get_subtotal_dimension_from_values(
+            [event.get(dimension) for dimension in self.dimensions],
+            row['timestamp'],
+            [prev_event.get(dimension) for dimension in self.dimensions],
+            prev_row['timestamp'],
+        )
+
+    def get_subtotal_dimension_from_values(
+        self, values, timestamp, prev_values, prev_timestamp
+    ):
+        '''Determine which subtotal dimension a row represents using the row's
+        dimension values (ordered the same as `self.dimensions`) and timestamp instead
+        of the row's event dict. This lets array based rows be checked without
+        building a dict. See `get_subtotal_dimension` for how subtotal rows are
+        detected.
+        '''
+        if self.current_subtotal_level is None and values[-1] is not None:
+            return None
+
         # From the outside in, determine if this event is alphabetically sorted
         # after the previous event or before. If the event is alphabetically sorted
         # before the previous event, then we have entered a new subtotal section.
         section_start = False
         all_equal = True
-        for dimension in self.dimensions:
+        for dimension_value, prev_dimension_value in zip(values, prev_values):
             # NOTE: Using `or ''` to convert None values to strings for
             # easier comparison.
-            dimension_value = event.get(dimension) or ''
-            prev_dimension_value = prev_event.get(dimension) or ''
+            dimension_value = dimension_value or ''
+            prev_dimension_value = prev_dimension_value or ''
             if dimension_value == prev_dimension_value:
                 continue
 
             all_equal = False
             section_start = (
-                dimension_value < prev_dimension_value
-                and row['timestamp'] <= prev_row['timestamp']
+                dimension_value < prev_dimension_value and timestamp <= prev_timestamp
             )
             break
 
@@ -608,7 +684,7 @@ class SubtotalConfig:
         # otherwise druid would not have returned identical rows. Need to include a
         # timestamp comparison as well since grouping by a non-all time granularity can
         # produce rows with the same dimension values but not the same timestamp.
-        if all_equal and row['timestamp'] <= prev_row['timestamp']:
+        if all_equal and timestamp <= prev_timestamp:
             section_start = True
 
         # If we are starting a new section, update the current subtotal level. By
@@ -626,6 +702,26 @@ class SubtotalConfig:
         return self.dimensions[self.current_subtotal_level]
 
 
+class ArrayQueryResult:
+    '''Lazily parsed array based GroupBy query result.
+
+    Iterating over this object produces the non-array based druid rows that pydruid
+    and most callers expect. Callers that only need a DataFrame should use
+    `to_dataframe` instead, which skips building a dict for each row. The underlying
+    rows can be streaming, so only one of these can be consumed.
+    '''
+
+    def __init__(self, query, rows):
+        self.query = query
+        self.rows = rows
+
+    def __iter__(self):
+        return self.query.parse_rows(self.rows)
+
+    def to_dataframe(self):
+        return self.query.parse_dataframe(self.rows)
+
+
 class PydruidQueryWrapper(PydruidQuery):
     '''Wrapper around a pydruid query to provide useful enhancements over the builtin
     version.
@@ -640,7 +736,7 @@ class PydruidQueryWrapper(PydruidQuery):
 
     @property
     def result(self):
-        if isinstance(self.maybe_generator_result, GeneratorType):
+        if isinstance(self.maybe_generator_result, (GeneratorType, ArrayQueryResult)):
             return list(self.maybe_generator_result)
         return self.maybe_generator_result
 
@@ -670,7 +766,11 @@ class PydruidQueryWrapper(PydruidQuery):
         getevent = operator.itemgetter('event')
         inbuf = []
         df = None
-        if isinstance(self.maybe_generator_result, GeneratorType):
+        if isinstance(self.maybe_generator_result, ArrayQueryResult):
+            # Array based results can be transposed directly into columns without
+            # building the intermediate event dicts.
+            df = self.maybe_generator_result.to_dataframe()
+        elif isinstance(self.maybe_generator_result, GeneratorType):
             # NOTE: Pandas is column based while we receive results in rows
             # that means pandas won't start working until we receive all of them so they
             # can be rearranged. To work around that load them in smaller chunks, so
@@ -0,0 +1,260 @@
+'''Columnar parsing of array based GroupBy query results.
+
+When `resultAsArray` is set on the query context, Druid returns each GroupBy row as a
+flat list of values. Instead of building a dict per row and handing those to pandas,
+the `ColumnarResultBuilder` transposes the rows in fixed size chunks into compact
+per-column buffers and assembles the final DataFrame directly from those buffers.
+'''
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import typing
+
+from log import LOG
+
+if typing.TYPE_CHECKING:
+    import pandas as pd
+    from db.druid.query_builder import SubtotalConfig
+
+TIMESTAMP_COLUMN = 'timestamp'
+
+# Number of rows to buffer before they are transposed into the column buffers. This
+# bounds the number of row lists that are alive at the same time while the query
+# result is still streaming in over the network.
+CHUNK_SIZE = 100000
+
+# Druid wraps Infinity, -Infinity, and NaN in quotes which makes it difficult for the
+# JSON parser to properly expand them into their correct type.
+_STRING_METRIC_VALUES = {
+    'NaN': float('NaN'),
+    'Infinity': float('Infinity'),
+    '-Infinity': -float('Infinity'),
+}
+
+
+def _iter_chunks(rows: Iterable[List[Any]], chunk_size: int = CHUNK_SIZE):
+    rows = iter(rows)
+    chunk = list(islice(rows, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, chunk_size))
+
+
+def _encode_values(values, lookup: Dict[Any, int]):
+    '''Dictionary encode the values into an integer code array. The lookup is shared
+    across chunks so that codes stay stable for the full result.'''
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    # NOTE: `len(lookup)` is evaluated before the value is inserted, so a new
+    # value will receive the next unused code.
+    return np.fromiter(
+        (lookup.setdefault(value, len(lookup)) for value in values),
+        dtype=np.int32,
+        count=len(values),
+    )
+
+
+def _decode_values(code_chunks, lookup: Dict[Any, int], transform=None):
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    categories = list(lookup)
+    if transform:
+        categories = [transform(value) for value in categories]
+    category_array = np.empty(len(categories), dtype=object)
+    category_array[:] = categories
+    return category_array[np.concatenate(code_chunks)]
+
+
+def _convert_metric_values(values) -> List[Any]:
+    '''Slow path for metric columns that contain values numpy cannot coerce into a
+    float array. Mirrors the per-row handling of the dict based parser.'''
+    output = []
+    for value in values:
+        if isinstance(value, str):
+            if value in _STRING_METRIC_VALUES:
+                value = _STRING_METRIC_VALUES[value]
+            else:
+                LOG.error('Illegal value for a metric: %s', value)
+                value = None
+        output.append(value)
+    return output
+
+
+def _build_metric_column(values):
+    '''Convert a chunk of metric values into a numpy array. Integer and float columns
+    keep the dtype numpy infers for them. Columns containing nulls or the quoted
+    NaN/Infinity strings Druid produces are converted to floats in a single pass.
+    '''
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    try:
+        column = np.array(values)
+        if column.ndim == 1 and column.dtype.kind in 'biuf':
+            return column
+
+        # NOTE: numpy would also convert numeric strings (like '1.5') into
+        # floats. The dict based parser treats those as illegal values, so any
+        # other string must go through the slow path to be logged and nulled.
+        for value in values:
+            if isinstance(value, str) and value not in _STRING_METRIC_VALUES:
+                return _convert_metric_values(values)
+
+        column = np.array(values, dtype=object).astype(np.float64)
+        if column.ndim == 1:
+            return column
+    except (TypeError, ValueError):
+        pass
+    return _convert_metric_values(values)
+
+
+def _merge_metric_chunks(chunks):
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    if all(isinstance(chunk, np.ndarray) for chunk in chunks):
+        return np.concatenate(chunks)
+    return list(chain.from_iterable(chunks))
+
+
+class ColumnarResultBuilder:
+    '''Build a DataFrame from array based GroupBy rows without creating an
+    intermediate dict per row. The output DataFrame is equivalent to the one built
+    from the dict based `event` rows: same columns in the same order, null values for
+    strict null fields with a zero count and NaN/Infinity strings converted to floats.
+
+    Dimension columns (and the timestamp) are dictionary encoded while streaming so
+    that repeated values only occupy a small integer code per row until the final
+    object column is built.
+    '''
+
+    def __init__(
+        self,
+        header: List[str],
+        dimensions: List[str],
+        strict_field_map: Dict[str, str],
+        format_timestamp: Callable[[float], str],
+        default_timestamp_ms: float,
+        subtotals: Optional['SubtotalConfig'] = None,
+    ):
+        self.header = header
+        self.strict_field_map = strict_field_map
+        self.format_timestamp = format_timestamp
+        self.default_timestamp_ms = default_timestamp_ms
+        self.subtotals = subtotals
+
+        self.has_timestamp = bool(header) and header[0] == TIMESTAMP_COLUMN
+        offset = 1 if self.has_timestamp else 0
+        self.dimension_slice = slice(offset, offset + len(dimensions))
+        self.dimension_indices = {
+            dimension: offset + idx for idx, dimension in enumerate(dimensions)
+        }
+
+        # Columns that are dictionary encoded. The timestamp column is encoded as
+        # well since it only has a small number of unique values.
+        encoded_indices = set(self.dimension_indices.values())
+        if self.has_timestamp:
+            encoded_indices.add(0)
+        self.encoded_indices = encoded_indices
+
+        self.row_count = 0
+        self.lookups: Dict[int, Dict[Any, int]] = {idx: {} for idx in encoded_indices}
+        self.chunks: List[List[Any]] = [[] for _ in header]
+        self.previous_row: Optional[List[Any]] = None
+
+    def _label_subtotal_rows(self, chunk: List[List[Any]]) -> None:
+        '''Replace the dimension value of subtotal rows with the subtotal label. The
+        rows are modified in place, matching how the dict based parser modifies
+        each event before the next row is compared against it.'''
+        subtotals = self.subtotals
+        assert subtotals is not None
+        dimension_slice = self.dimension_slice
+        label = subtotals.subtotal_result_label
+        previous_row = self.previous_row
+        for row in chunk:
+            if previous_row is not None:
+                timestamp = row[0] if self.has_timestamp else self.default_timestamp_ms
+                previous_timestamp = (
+                    previous_row[0] if self.has_timestamp else self.default_timestamp_ms
+                )
+                subtotal_dimension = subtotals.get_subtotal_dimension_from_values(
+                    row[dimension_slice],
+                    timestamp,
+                    previous_row[dimension_slice],
+                    previous_timestamp,
+                )
+                if subtotal_dimension:
+                    row[self.dimension_indices[subtotal_dimension]] = label
+            previous_row = row
+        self.previous_row = previous_row
+
+    def add_rows(self, chunk: List[List[Any]]) -> None:
+        if self.subtotals:
+            self._label_subtotal_rows(chunk)
+
+        for idx, values in enumerate(zip(*chunk)):
+            if idx in self.encoded_indices:
+                self.chunks[idx].append(_encode_values(values, self.lookups[idx]))
+            else:
+                self.chunks[idx].append(_build_metric_column(values))
+        self.row_count += len(chunk)
+
+    def build_dataframe(self, rows: Iterable[List[Any]]) -> 'pd.DataFrame':
+        # pylint: disable=import-outside-toplevel
+        import numpy as np
+        import pandas as pd
+
+        for chunk in _iter_chunks(rows):
+            self.add_rows(chunk)
+
+        if not self.row_count:
+            return pd.DataFrame()
+
+        columns: Dict[str, Any] = {}
+        for idx, column in enumerate(self.header):
+            if idx == 0 and self.has_timestamp:
+                continue
+            if idx in self.encoded_indices:
+                columns[column] = _decode_values(self.chunks[idx], self.lookups[idx])
+            else:
+                columns[column] = _merge_metric_chunks(self.chunks[idx])
+            self.chunks[idx] = []
+
+        # Since we use filtered aggregations on Druid, we lose the ability to
+        # differentiate null from 0. If a field has a zero count value, its value is
+        # replaced with null to simulate null filling.
+        for field, count_field in self.strict_field_map.items():
+            if field not in columns or count_field not in columns:
+                continue
+
+            null_mask = np.asarray(columns[count_field]) == 0
+            if not null_mask.any():
+                continue
+
+            values = columns[field]
+            if isinstance(values, np.ndarray):
+                values = values.astype(np.float64)
+                values[null_mask] = np.nan
+            else:
+                values = [
+                    None if is_null else value
+                    for value, is_null in zip(values, null_mask)
+                ]
+            columns[field] = values
+
+        # The timestamp is stored as the last column, matching the position it
+        # receives in the dict based events.
+        if self.has_timestamp:
+            columns[TIMESTAMP_COLUMN] = _decode_values(
+                self.chunks[0], self.lookups[0], self.format_timestamp
+            )
+            self.chunks[0] = []
+        else:
+            columns[TIMESTAMP_COLUMN] = np.full(
+                self.row_count,
+                self.format_timestamp(self.default_timestamp_ms),
+                dtype=object,
+            )
+
+        return pd.DataFrame(columns)
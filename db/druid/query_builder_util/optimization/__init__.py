@@ -1,5 +1,6 @@
 import typing
 
+from .aggregation_optimizations import apply_aggregation_optimizations
 from .basic_optimizations import apply_basic_optimizations
 from .filter_optimizations import apply_filter_optimizations
 from .sketch_optimizations import apply_sketch_optimizations
@@ -16,4 +17,5 @@ def apply_optimizations(query: 'GroupByQueryBuilder') -> None:
     '''
     apply_basic_optimizations(query)
     apply_filter_optimizations(query)
+    apply_aggregation_optimizations(query)
     apply_sketch_optimizations(query)
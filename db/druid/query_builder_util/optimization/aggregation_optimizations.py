@@ -0,0 +1,216 @@
+# mypy: disallow_untyped_defs=True
+import copy
+import json
+import re
+from typing import Any, Dict, List, Optional, Set, TYPE_CHECKING
+
+from pydruid.utils.postaggregator import Field
+
+# NOTE: Avoid circular dependency.
+if TYPE_CHECKING:
+    from db.druid.query_builder import GroupByQueryBuilder
+
+# Aggregator types whose finalized value is the same as the raw value that a
+# `fieldAccess` post aggregator reads. Duplicates of these aggregators can be replaced
+# with a `fieldAccess` of the remaining aggregator without changing the result. Sketch
+# aggregators are consolidated separately by the sketch optimizations.
+DEDUPLICATABLE_AGGREGATOR_TYPES = frozenset(
+    (
+        'count',
+        'doubleMax',
+        'doubleMin',
+        'doubleSum',
+        'floatMax',
+        'floatMin',
+        'floatSum',
+        'longMax',
+        'longMin',
+        'longSum',
+    )
+)
+
+FIELD_ACCESS_POST_AGGREGATOR_TYPES = ('fieldAccess', 'finalizingFieldAccess')
+
+# Post aggregator types that only reference other aggregations through the post
+# aggregators stored in their `field` or `fields` properties. References held by
+# other post aggregator types (like the formula of an `expression` post aggregator)
+# cannot be rewritten.
+REWRITABLE_POST_AGGREGATOR_TYPES = frozenset(
+    (
+        *FIELD_ACCESS_POST_AGGREGATOR_TYPES,
+        'arithmetic',
+        'constant',
+        'doubleGreatest',
+        'doubleLeast',
+        'longGreatest',
+        'longLeast',
+        'thetaSketchEstimate',
+        'thetaSketchSetOp',
+    )
+)
+
+
+def _canonicalize_filter(raw_filter: Any) -> Any:
+    '''Build a representation of the filter where filters that match the same rows
+    are equal. The children of `and/or` filters and the values of `in` filters are
+    unordered, so they are sorted.'''
+    if not isinstance(raw_filter, dict):
+        return raw_filter
+
+    output = dict(raw_filter)
+    filter_type = output.get('type')
+    if filter_type in ('and', 'or') and isinstance(output.get('fields'), list):
+        output['fields'] = sorted(
+            (_canonicalize_filter(child) for child in output['fields']),
+            key=lambda child: json.dumps(child, sort_keys=True),
+        )
+    elif filter_type == 'not':
+        output['field'] = _canonicalize_filter(output.get('field'))
+    elif filter_type == 'in' and isinstance(output.get('values'), list):
+        output['values'] = sorted(output['values'], key=str)
+    return output
+
+
+def hash_aggregator(agg: Any) -> Optional[str]:
+    '''Build a hash of the aggregator definition that is the same for aggregators that
+    compute the same value, regardless of their name. Returns None if the aggregator
+    cannot be deduplicated.
+    '''
+    if not isinstance(agg, dict):
+        return None
+
+    inner_agg = agg
+    filter_hash = None
+    if agg.get('type') == 'filtered':
+        inner_agg = agg.get('aggregator')
+        if not isinstance(inner_agg, dict):
+            return None
+        filter_hash = json.dumps(
+            _canonicalize_filter(agg.get('filter')), sort_keys=True
+        )
+
+    if inner_agg.get('type') not in DEDUPLICATABLE_AGGREGATOR_TYPES:
+        return None
+
+    # NOTE: pydruid stores the aggregation ID as the aggregator `name` when the
+    # query is built. It is not part of what the aggregator computes.
+    inner_agg_hash = json.dumps(
+        {key: value for key, value in inner_agg.items() if key != 'name'},
+        sort_keys=True,
+    )
+    return f'{filter_hash}|{inner_agg_hash}'
+
+
+def _get_raw_post_aggregator(post_agg: Any) -> dict:
+    # The post aggregations can either be built dicts or pydruid Postaggregator
+    # instances holding the dict in their `post_aggregator` property.
+    return post_agg if isinstance(post_agg, dict) else post_agg.post_aggregator
+
+
+def _references_any(post_agg: Any, agg_ids: Dict[str, str]) -> bool:
+    raw_post_agg = _get_raw_post_aggregator(post_agg)
+    if raw_post_agg.get('type') in FIELD_ACCESS_POST_AGGREGATOR_TYPES:
+        return raw_post_agg.get('fieldName') in agg_ids
+
+    children: List[Any] = list(raw_post_agg.get('fields') or [])
+    if raw_post_agg.get('field'):
+        children.append(raw_post_agg['field'])
+    return any(_references_any(child, agg_ids) for child in children)
+
+
+def _find_unrewritable_references(post_agg: Any, agg_ids: Dict[str, str]) -> Set[str]:
+    '''Find the aggregation IDs referenced by the post aggregator in a way that
+    cannot be rewritten. Any aggregation ID appearing in the definition of a post
+    aggregator that cannot be rewritten is treated as referenced.'''
+    raw_post_agg = _get_raw_post_aggregator(post_agg)
+    if raw_post_agg.get('type') not in REWRITABLE_POST_AGGREGATOR_TYPES:
+        definition = json.dumps(
+            {key: value for key, value in raw_post_agg.items() if key != 'name'}
+        )
+        return {
+            agg_id
+            for agg_id in agg_ids
+            if re.search(rf'(?<!\w){re.escape(agg_id)}(?!\w)', definition)
+        }
+
+    children: List[Any] = list(raw_post_agg.get('fields') or [])
+    if raw_post_agg.get('field'):
+        children.append(raw_post_agg['field'])
+    output: Set[str] = set()
+    for child in children:
+        output.update(_find_unrewritable_references(child, agg_ids))
+    return output
+
+
+def _replace_references(post_agg: Any, replacements: Dict[str, str]) -> None:
+    '''Replace the aggregation IDs referenced by the post aggregator *in-place*.'''
+    raw_post_agg = _get_raw_post_aggregator(post_agg)
+    if raw_post_agg.get('type') in FIELD_ACCESS_POST_AGGREGATOR_TYPES:
+        field_name = raw_post_agg.get('fieldName')
+        if field_name in replacements:
+            raw_post_agg['fieldName'] = replacements[field_name]
+        return
+
+    for child in raw_post_agg.get('fields') or []:
+        _replace_references(child, replacements)
+    if raw_post_agg.get('field'):
+        _replace_references(raw_post_agg['field'], replacements)
+
+
+def deduplicate_aggregations(query: 'GroupByQueryBuilder') -> None:
+    '''Collapse aggregations that compute the same value under different IDs (like
+    the same filtered sum requested by multiple formulas) into a single aggregation.
+
+    Post aggregations referencing a removed aggregation are rewritten to reference
+    the aggregation that was kept. Each removed aggregation ID is still included in
+    the query result through a `fieldAccess` post aggregation so that the result
+    columns are unchanged.
+    '''
+    if len(query.aggregations) < 2:
+        return
+
+    hash_to_agg_id: Dict[str, str] = {}
+    replacements: Dict[str, str] = {}
+    for agg_id, agg in query.aggregations.items():
+        agg_hash = hash_aggregator(agg)
+        if agg_hash is None:
+            continue
+        if agg_hash in hash_to_agg_id:
+            replacements[agg_id] = hash_to_agg_id[agg_hash]
+        else:
+            hash_to_agg_id[agg_hash] = agg_id
+
+    # NOTE: Aggregations referenced by post aggregations that cannot be rewritten
+    # are kept so that those post aggregations still find them.
+    for post_agg in query.post_aggregations.values():
+        if not replacements:
+            break
+        for agg_id in _find_unrewritable_references(post_agg, replacements):
+            replacements.pop(agg_id)
+
+    if not replacements:
+        return
+
+    for agg_id in replacements:
+        query.aggregations.pop(agg_id)
+
+    post_aggs = {}
+    for post_agg_id, post_agg in query.post_aggregations.items():
+        # NOTE: Post aggregations can be shared with the calculations the query
+        # was built from, so they are copied before being modified.
+        if _references_any(post_agg, replacements):
+            post_agg = copy.deepcopy(post_agg)
+            _replace_references(post_agg, replacements)
+        post_aggs[post_agg_id] = post_agg
+
+    # NOTE: The post aggregations linking the removed aggregation IDs to the
+    # kept aggregations are added after the existing post aggregations so that the
+    # position of the existing columns in array based results is unchanged.
+    aliases = {
+        agg_id: Field(kept_agg_id) for agg_id, kept_agg_id in replacements.items()
+    }
+    query.post_aggregations = {**post_aggs, **aliases}
+
+
+def apply_aggregation_optimizations(query: 'GroupByQueryBuilder') -> None:
+    deduplicate_aggregations(query)
@@ -0,0 +1,335 @@
+# mypy: disallow_untyped_defs=True
+'''Pivot rewrite for queries computing the same sum over many fields.
+
+Each field requested in a query is normally computed with a filtered aggregation
+(a `field == X` selector wrapped around a sum). For queries over hundreds of fields,
+Druid has to evaluate hundreds of filters for every row. The pivot rewrite instead
+groups the query by the field dimension, computes a single sum per metric, and pivots
+the result rows back into the original wide shape (one column per aggregation and
+post aggregation) before they are parsed.
+'''
+import math
+import operator
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+from pydruid.utils.dimensions import DimensionSpec
+from pydruid.utils.filters import Filter
+
+from config.druid_base import FIELD_NAME
+from db.druid.query_builder_util.optimization.aggregation_optimizations import (
+    _get_raw_post_aggregator,
+)
+
+# NOTE: Avoid circular dependency.
+if TYPE_CHECKING:
+    from db.druid.query_builder import GroupByQueryBuilder
+
+PIVOTABLE_AGGREGATOR_TYPES = ('doubleSum', 'longSum')
+
+PostAggregatorFunction = Callable[[Dict[str, Any]], Any]
+
+# Placeholder for the value of an aggregation that no row values were added to.
+_NO_VALUE = object()
+
+# The field IDs an aggregation sums over and the (aggregator type, metric) summed.
+FieldAggregation = Tuple[Set[str], Tuple[str, str]]
+
+
+def _to_number(value: Any) -> Optional[float]:
+    # NOTE: Druid encodes NaN and Infinity as strings, which `float` parses. Null
+    # values are returned by Druid when SQL compatible null handling is enabled.
+    return None if value is None else float(value)
+
+
+def _divide(numerator: float, denominator: float) -> float:
+    # Druid's `/` function returns zero when dividing by zero.
+    return numerator / denominator if denominator else 0.0
+
+
+def _quotient(numerator: float, denominator: float) -> float:
+    # Druid's `quotient` function follows floating point division semantics.
+    if denominator:
+        return numerator / denominator
+    if numerator and not math.isnan(numerator):
+        return math.copysign(math.inf, numerator) * math.copysign(1, denominator)
+    return math.nan
+
+
+ARITHMETIC_FUNCTIONS: Dict[str, Callable[[float, float], float]] = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': _divide,
+    'quotient': _quotient,
+}
+
+
+class _FieldAccess:
+    def __init__(self, field_name: str):
+        self.field_name = field_name
+
+    def __call__(self, values: Dict[str, Any]) -> Any:
+        return values[self.field_name]
+
+
+class _Constant:
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __call__(self, values: Dict[str, Any]) -> Any:
+        return self.value
+
+
+class _Arithmetic:
+    def __init__(self, function: str, children: List[PostAggregatorFunction]):
+        self.function = function
+        self.children = children
+
+    def __call__(self, values: Dict[str, Any]) -> Optional[float]:
+        numbers: List[float] = []
+        for child in self.children:
+            number = _to_number(child(values))
+            # Druid's arithmetic post aggregator is null if any of its inputs is null.
+            if number is None:
+                return None
+            numbers.append(number)
+
+        arithmetic_function = ARITHMETIC_FUNCTIONS[self.function]
+        result = numbers[0]
+        for number in numbers[1:]:
+            result = arithmetic_function(result, number)
+        return result
+
+
+def compile_post_aggregator(post_agg: Any) -> Optional[PostAggregatorFunction]:
+    '''Build a function computing the post aggregator's value from the values of the
+    aggregations and previous post aggregations of a row. Returns None if the post
+    aggregator type is not supported.
+
+    NOTE: The functions are picklable so that pivoted queries can be parsed in
+    a query offload worker process.
+    '''
+    raw_post_agg = _get_raw_post_aggregator(post_agg)
+    post_agg_type = raw_post_agg.get('type')
+    if post_agg_type in ('fieldAccess', 'finalizingFieldAccess'):
+        return _FieldAccess(raw_post_agg['fieldName'])
+
+    if post_agg_type == 'constant':
+        return _Constant(raw_post_agg['value'])
+
+    function = raw_post_agg.get('fn')
+    if post_agg_type != 'arithmetic' or function not in ARITHMETIC_FUNCTIONS:
+        return None
+
+    children = []
+    for child in raw_post_agg['fields']:
+        child_function = compile_post_aggregator(child)
+        if child_function is None:
+            return None
+        children.append(child_function)
+    return _Arithmetic(function, children) if children else None
+
+
+def _get_filter_field_ids(agg_filter: Any) -> Optional[Set[str]]:
+    '''If the filter only matches rows of specific fields, return the field IDs.'''
+    if not isinstance(agg_filter, dict) or 'extractionFn' in agg_filter:
+        return None
+
+    filter_type = agg_filter.get('type')
+    if filter_type == 'or':
+        output: Set[str] = set()
+        for child in agg_filter.get('fields') or []:
+            child_field_ids = _get_filter_field_ids(child)
+            if child_field_ids is None:
+                return None
+            output.update(child_field_ids)
+        return output
+
+    if agg_filter.get('dimension') != FIELD_NAME:
+        return None
+    if filter_type == 'selector':
+        return {agg_filter['value']}
+    if filter_type == 'in':
+        return set(agg_filter['values'])
+    return None
+
+
+def _get_field_aggregation(agg: Any) -> Optional[FieldAggregation]:
+    '''If the aggregation is a sum over the rows of specific fields, return the field
+    IDs and the (aggregator type, metric) that is summed.'''
+    if not isinstance(agg, dict) or agg.get('type') != 'filtered':
+        return None
+
+    inner_agg = agg.get('aggregator')
+    if (
+        not isinstance(inner_agg, dict)
+        or inner_agg.get('type') not in PIVOTABLE_AGGREGATOR_TYPES
+        or set(inner_agg) - {'type', 'fieldName', 'name'}
+    ):
+        return None
+
+    field_ids = _get_filter_field_ids(agg.get('filter'))
+    if not field_ids:
+        return None
+    return (field_ids, (inner_agg['type'], inner_agg['fieldName']))
+
+
+def _groups_by_field_dimension(dimensions: Iterable[Any]) -> bool:
+    for dimension in dimensions:
+        if isinstance(dimension, DimensionSpec):
+            # pylint: disable=protected-access
+            dimension = dimension._dimension
+        elif isinstance(dimension, dict):
+            dimension = dimension.get('dimension')
+        if dimension == FIELD_NAME:
+            return True
+    return False
+
+
+class FieldPivot:
+    '''Rewrites a built GroupBy query to group on the field dimension and pivots the
+    query result rows back into the shape of the original query.'''
+
+    def __init__(
+        self,
+        query: 'GroupByQueryBuilder',
+        field_aggregations: Dict[str, FieldAggregation],
+        post_aggregations: Dict[str, PostAggregatorFunction],
+    ):
+        # The number of leading values in a result row that identify the row group.
+        self.group_size = len(query.dimensions) + (query.granularity != 'all')
+        self.field_ids = sorted(
+            set().union(*(field_ids for (field_ids, _) in field_aggregations.values()))
+        )
+        self.metrics = sorted({metric for (_, metric) in field_aggregations.values()})
+        self.aggregation_ids = list(field_aggregations)
+        self.post_aggregations = post_aggregations
+        self.field_filter = Filter(
+            type='in', dimension=FIELD_NAME, values=self.field_ids
+        )
+
+        metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+        # Mapping from field ID to the (aggregation index, metric index) pairs that
+        # the field's row values are added to.
+        self.field_targets: Dict[str, List[Tuple[int, int]]] = {}
+        for agg_index, (field_ids, metric) in enumerate(field_aggregations.values()):
+            for field_id in field_ids:
+                self.field_targets.setdefault(field_id, []).append(
+                    (agg_index, metric_index[metric])
+                )
+
+        # Filtered sums over no rows are zero in the original query.
+        self.default_values = [
+            0 if metric[0] == 'longSum' else 0.0
+            for (_, metric) in field_aggregations.values()
+        ]
+
+    def metric_name(self, metric_index: int) -> str:
+        return f'pivot_metric__{metric_index}'
+
+    def rewrite_query(self, query_dict: dict) -> None:
+        '''Rewrite the built Druid query *in-place* to group on the field dimension
+        and compute each summed metric once.'''
+        query_dict['dimensions'] = [*query_dict['dimensions'], FIELD_NAME]
+        query_dict['aggregations'] = [
+            {'type': agg_type, 'fieldName': metric, 'name': self.metric_name(i)}
+            for i, (agg_type, metric) in enumerate(self.metrics)
+        ]
+        query_dict['postAggregations'] = []
+
+        # NOTE: The built query filter is kept as is since it holds more than the
+        # aggregation filters, like the authorization filter of the user's query
+        # policies. The field filter only ensures the rows grouped on the field
+        # dimension are limited to the fields the query computes.
+        field_filter = Filter.build_filter(self.field_filter)
+        query_filter = query_dict.get('filter')
+        query_dict['filter'] = (
+            {'type': 'and', 'fields': [query_filter, field_filter]}
+            if query_filter
+            else field_filter
+        )
+
+    def unpivot_rows(self, rows: Iterable[List[Any]]) -> Iterator[List[Any]]:
+        '''Pivot the array based result rows of the rewritten query back into the
+        array based result rows the original query would have returned.'''
+        group_size = self.group_size
+        field_targets = self.field_targets
+        groups: Dict[Tuple[Any, ...], List[Any]] = {}
+        for row in rows:
+            group = tuple(row[:group_size])
+            values = groups.get(group)
+            if values is None:
+                values = groups[group] = [_NO_VALUE] * len(self.default_values)
+
+            metric_values = row[group_size + 1 :]
+            for agg_index, metric_index in field_targets.get(row[group_size], ()):
+                metric_value = metric_values[metric_index]
+                value = values[agg_index]
+                # NOTE: With SQL compatible null handling, Druid returns null
+                # metric values. The original query's sum skips them and is only
+                # null if every value it summed was null.
+                if metric_value is None:
+                    if value is _NO_VALUE:
+                        values[agg_index] = None
+                elif value is _NO_VALUE or value is None:
+                    values[agg_index] = metric_value
+                else:
+                    values[agg_index] = value + metric_value
+
+        for group, values in groups.items():
+            for agg_index, value in enumerate(values):
+                if value is _NO_VALUE:
+                    values[agg_index] = self.default_values[agg_index]
+            row_values = dict(zip(self.aggregation_ids, values))
+            for post_agg_id, post_agg in self.post_aggregations.items():
+                row_values[post_agg_id] = post_agg(row_values)
+                values.append(row_values[post_agg_id])
+            yield [*group, *values]
+
+
+def build_field_pivot(
+    query: 'GroupByQueryBuilder', min_field_count: int
+) -> Optional[FieldPivot]:
+    '''Determine if the query can be pivoted on the field dimension and is over at
+    least `min_field_count` fields. The pivot is only built if the pivoted query
+    produces the same result as the original query.
+    '''
+    if (
+        min_field_count <= 0
+        or query.subtotals
+        or query.having
+        or not query.filter_non_aggregated_rows
+        or _groups_by_field_dimension(query.dimensions)
+    ):
+        return None
+
+    field_aggregations: Dict[str, FieldAggregation] = {}
+    for agg_id, agg in query.aggregations.items():
+        field_aggregation = _get_field_aggregation(agg)
+        if field_aggregation is None:
+            return None
+        field_aggregations[agg_id] = field_aggregation
+
+    field_ids = set().union(*(ids for (ids, _) in field_aggregations.values()))
+    if len(field_ids) < min_field_count:
+        return None
+
+    post_aggregations = {}
+    for post_agg_id, post_agg in query.post_aggregations.items():
+        post_agg_function = compile_post_aggregator(post_agg)
+        if post_agg_function is None:
+            return None
+        post_aggregations[post_agg_id] = post_agg_function
+
+    return FieldPivot(query, field_aggregations, post_aggregations)
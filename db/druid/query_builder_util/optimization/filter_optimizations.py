@@ -3,7 +3,7 @@ from typing import List, Optional, TYPE_CHECKING
 
 from pydruid.utils.filters import Filter
 
-from db.druid.util import EmptyFilter
+from db.druid.util import CompiledFilter, EmptyFilter
 
 # NOTE: Avoid circular dependency.
 if TYPE_CHECKING:
@@ -11,6 +11,11 @@ if TYPE_CHECKING:
 
 
 def get_filter_type(druid_filter: Filter) -> str:
+    # NOTE: Compiled filters have already been optimized and their
+    # children are raw filters, so they are treated as a single opaque filter.
+    if isinstance(druid_filter, CompiledFilter):
+        return 'compiled'
+
     raw_filter = druid_filter.filter['filter']
     if 'type' in raw_filter:
         return raw_filter['type']
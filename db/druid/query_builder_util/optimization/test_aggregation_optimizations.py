@@ -0,0 +1,171 @@
+import pandas as pd
+from pydruid.utils.aggregators import doublesum, filtered as filtered_aggregator
+from pydruid.utils.filters import Dimension, Filter
+from pydruid.utils.postaggregator import Field
+
+from db.druid.calculations.base_calculation import BaseCalculation
+from db.druid.query_builder import GroupByQueryBuilder
+from db.druid.query_builder_util.optimization.aggregation_optimizations import (
+    deduplicate_aggregations,
+)
+from db.druid.test_utils.in_memory_query_client import InMemoryQueryClient
+from db.druid.util import ExpressionPostAggregator
+
+ROWS = [
+    {'field': field, 'region': region, 'sum': value, 'count': 1}
+    for (value, (field, region)) in enumerate(
+        (field, region)
+        for field in ('f1', 'f2', 'f3')
+        for region in ('A', 'B', 'C')
+        for _ in range(3)
+    )
+]
+
+
+def _in_filter(values):
+    return Filter(type='in', dimension='region', values=values)
+
+
+def _build_calculation():
+    calculation = BaseCalculation()
+    field_filter = Dimension('field') == 'f1'
+    calculation.add_aggregations(
+        {
+            'a': filtered_aggregator(
+                filter=field_filter & _in_filter(['A', 'B']), agg=doublesum('sum')
+            ),
+            'b': filtered_aggregator(
+                filter=_in_filter(['B', 'A']) & field_filter, agg=doublesum('sum')
+            ),
+            'c': filtered_aggregator(
+                filter=Dimension('field') == 'f2', agg=doublesum('sum')
+            ),
+            'd': filtered_aggregator(
+                filter=Dimension('field') == 'f2', agg=doublesum('count')
+            ),
+            'e': filtered_aggregator(
+                filter=Dimension('field') == 'f2', agg=doublesum('sum')
+            ),
+            'f': filtered_aggregator(
+                filter=field_filter & _in_filter(['A', 'C']), agg=doublesum('sum')
+            ),
+        }
+    )
+    calculation.add_post_aggregation('ratio', Field('b') / Field('e'))
+    calculation.add_post_aggregation('total', Field('ratio') + Field('d'))
+    return calculation
+
+
+def _build_query(calculation, optimize=True):
+    return GroupByQueryBuilder(
+        datasource='test',
+        granularity='all',
+        grouping_fields=['region'],
+        intervals=['2021-01-01/2021-02-01'],
+        calculation=calculation,
+        optimize=optimize,
+    )
+
+
+def _run_query(query):
+    query_client = InMemoryQueryClient(ROWS)
+    result = query_client.run_query(query)
+    return (query_client.query_dicts[0], result.export_pandas())
+
+
+def test_deduplicate_filtered_sums_with_reordered_filters():
+    query = _build_query(_build_calculation())
+    deduplicate_aggregations(query)
+
+    # Filters matching the same rows are deduplicated even if the `and` children
+    # and `in` values are ordered differently. Different inner aggregators or
+    # filters are kept.
+    assert list(query.aggregations) == ['a', 'c', 'd', 'f']
+    assert list(query.post_aggregations) == ['ratio', 'total', 'b', 'e']
+    assert query.post_aggregations['b'].post_aggregator['type'] == 'fieldAccess'
+    assert query.post_aggregations['b'].post_aggregator['fieldName'] == 'a'
+    assert query.post_aggregations['e'].post_aggregator['fieldName'] == 'c'
+
+
+def test_deduplicate_rewrites_arithmetic_post_aggregations():
+    calculation = _build_calculation()
+    query = _build_query(calculation)
+    deduplicate_aggregations(query)
+
+    ratio = query.post_aggregations['ratio'].post_aggregator
+    assert ratio['fn'] == '/'
+    assert [field['fieldName'] for field in ratio['fields']] == ['a', 'c']
+
+    # Post aggregations that do not reference a removed aggregation are unchanged.
+    total = query.post_aggregations['total']
+    assert total is calculation.post_aggregations['total']
+    assert [field['fieldName'] for field in total.post_aggregator['fields']] == [
+        'ratio',
+        'd',
+    ]
+
+
+def test_deduplicate_copies_shared_post_aggregations():
+    calculation = _build_calculation()
+    original_ratio = calculation.post_aggregations['ratio']
+    query = _build_query(calculation)
+    assert query.post_aggregations['ratio'] is original_ratio
+
+    deduplicate_aggregations(query)
+    assert query.post_aggregations['ratio'] is not original_ratio
+    assert [
+        field['fieldName'] for field in original_ratio.post_aggregator['fields']
+    ] == ['b', 'e']
+
+    # A second query built from the same calculation is deduplicated the same way.
+    second_query = _build_query(calculation)
+    deduplicate_aggregations(second_query)
+    assert (
+        second_query.post_aggregations['ratio'].post_aggregator
+        == query.post_aggregations['ratio'].post_aggregator
+    )
+
+
+def test_deduplicated_query_result_matches_original_query():
+    (original_query_dict, expected) = _run_query(
+        _build_query(_build_calculation(), optimize=False)
+    )
+    optimized_query = _build_query(_build_calculation())
+    (optimized_query_dict, actual) = _run_query(optimized_query)
+
+    assert len(original_query_dict['aggregations']) == 6
+    assert len(optimized_query_dict['aggregations']) == 4
+
+    # The alias columns are added after the other post aggregations so that the
+    # aggregations and post aggregations that were kept are in their original order.
+    assert [agg['name'] for agg in optimized_query_dict['postAggregations']] == [
+        'ratio',
+        'total',
+        'b',
+        'e',
+    ]
+    assert list(actual.columns[:9]) == [
+        'region',
+        'a',
+        'c',
+        'd',
+        'f',
+        'ratio',
+        'total',
+        'b',
+        'e',
+    ]
+    pd.testing.assert_frame_equal(expected, actual[expected.columns])
+    assert (actual['b'] == actual['a']).all()
+    assert (actual['a'] != actual['f']).any()
+
+
+def test_deduplicate_keeps_aggregations_referenced_by_expressions():
+    calculation = _build_calculation()
+    calculation.add_post_aggregation('expression', ExpressionPostAggregator('(b + 1)'))
+    query = _build_query(calculation)
+    deduplicate_aggregations(query)
+
+    # `b` is referenced by an expression that cannot be rewritten, so it is kept.
+    assert list(query.aggregations) == ['a', 'b', 'c', 'd', 'f']
+    assert list(query.post_aggregations) == ['ratio', 'total', 'expression', 'e']
@@ -0,0 +1,133 @@
+import pickle
+import random
+
+import pandas as pd
+from pydruid.utils.filters import Dimension, Filter
+from pydruid.utils.postaggregator import Const, Field
+
+from db.druid.calculations.base_calculation import BaseCalculation
+from db.druid.calculations.simple_calculation import SumCalculation
+from db.druid.query_builder import GroupByQueryBuilder
+from db.druid.test_utils.in_memory_query_client import InMemoryQueryClient
+from web.server.routes.views.query_policy import PreauthorizedQueryClient
+
+FIELDS = [f'field_{i}' for i in range(20)]
+REGIONS = ['A', 'B', 'C', 'D']
+
+
+def _build_rows():
+    generator = random.Random(1)
+    rows = [
+        {
+            'field': generator.choice([*FIELDS, 'unused_field']),
+            'region': generator.choice(REGIONS),
+            'district': generator.choice(['x', 'y', None]),
+            'sum': generator.randint(0, 100) / 4,
+            'count': 1,
+        }
+        for _ in range(2000)
+    ]
+    # Make a field sparse so that some groups have no rows for it.
+    return [row for row in rows if row['field'] != 'field_0' or row['region'] == 'A']
+
+
+ROWS = _build_rows()
+
+
+def _build_query(field_pivot_min_fields):
+    calculation = BaseCalculation()
+    for field in FIELDS:
+        calculation.add_aggregations(SumCalculation('field', field).aggregations)
+    calculation.add_post_aggregation(
+        'ratio', Field('field_1') / Field('field_2') * Const(100)
+    )
+    calculation.add_post_aggregation('total', Field('ratio') + Field('field_3'))
+    calculation.set_strict_null_fields(['field_0', 'field_5', 'ratio'])
+    return GroupByQueryBuilder(
+        datasource='test',
+        granularity='all',
+        grouping_fields=['region', 'district'],
+        intervals=['2020-01-01/2021-01-01'],
+        calculation=calculation,
+        dimension_filter=Dimension('region') != 'D',
+        field_pivot_min_fields=field_pivot_min_fields,
+    )
+
+
+def _run_query(query_client, field_pivot_min_fields):
+    query = _build_query(field_pivot_min_fields)
+    result = query_client.run_query(query)
+    return (query, result.export_pandas())
+
+
+def test_pivoted_result_matches_original_query():
+    query_client = InMemoryQueryClient(ROWS)
+    (original_query, expected) = _run_query(query_client, 0)
+    (pivoted_query, actual) = _run_query(query_client, 10)
+
+    assert original_query.field_pivot is None
+    assert pivoted_query.field_pivot is not None
+    original_query_dict = query_client.query_dicts[0]
+    pivoted_query_dict = query_client.query_dicts[1]
+    assert len(original_query_dict['aggregations']) > 20
+    assert len(pivoted_query_dict['aggregations']) == 2
+    assert pivoted_query_dict['dimensions'][-1] == 'field'
+
+    pd.testing.assert_frame_equal(expected, actual)
+    # Groups without rows for a strict null field still produce null values.
+    assert actual['field_0'].isna().any()
+    assert not actual['field_1'].isna().any()
+
+
+def test_pivoted_query_keeps_authorization_filter():
+    authorization_filter = Dimension('region') == 'A'
+    query_client = PreauthorizedQueryClient(
+        InMemoryQueryClient(ROWS), authorization_filter
+    )
+    (_, expected) = _run_query(query_client, 0)
+    (pivoted_query, actual) = _run_query(query_client, 10)
+
+    assert pivoted_query.field_pivot is not None
+    pivoted_query_dict = query_client.query_client.query_dicts[-1]
+    assert Filter.build_filter(authorization_filter) in (
+        pivoted_query_dict['filter']['fields'][0]['fields']
+    )
+    assert set(actual['region']) == {'A'}
+    pd.testing.assert_frame_equal(expected, actual)
+
+
+def test_pivoted_result_matches_original_query_with_null_metrics():
+    # Druid returns null metric values when SQL compatible null handling is enabled.
+    rows = [
+        {**row, 'sum': None}
+        if row['field'] == 'field_2' or (row['field'] == 'field_3' and i % 2)
+        else row
+        for (i, row) in enumerate(ROWS)
+    ]
+    query_client = InMemoryQueryClient(rows)
+    (_, expected) = _run_query(query_client, 0)
+    (pivoted_query, actual) = _run_query(query_client, 10)
+
+    assert pivoted_query.field_pivot is not None
+    pd.testing.assert_frame_equal(expected, actual)
+    assert actual['field_2'].isna().all()
+    assert actual['ratio'].isna().all()
+    assert not actual['field_3'].isna().any()
+
+
+def test_pivot_requires_minimum_field_count():
+    query_client = InMemoryQueryClient(ROWS)
+    (query, _) = _run_query(query_client, len(FIELDS) + 1)
+    assert query.field_pivot is None
+    assert query_client.query_dicts[0]['dimensions'] == ['region', 'district']
+
+
+def test_pivoted_query_can_be_parsed_after_pickling():
+    query_client = InMemoryQueryClient(ROWS)
+    (_, expected) = _run_query(query_client, 0)
+
+    query = _build_query(10)
+    (pydruid_query, raw_result) = query_client.fetch_query(query)
+    (query, pydruid_query) = pickle.loads(pickle.dumps((query, pydruid_query)))
+    pydruid_query.result = query.parse(raw_result)
+    pd.testing.assert_frame_equal(expected, pydruid_query.export_pandas())
@@ -0,0 +1,125 @@
+import copy
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from pydruid.utils.postaggregator import Field
+
+from db.druid.calculations.base_calculation import BaseCalculation
+from db.druid.calculations.simple_calculation import SumCalculation
+from db.druid.query_builder import ArrayQueryResult, GroupByQueryBuilder
+from db.druid.query_builder_util import array_result
+from db.druid.query_builder_util.array_result import _build_metric_column
+
+FIELDS = ['field_0', 'field_1', 'field_2', 'field_3']
+REGIONS = ['A', 'B', 'C']
+DISTRICTS = [None, 'x', 'y']
+MONTHS_MS = [1609459200000.0, 1612137600000.0]
+METRIC_VALUES = [
+    0,
+    3,
+    2.5,
+    -1.25,
+    None,
+    'NaN',
+    'Infinity',
+    '-Infinity',
+    '1.5',
+    'bad',
+]
+
+
+def _build_query(granularity='month'):
+    calculation = BaseCalculation()
+    for field in FIELDS:
+        calculation.add_aggregations(SumCalculation('field', field).aggregations)
+    calculation.add_post_aggregation('ratio', Field('field_1') / Field('field_2'))
+    calculation.set_strict_null_fields(['field_0', 'field_3', 'ratio'])
+    return GroupByQueryBuilder(
+        datasource='test',
+        granularity=granularity,
+        grouping_fields=['region', 'district'],
+        intervals=['2021-01-01/2021-03-01'],
+        calculation=calculation,
+        subtotal_dimensions=['region', 'district'],
+    )
+
+
+def _build_metric_values(generator, header):
+    values = []
+    for column in header:
+        if column.startswith('count('):
+            values.append(generator.choice([0, 0, 1, 4]))
+        elif column == 'field_2':
+            # Keep one column numeric so that the fast path is exercised as well.
+            values.append(generator.choice([0, 1.5, 2]))
+        else:
+            values.append(generator.choice(METRIC_VALUES))
+    return values
+
+
+def _build_rows(query):
+    '''Build array based rows the way Druid orders a subtotal query result: the full
+    grouping first, followed by each subtotal grouping, with each block sorted by
+    timestamp and dimension values.'''
+    generator = random.Random(1)
+    header = query._build_array_header()
+    has_timestamp = header[0] == 'timestamp'
+    metric_header = header[(3 if has_timestamp else 2) :]
+    timestamps = MONTHS_MS if has_timestamp else [None]
+
+    rows = []
+    for dimension_values in (
+        [(region, district) for region in REGIONS for district in DISTRICTS],
+        [(region, None) for region in REGIONS],
+        [(None, None)],
+    ):
+        for timestamp in timestamps:
+            for (region, district) in dimension_values:
+                row = [timestamp] if has_timestamp else []
+                row.extend([region, district])
+                row.extend(_build_metric_values(generator, metric_header))
+                rows.append(row)
+    return rows
+
+
+def _parse_with_dicts(rows, granularity):
+    result = ArrayQueryResult(_build_query(granularity), copy.deepcopy(rows))
+    return pd.DataFrame([row['event'] for row in result])
+
+
+def _parse_with_columns(rows, granularity):
+    return ArrayQueryResult(
+        _build_query(granularity), copy.deepcopy(rows)
+    ).to_dataframe()
+
+
+@pytest.mark.parametrize('granularity', ['month', 'all'])
+def test_columnar_result_matches_parse_rows(granularity):
+    rows = _build_rows(_build_query(granularity))
+    expected = _parse_with_dicts(rows, granularity)
+    actual = _parse_with_columns(rows, granularity)
+
+    pd.testing.assert_frame_equal(expected, actual)
+    assert (actual['region'] == 'TOTAL').sum() == len(set(actual['timestamp']))
+    assert actual['field_0'].isna().any()
+    assert np.isinf(actual['field_1']).any()
+    assert actual['field_2'].dtype == np.float64
+
+
+def test_columnar_result_matches_parse_rows_in_chunks(monkeypatch):
+    # Subtotal rows are detected by comparing against the previous row, which must
+    # carry over between chunks.
+    monkeypatch.setattr(array_result._iter_chunks, '__defaults__', (4,))
+    rows = _build_rows(_build_query())
+    pd.testing.assert_frame_equal(
+        _parse_with_dicts(rows, 'month'), _parse_with_columns(rows, 'month')
+    )
+
+
+def test_build_metric_column_rejects_numeric_strings():
+    assert _build_metric_column([1.0, '1.5', None]) == [1.0, None, None]
+    column = _build_metric_column([1, 'NaN', None, '-Infinity'])
+    assert column.dtype == np.float64
+    np.testing.assert_array_equal(column, [1.0, np.nan, np.nan, -np.inf])
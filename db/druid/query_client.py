@@ -2,14 +2,19 @@ import gzip
 import json
 import logging
 import os
-import ijson
+import threading
+import time
+import uuid
 
 from abc import ABC, abstractmethod
+from concurrent import futures
+from contextlib import contextmanager
 from typing import Dict, Any
 
+import ijson
 import requests
 
-from db.druid.errors import DruidQueryError
+from db.druid.errors import DruidQueryCancelledError, DruidQueryError
 from log import LOG
 from util.druid import get_druid_request_params
 from web.server.util.error_links import get_error_background_link_msg
@@ -18,18 +23,34 @@ from web.server.util.error_links import get_error_background_link_msg
 # process should receive its own session/pool. This is because Request's
 # Session + HTTPAdapter pool is not thread safe. If multiple threads initiate a
 # request at the same time, meaning two requests are in transit simultaneously,
-# it is possible for data to corrupt in both threads.
+# it is possible for data to corrupt in both threads. The threads that run
+# concurrent Druid tasks (see `DruidQueryClient_.iter_concurrently`) therefore
+# each store their own sessions in `_THREAD_STATE` instead of using this shared
+# collection.
 # NOTE: This is a simple way to manage sessions across workers. This
 # does not account for workers that are killed by gunicorn (due to exceptions
 # or staleness), so multiple unused sessions could potentially accumulate.
 # TODO: fix this type
 _SESSIONS: Dict[Any, Any] = {}
 
+# Default number of queries a DruidQueryClient_ will run concurrently.
+DEFAULT_MAX_CONCURRENT_QUERIES = 8
+
+# Per-thread state used to track the queries issued by a concurrently running task
+# and to hold the sessions of the concurrent task threads.
+_THREAD_STATE = threading.local()
+
+
+def _init_executor_thread():
+    '''Give each thread of a concurrent query executor its own sessions.'''
+    _THREAD_STATE.sessions = {}
+
 
 def _get_session(druid_configuration):
+    sessions = getattr(_THREAD_STATE, 'sessions', _SESSIONS)
     pid = os.getpid()
-    if pid in _SESSIONS:
-        return _SESSIONS[pid]
+    if pid in sessions:
+        return sessions[pid]
 
     # Configure the connection pool settings for connections made to the
     # druid query endpoint
@@ -41,7 +62,7 @@ def _get_session(druid_configuration):
         session.auth = extra_params.get('auth')
         session.verify = extra_params.get('verify')
     session.mount(druid_configuration.query_endpoint(), adapter)
-    _SESSIONS[pid] = session
+    sessions[pid] = session
     return session
 
 
@@ -67,7 +88,7 @@ def _is_connection_aborted_error(connection_error):
     )
 
 
-def _post_query(session, url, query_dict, streaming=False, retry=True):
+def _post_query(session, url, query_dict, streaming=False, retry=True, *, timeout=None):
     '''Send a post request to Druid. Retry the connection if the session was closed
     before the query was sent.
     '''
@@ -79,11 +100,78 @@ def _post_query(session, url, query_dict, streaming=False, retry=True):
             # NOTE: because in streaming mode requests won't handle encoding for us
             # and we only know how to hangle gzip and identity
             headers={'Accept-Encoding': 'gzip'} if streaming else None,
+            timeout=timeout,
         )
     except requests.exceptions.ConnectionError as e:
         if not retry or not _is_connection_aborted_error(e):
             raise
-        return _post_query(session, url, query_dict, streaming, False)
+        return _post_query(session, url, query_dict, streaming, False, timeout=timeout)
+
+
+class InFlightQueries:
+    '''Thread safe collection of the IDs of the Druid queries issued by a group of
+    tasks that are currently waiting on Druid. Queries issued by a
+    DruidQueryClient_ inside `track()` are added to the collection so that they
+    can be cancelled if the tasks are abandoned.
+
+    When groups are nested (a tracked task starts its own group of tasks), queries
+    are also added to the parent group and cancelling the parent group cancels the
+    nested group.
+    '''
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._cancelled = False
+        self._query_ids = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled or bool(self.parent and self.parent.cancelled)
+
+    def add(self, query_id):
+        with self._lock:
+            self._query_ids.add(query_id)
+        if self.parent:
+            self.parent.add(query_id)
+
+    def discard(self, query_id):
+        with self._lock:
+            self._query_ids.discard(query_id)
+        if self.parent:
+            self.parent.discard(query_id)
+
+    def cancel(self):
+        '''Mark the group as cancelled so its tasks do not issue new queries and
+        return the IDs of the queries that are still running.'''
+        with self._lock:
+            self._cancelled = True
+            return list(self._query_ids)
+
+    @contextmanager
+    def track(self):
+        '''Track the queries issued by the current thread in this group.'''
+        previous = get_in_flight_queries()
+        _THREAD_STATE.in_flight = self
+        try:
+            yield self
+        finally:
+            _THREAD_STATE.in_flight = previous
+
+
+def get_in_flight_queries():
+    '''Return the group tracking the queries issued by the current thread, if any.'''
+    return getattr(_THREAD_STATE, 'in_flight', None)
+
+
+def _iter_tracked_rows(rows, in_flight, query_id):
+    '''Yield the rows of a streamed query result. The query stays in the in flight
+    group until the result has been fully read (or the consumer stops reading it),
+    since Druid is still producing the rows and the query can still be cancelled.'''
+    try:
+        yield from rows
+    finally:
+        in_flight.discard(query_id)
 
 
 class DruidQueryRunner(ABC):
@@ -95,19 +183,49 @@ class DruidQueryRunner(ABC):
     def run_raw_query(self, query, streaming=False):
         pass
 
+    # Issue a query that inherits from db.druid.query_builder.BaseDruidQuery
+    # without parsing its result. Returns the prepared pydruid query and the raw
+    # result, which can be parsed later with `query.parse`.
+    def fetch_query(self, query):
+        pydruid_query = query.prepare()
+        raw_result = self.run_raw_query(
+            pydruid_query.query_dict, streaming=getattr(query, 'streaming', False)
+        )
+        return (pydruid_query, raw_result)
+
 
 class DruidQueryClient_(DruidQueryRunner):
-    def __init__(self, druid_configuration, query_path='druid/v2'):
+    def __init__(
+        self,
+        druid_configuration,
+        query_path='druid/v2',
+        query_timeout=None,
+        max_concurrent_queries=DEFAULT_MAX_CONCURRENT_QUERIES,
+    ):
+        '''
+        Args:
+            druid_configuration: The Druid cluster configuration to query.
+            query_path: Path of the Druid query endpoint.
+            query_timeout: Optional. Maximum number of seconds a single query can
+                run for. The timeout is sent to Druid in the query context so the
+                broker stops working on the query, and is also used as the timeout
+                for the HTTP request.
+            max_concurrent_queries: Maximum number of tasks started with
+                `run_concurrently` that can run at the same time.
+        '''
         self.query_path = query_path
         self.query_url = f'{druid_configuration.query_endpoint()}/{query_path}'
         self.druid_configuration = druid_configuration
+        self.query_timeout = query_timeout
+        self.max_concurrent_queries = max_concurrent_queries
+
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
 
     # Run a query that inherits from db.druid.query_builder.BaseDruidQuery
     def run_query(self, query):
-        pydruid_query = query.prepare()
-        raw_result = self.run_raw_query(
-            pydruid_query.query_dict, streaming=getattr(query, 'streaming', False)
-        )
+        (pydruid_query, raw_result) = self.fetch_query(query)
         # Assign a value directly to the pydruid query since we have already
         # parsed the results.
         pydruid_query.result = query.parse(raw_result)
@@ -122,29 +240,83 @@ class DruidQueryClient_(DruidQueryRunner):
         pydruid_query.result = result
         return pydruid_query
 
+    def _build_query_context(self, query):
+        '''Add a unique query ID (so the query can be cancelled) and the query
+        timeout to the query's context. The original query is not modified.'''
+        context = dict(query.get('context') or {})
+        context.setdefault('queryId', str(uuid.uuid4()))
+        if self.query_timeout:
+            context.setdefault('timeout', int(self.query_timeout * 1000))
+        return {**query, 'context': context}
+
     # Issue a fully formed query to druid
     def run_raw_query(self, query, streaming=False):
+        query = self._build_query_context(query)
+        query_id = query['context']['queryId']
+
         # If requested, log the input query before initiating the request
         # NOTE: Conditionally checking this so we don't json serialize
         # the druid query every time if it isn't going to be logged..
         if LOG.level <= logging.DEBUG:
             LOG.debug(json.dumps(query, indent=2).replace('\\n', '\n'))
 
+        # When the query is issued by a task started with `run_concurrently`, track
+        # it so that it can be cancelled if the task is abandoned.
+        in_flight = get_in_flight_queries()
+        if in_flight:
+            if in_flight.cancelled:
+                raise DruidQueryCancelledError(f'Query {query_id} was cancelled')
+            in_flight.add(query_id)
+
         # Kick off a new druid query
-        r = _post_query(
-            _get_session(self.druid_configuration),
-            self.query_url,
-            query,
-            streaming,
-        )
+        start = time.perf_counter()
+        try:
+            r = _post_query(
+                _get_session(self.druid_configuration),
+                self.query_url,
+                query,
+                streaming,
+                timeout=self.query_timeout,
+            )
+            LOG.debug(
+                'Druid query %s responded in %.3fs',
+                query_id,
+                time.perf_counter() - start,
+            )
+            self._check_response(r, query)
+        except BaseException:
+            if in_flight:
+                in_flight.discard(query_id)
+            raise
+
+        if streaming:
+            fp = (
+                gzip.GzipFile(fileobj=r.raw)
+                if r.headers.get('Content-Encoding', '') == 'gzip'
+                else r.raw
+            )
+            rows = ijson.items(fp, 'item', use_float=True)
+            return _iter_tracked_rows(rows, in_flight, query_id) if in_flight else rows
+
+        # NOTE: Non streaming responses have been fully read by the time the
+        # request returns.
+        if in_flight:
+            in_flight.discard(query_id)
+        ret = r.json()
+        if LOG.level <= logging.DEBUG and os.getenv('LOG_DRUID_RESPONSES'):
+            LOG.debug(f'Received response: {json.dumps(r.json(), indent=2)}')
+        return ret
+
+    @staticmethod
+    def _check_response(response, query):
         # pylint: disable=no-member
-        if r.status_code != requests.codes.ok:
-            error_msg = f'Server response: {r.content}'
+        if response.status_code != requests.codes.ok:
+            error_msg = f'Server response: {response.content}'
             try:
                 # "raise_for_status" will only throw an HTTPError if the
                 # status code is >= 400. We still want to throw an error
                 # for non 200 responses.
-                r.raise_for_status()
+                response.raise_for_status()
             except requests.exceptions.HTTPError as e:
                 error_msg = f'{e}\n{error_msg}'
             error_msg_link = get_error_background_link_msg('DruidQueryError')
@@ -156,22 +328,103 @@ class DruidQueryClient_(DruidQueryRunner):
 
             raise DruidQueryError(query_error)
 
-        if streaming:
-            fp = (
-                gzip.GzipFile(fileobj=r.raw)
-                if r.headers.get('Content-Encoding', '') == 'gzip'
-                else r.raw
-            )
-            return ijson.items(fp, 'item', use_float=True)
-
-        ret = r.json()
-        if LOG.level <= logging.DEBUG and os.getenv('LOG_DRUID_RESPONSES'):
-            LOG.debug(f'Received response: {json.dumps(r.json(), indent=2)}')
-        return ret
-
     def _post(self, pydruid_query):
         return self.run_pydruid_query(pydruid_query)
 
+    def cancel_query(self, query_id):
+        '''Ask Druid to stop running the query with the provided ID. Cancellation is
+        best effort, so failures are logged instead of raised.'''
+        try:
+            _get_session(self.druid_configuration).delete(
+                f'{self.query_url}/{query_id}', timeout=10
+            )
+        except requests.exceptions.RequestException:
+            LOG.warning('Unable to cancel Druid query %s', query_id, exc_info=True)
+
+    def _get_executor(self):
+        # NOTE: Threads do not survive a fork, so a new executor must be
+        # created in each process.
+        pid = os.getpid()
+        with self._executor_lock:
+            if self._executor is None or self._executor_pid != pid:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=self.max_concurrent_queries,
+                    thread_name_prefix='druid-query',
+                    initializer=_init_executor_thread,
+                )
+                self._executor_pid = pid
+            return self._executor
+
+    def iter_concurrently(self, tasks, timeout=None):
+        '''Run each task (a function taking no arguments that issues Druid queries
+        through this client) on a bounded thread pool and yield a tuple of
+        (task index, task result) as each task completes.
+
+        If `timeout` seconds pass before every task completes, a task raises an
+        error, or the caller stops iterating early, the tasks that have not started
+        are skipped and the Druid queries that are still running are cancelled.
+
+        NOTE: Tasks run in separate threads. Tasks that need the flask
+        application or request context must be wrapped by the caller (for example
+        with `copy_current_request_context`).
+        '''
+        # Tasks that start their own concurrent tasks would deadlock waiting for
+        # workers of the bounded pool they are occupying, so run them serially.
+        if getattr(_THREAD_STATE, 'is_worker', False):
+            for idx, task in enumerate(tasks):
+                yield (idx, task())
+            return
+
+        in_flight = InFlightQueries(get_in_flight_queries())
+
+        def run_task(idx, task):
+            _THREAD_STATE.is_worker = True
+            start = time.perf_counter()
+            try:
+                with in_flight.track():
+                    return task()
+            finally:
+                _THREAD_STATE.is_worker = False
+                LOG.info(
+                    'Concurrent Druid task %s finished in %.3fs',
+                    idx,
+                    time.perf_counter() - start,
+                )
+
+        executor = self._get_executor()
+        pending = {
+            executor.submit(run_task, idx, task): idx for idx, task in enumerate(tasks)
+        }
+        try:
+            for future in futures.as_completed(pending, timeout=timeout):
+                yield (pending[future], future.result())
+        except futures.TimeoutError as e:
+            raise DruidQueryCancelledError(
+                f'Druid queries did not complete within {timeout} seconds'
+            ) from e
+        finally:
+            if not all(future.done() for future in pending):
+                for future in pending:
+                    future.cancel()
+                for query_id in in_flight.cancel():
+                    self.cancel_query(query_id)
+
+    def run_concurrently(self, tasks, timeout=None):
+        '''Run each task concurrently and return the task results in the same order
+        as the tasks. See `iter_concurrently` for details.'''
+        tasks = list(tasks)
+        results = [None] * len(tasks)
+        for idx, result in self.iter_concurrently(tasks, timeout):
+            results[idx] = result
+        return results
+
+    def run_queries(self, queries, timeout=None):
+        '''Run multiple queries that inherit from
+        db.druid.query_builder.BaseDruidQuery concurrently.'''
+        return self.run_concurrently(
+            [lambda query=query: self.run_query(query) for query in queries], timeout
+        )
+
 
 class DruidQueryClient(DruidQueryRunner):
     from db.druid.config import DruidConfig
@@ -0,0 +1,130 @@
+import calendar
+from datetime import datetime, timedelta
+
+from db.druid.query_client import DruidQueryRunner
+
+# Row property holding the row's timestamp as a naive UTC datetime. Rows without it
+# match every query interval.
+TIME_COLUMN = '__time'
+
+
+def matches_filter(druid_filter, row):
+    if not druid_filter:
+        return True
+    filter_type = druid_filter['type']
+    if filter_type == 'selector':
+        return row.get(druid_filter['dimension']) == druid_filter['value']
+    if filter_type == 'in':
+        return row.get(druid_filter['dimension']) in druid_filter['values']
+    if filter_type == 'and':
+        return all(matches_filter(child, row) for child in druid_filter['fields'])
+    if filter_type == 'or':
+        return any(matches_filter(child, row) for child in druid_filter['fields'])
+    if filter_type == 'not':
+        return not matches_filter(druid_filter['field'], row)
+    raise ValueError(f'Unsupported filter type: {filter_type}')
+
+
+def aggregate(aggregation, rows):
+    if aggregation['type'] == 'filtered':
+        return aggregate(
+            aggregation['aggregator'],
+            [row for row in rows if matches_filter(aggregation['filter'], row)],
+        )
+    values = [row[aggregation['fieldName']] for row in rows]
+    # NOTE: Like Druid with SQL compatible null handling, null values are skipped
+    # and the sum of rows that are all null is null.
+    if values and all(value is None for value in values):
+        return None
+    value = sum(value for value in values if value is not None)
+    return value if aggregation['type'] == 'longSum' else float(value)
+
+
+def evaluate_post_aggregation(post_aggregation, values):
+    post_aggregation_type = post_aggregation['type']
+    if post_aggregation_type == 'fieldAccess':
+        return values[post_aggregation['fieldName']]
+    if post_aggregation_type == 'constant':
+        return post_aggregation['value']
+    assert post_aggregation_type == 'arithmetic'
+    children = [
+        evaluate_post_aggregation(child, values) for child in post_aggregation['fields']
+    ]
+    if None in children:
+        return None
+    (left, right) = [float(child) for child in children]
+    function = post_aggregation['fn']
+    if function == '/':
+        return left / right if right else 0.0
+    return {'+': left + right, '-': left - right, '*': left * right}[function]
+
+
+def _parse_interval(interval):
+    (start, end) = interval.split('/')
+    return (datetime.fromisoformat(start[:10]), datetime.fromisoformat(end[:10]))
+
+
+def _matches_intervals(intervals, row):
+    timestamp = row.get(TIME_COLUMN)
+    return timestamp is None or any(
+        start <= timestamp < end for (start, end) in map(_parse_interval, intervals)
+    )
+
+
+def _truncate_timestamp(timestamp, granularity):
+    '''Return the start of the granularity bucket holding the timestamp, in
+    milliseconds since epoch.'''
+    bucket = datetime(timestamp.year, timestamp.month, timestamp.day)
+    if granularity == 'week':
+        bucket -= timedelta(days=bucket.weekday())
+    elif granularity == 'month':
+        bucket = bucket.replace(day=1)
+    else:
+        assert granularity == 'day', f'Unsupported granularity: {granularity}'
+    return calendar.timegm(bucket.timetuple()) * 1000.0
+
+
+class InMemoryQueryClient(DruidQueryRunner):
+    '''Query client running array based GroupBy queries over in memory rows. Each
+    query dict that is run is stored in `query_dicts`.'''
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.query_dicts = []
+
+    def run_query(self, query):
+        pydruid_query = query.prepare()
+        raw_result = self.run_raw_query(pydruid_query.query_dict)
+        pydruid_query.result = query.parse(raw_result)
+        return pydruid_query
+
+    def run_raw_query(self, query, streaming=False):
+        self.query_dicts.append(query)
+        assert query['queryType'] == 'groupBy'
+        dimensions = [
+            dimension if isinstance(dimension, str) else dimension['dimension']
+            for dimension in query['dimensions']
+        ]
+        granularity = query['granularity']
+        groups = {}
+        for row in self.rows:
+            if matches_filter(query.get('filter'), row) and _matches_intervals(
+                query['intervals'], row
+            ):
+                key = tuple(row.get(dimension) for dimension in dimensions)
+                if granularity != 'all':
+                    key = (_truncate_timestamp(row[TIME_COLUMN], granularity), *key)
+                groups.setdefault(key, []).append(row)
+
+        output = []
+        for key in sorted(groups, key=str):
+            values = {}
+            for aggregation in query['aggregations']:
+                name = aggregation.get('name') or aggregation['aggregator']['name']
+                values[name] = aggregate(aggregation, groups[key])
+            for post_aggregation in query.get('postAggregations') or []:
+                values[post_aggregation['name']] = evaluate_post_aggregation(
+                    post_aggregation, values
+                )
+            output.append([*key, *values.values()])
+        return output
@@ -23,12 +23,15 @@ from models.alchemy.mixin import utcnow
 
 from web.server.app_druid import initialize_druid_context
 from web.server.data.data_access import Transaction
+from web.server.data.dimension_metadata import ENABLE_FIELD_METADATA_QUERY
 from web.server.data.druid_context import PopulatingDruidApplicationContext
+from web.server.data.population_util import DEFAULT_POPULATION_PARALLELISM
 
 
 def update_db_datasource(
     datasource_config: Optional[str] = 'LATEST_DATASOURCE',
     skip_grouped_sketch_sizes: bool = False,
+    parallelism: int = DEFAULT_POPULATION_PARALLELISM,
 ) -> None:
     '''Makes a new datasource available to be used in a web server context.
     To do that it adds it to its database as well as all meta data about it.
@@ -39,12 +42,16 @@ def update_db_datasource(
         DEPLOYMENT_NAME
     )
     if datasource_config is not None:
-        _populate_datasource(app, datasource_config, skip_grouped_sketch_sizes)
+        _populate_datasource(
+            app, datasource_config, skip_grouped_sketch_sizes, parallelism
+        )
     else:
         LOG.info('Populating datasources %s', valid_datasources)
         for datasource in valid_datasources:
             LOG.info('Processing datasource %s', datasource)
-            _populate_datasource(app, datasource, skip_grouped_sketch_sizes)
+            _populate_datasource(
+                app, datasource, skip_grouped_sketch_sizes, parallelism
+            )
 
     LOG.info(
         'Beginning cleaning up of vanished datasources... Valid datasets are %s',
@@ -85,25 +92,30 @@ def update_db_datasource(
 
 
 def _populate_datasource(
-    app: Flask, datasource_config: str, skip_grouped_sketch_sizes: bool
+    app: Flask,
+    datasource_config: str,
+    skip_grouped_sketch_sizes: bool,
+    parallelism: int,
 ) -> None:
     initialize_druid_context(
         app,
         datasource_config=datasource_config,
         cls=PopulatingDruidApplicationContext,
         skip_grouped_sketch_sizes=skip_grouped_sketch_sizes,
+        population_parallelism=parallelism,
     )
 
     LOG.info('Generating Query mock data')
     druid_context = app.druid_context
     dimension_values = druid_context.dimension_values_lookup
+    field_metadata = druid_context.dimension_metadata.field_metadata
     query_data = generate_query_mock_data(
         indicators.DATA_SOURCES,
         aggregation.DIMENSION_CATEGORIES,
         aggregation.CALENDAR_SETTINGS,
         aggregation_rules.CALCULATIONS_FOR_FIELD,
         calculated_indicators.CALCULATED_INDICATOR_CONSTITUENTS,
-        druid_context.dimension_metadata.field_metadata,
+        field_metadata if ENABLE_FIELD_METADATA_QUERY else None,
     )
     LOG.info('Finished generating Query mock data')
 
@@ -118,6 +130,7 @@ def _populate_datasource(
                 'grouped_dimension_sketch_sizes': (
                     druid_context.dimension_metadata.grouped_dimension_sketch_sizes
                 ),
+                'field_metadata': field_metadata,
             },
             'last_modified': utcnow(),
         }
@@ -16,6 +16,11 @@ DRUID_DATE_FORMAT = '%Y-%m-%d'  # TODO: Add time portion
 # TODO: either fork pydruid master branch or submit pull request to
 # project and remove this workaround from here
 def _build_filter_workaround(filter_obj):
+    # Compiled filters have already been built. Splice in the built filter
+    # directly instead of traversing it again.
+    if isinstance(filter_obj, CompiledFilter):
+        return filter_obj.filter['filter']
+
     # make a copy so we don't overwrite the original objects stored fields
     raw_filter = filter_obj.filter['filter'].copy()
     filter_type = raw_filter.get('type')
@@ -89,6 +94,18 @@ class EmptyFilter(Filter):
         return self.filter == other_filter.filter
 
 
+# Filter wrapping a raw Druid filter that has already been built with
+# `Filter.build_filter`. Building a query that contains a compiled filter reuses the
+# raw filter as-is, which avoids rebuilding large filters (like the authorization
+# filter of a user with thousands of permitted values) for every query.
+# NOTE: The raw filter is shared by every query that uses it and must not
+# be modified.
+class CompiledFilter(Filter):
+    # pylint: disable=super-init-not-called
+    def __init__(self, raw_filter):
+        self.filter = {'filter': raw_filter}
+
+
 # Add support for EmptyFilter to the pydruid Filter class
 # TODO: CLEAN THIS UP. THIS FILE IS HARD TO UNDERSTAND WITH ALL THIS
 # JUNK FLOATING AROUND.
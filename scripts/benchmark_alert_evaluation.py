@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# Compare the number of Druid queries issued and the wall time of the batched
+# alert evaluation with calling `check_if_alert_triggered` for each alert
+# definition. The notifications of both are checked against each other in
+# data/alerts/test_alert.py.
+#
+# Usage:
+#   ./scripts/benchmark_alert_evaluation.py --alert_definitions alert_defs.json
+import json
+import sys
+import time
+
+import related
+from pylib.base.flags import Flags
+
+from config.general import DEPLOYMENT_NAME
+from data.alerts.alert import (
+    check_alerts_triggered,
+    check_if_alert_triggered,
+    get_latest_data_dates_for_alert_defs,
+)
+from db.druid.config import DruidConfig
+from db.druid.metadata import DruidMetadata
+from db.druid.query_client import DruidQueryClient_
+from log import LOG
+from web.python_client.alerts_service.model import AlertDefinition
+
+
+class CountingQueryClient:
+    '''Query client wrapper that counts the number of queries issued.'''
+
+    def __init__(self, query_client):
+        self.query_client = query_client
+        self.query_count = 0
+
+    def run_query(self, query):
+        self.query_count += 1
+        return self.query_client.run_query(query)
+
+    def run_queries(self, queries):
+        return self.query_client.run_concurrently(
+            [lambda query=query: self.run_query(query) for query in queries]
+        )
+
+
+def run_per_alert_definition(alert_defs, datasource_name, latest_dates, query_client):
+    '''Previous implementation that checks each alert definition separately.'''
+    notifications = []
+    for alert_def in alert_defs:
+        latest_date = latest_dates.get(alert_def.uri)
+        if latest_date is not None:
+            notifications.extend(
+                check_if_alert_triggered(
+                    alert_def, datasource_name, latest_date, query_client
+                )
+            )
+    return notifications
+
+
+def main():
+    Flags.PARSER.add_argument(
+        '--alert_definitions',
+        type=str,
+        required=True,
+        help='Path to a JSON file containing a list of serialized alert definitions',
+    )
+    Flags.PARSER.add_argument(
+        '--datasource',
+        type=str,
+        required=False,
+        help='Datasource to query. Defaults to the most recent datasource',
+    )
+    Flags.InitArgs()
+
+    with open(Flags.ARGS.alert_definitions) as alert_definitions_file:
+        alert_defs = [
+            related.to_model(AlertDefinition, alert_def)
+            for alert_def in json.load(alert_definitions_file)
+        ]
+
+    datasource_name = (
+        Flags.ARGS.datasource
+        or DruidMetadata.get_most_recent_datasource(DEPLOYMENT_NAME).name
+    )
+    query_client = DruidQueryClient_(DruidConfig)
+    latest_dates = get_latest_data_dates_for_alert_defs(
+        datasource_name, alert_defs, query_client
+    )
+
+    for (name, implementation) in (
+        ('per alert definition', run_per_alert_definition),
+        ('batched', check_alerts_triggered),
+    ):
+        counting_query_client = CountingQueryClient(query_client)
+        start = time.perf_counter()
+        notifications = implementation(
+            alert_defs, datasource_name, latest_dates, counting_query_client
+        )
+        LOG.info(
+            '%s: %s queries, %s notifications in %.2fs',
+            name,
+            counting_query_client.query_count,
+            len(notifications),
+            time.perf_counter() - start,
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# Compare the runtime of the vectorized dimension level data quality scoring with
+# calling `score` for each dimension value. The scores are checked against each
+# other in web/server/query/data_quality/test_data_quality_report.py.
+#
+# Usage:
+#   ./scripts/benchmark_data_quality_scoring.py --keys 8000 --days 365
+import sys
+import timeit
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pylib.base.flags import Flags
+
+from log import LOG
+from web.server.query.data_quality.data_quality_report import (
+    build_dimension_level_response,
+    get_report_counts,
+)
+from web.server.query.data_quality.data_quality_score import score
+from web.server.query.data_quality.outliers_report import FAILED_OUTLIERS_REPONSE
+
+FIELD_ID = 'field'
+DIMENSION_NAMES = ['RegionName', 'FacilityName']
+LAT_LNG_FIELDS = ['FacilityLat', 'FacilityLon']
+
+
+def build_legacy_dimension_level_response(
+    df,
+    all_report_dates,
+    no_date_filter_df,
+    num_reports_key,
+    lat_lng_fields,
+    dimension_names,
+    end_interval_date,
+    outliers_response_for_field,
+):
+    '''Previous implementation that scores each key separately.'''
+    lat_field, lng_field = lat_lng_fields
+    filtered_df = df[df[lat_lng_fields].notnull().all(1)]
+    output = {}
+    for key in filtered_df['key'].unique():
+        df_slice = filtered_df[filtered_df['key'] == key]
+        first_row = df_slice.iloc[0]
+        counts = get_report_counts(
+            all_report_dates,
+            list(df_slice['dates']),
+            list(df_slice[num_reports_key]),
+        )
+        first_report_date = min(
+            list(no_date_filter_df[no_date_filter_df['key'] == key]['dates'])
+        ).tz_localize(None)
+        output[key] = {
+            **score(all_report_dates, counts, first_report_date, end_interval_date),
+            'geo': {'lat': first_row[lat_field], 'lng': first_row[lng_field]},
+            'dimensions': {
+                dimension: first_row[dimension] for dimension in dimension_names
+            },
+            'outlierAnalysis': outliers_response_for_field.get(
+                key, FAILED_OUTLIERS_REPONSE
+            ),
+        }
+    return output
+
+
+def build_synthetic_frames(key_count, day_count):
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2021-01-01', periods=day_count, freq='D')
+    keys = np.array([f'Facility {idx}' for idx in range(key_count)])
+    row_count = key_count * day_count
+
+    # Each key reports on a random subset of dates with a trend that varies by key.
+    key_idx = np.tile(np.arange(key_count), day_count)
+    date_idx = np.repeat(np.arange(day_count), key_count)
+    report_probability = rng.uniform(0.2, 1, key_count)[key_idx]
+    trend = rng.normal(0, 0.01, key_count)[key_idx] * date_idx
+    counts = np.maximum(rng.poisson(5, row_count) + trend, 0).round()
+    df = pd.DataFrame(
+        {
+            'key': keys[key_idx],
+            'RegionName': np.array([f'Region {idx % 20}' for idx in range(key_count)])[
+                key_idx
+            ],
+            'FacilityName': keys[key_idx],
+            'FacilityLat': rng.uniform(-10, 10, key_count).round(4)[key_idx],
+            'FacilityLon': rng.uniform(30, 50, key_count).round(4)[key_idx],
+            'dates': dates[date_idx],
+            FIELD_ID: counts,
+        }
+    )
+    df = df[rng.random(row_count) < report_probability]
+    df.loc[df.index[::97], 'FacilityLat'] = np.nan
+
+    first_reports = pd.DataFrame(
+        {
+            'key': keys,
+            'dates': dates[0] - pd.to_timedelta(rng.integers(0, 500, key_count), 'D'),
+        }
+    )
+    no_date_filter_df = pd.concat([df[['key', 'dates']], first_reports])
+    no_date_filter_df['dates'] = no_date_filter_df['dates'].dt.tz_localize('UTC')
+    all_report_dates = sorted(set(df['dates']))
+    return (df, all_report_dates, no_date_filter_df)
+
+
+def main():
+    Flags.PARSER.add_argument(
+        '--keys', type=int, default=8000, help='Number of dimension values'
+    )
+    Flags.PARSER.add_argument(
+        '--days', type=int, default=365, help='Number of report dates'
+    )
+    Flags.PARSER.add_argument(
+        '--repeat', type=int, default=1, help='Number of timed runs per implementation'
+    )
+    Flags.InitArgs()
+
+    (df, all_report_dates, no_date_filter_df) = build_synthetic_frames(
+        Flags.ARGS.keys, Flags.ARGS.days
+    )
+    args = (
+        df,
+        all_report_dates,
+        no_date_filter_df,
+        FIELD_ID,
+        LAT_LNG_FIELDS,
+        DIMENSION_NAMES,
+        datetime(2022, 3, 1),
+        {},
+    )
+
+    for (name, implementation) in (
+        ('per key', build_legacy_dimension_level_response),
+        ('vectorized', build_dimension_level_response),
+    ):
+        timings = timeit.repeat(
+            lambda: implementation(*args), number=1, repeat=Flags.ARGS.repeat
+        )
+        LOG.info('%s: best of %s runs: %.2fs', name, len(timings), min(timings))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
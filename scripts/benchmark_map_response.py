@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# Benchmark the columnar date grouping used by Map.build_response against the
+# previous implementation that filtered the full dataframe once per date and built
+# each point through `DataFrame.to_dict`. Both are checked to produce the same map
+# data in web/server/query/visualizations/test_map.py.
+#
+# Usage:
+#   ./scripts/benchmark_map_response.py --locations 5000 --days 365
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+from pylib.base.flags import Flags
+
+from log import LOG
+from web.server.query.visualizations.base import TIMESTAMP_COLUMN
+from web.server.query.visualizations.map import (
+    LAT_FIELD,
+    LNG_FIELD,
+    ZERO_VAL,
+    build_dated_map_data,
+)
+
+DIMENSION_NAMES = ['RegionName', 'FacilityName']
+LAT_LNG_FIELDS = ['FacilityLat', 'FacilityLon']
+
+
+def build_legacy_dated_map_data(df, dimension_names, numeric_fields, lat_lng_fields):
+    '''Previous implementation of the Map.build_response date grouping.'''
+    (lat_field, lng_field) = lat_lng_fields
+
+    class MapDataPoint(dict):
+        def __init__(self, values):
+            raw_dict = dict(values)
+            lat = raw_dict.get(lat_field)
+            lng = raw_dict.get(lng_field)
+            super().__init__(
+                {
+                    'dimensions': {name: raw_dict[name] for name in dimension_names},
+                    'metrics': {field: raw_dict[field] for field in numeric_fields},
+                    LAT_FIELD: lat if lat and lat != ZERO_VAL else 0,
+                    LNG_FIELD: lng if lng and lng != ZERO_VAL else 0,
+                }
+            )
+
+    data = []
+    for date in sorted(df[TIMESTAMP_COLUMN].unique()):
+        dated_df = df[df[TIMESTAMP_COLUMN] == date]
+        data.append(
+            {'date': date, 'datedData': dated_df.to_dict('records', MapDataPoint)}
+        )
+    return data
+
+
+def build_synthetic_frame(location_count, day_count, field_count):
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2021-01-01', periods=day_count).strftime('%Y-%m-%d')
+    facilities = np.array([f'Facility {idx}' for idx in range(location_count)])
+    regions = np.array([f'Region {idx % 20}' for idx in range(location_count)])
+    lats = rng.uniform(-10, 10, location_count).round(4).astype(str)
+    lngs = rng.uniform(30, 50, location_count).round(4).astype(str)
+    lats[::50] = ZERO_VAL
+
+    row_count = location_count * day_count
+    columns = {
+        'RegionName': np.tile(regions, day_count),
+        'FacilityName': np.tile(facilities, day_count),
+        'FacilityLat': np.tile(lats, day_count),
+        'FacilityLon': np.tile(lngs, day_count),
+    }
+    numeric_fields = []
+    for idx in range(field_count):
+        field_id = f'field_{idx}'
+        numeric_fields.append(field_id)
+        columns[field_id] = rng.random(row_count)
+    columns[TIMESTAMP_COLUMN] = np.repeat(
+        np.asarray(dates, dtype=object), location_count
+    )
+    return (pd.DataFrame(columns), numeric_fields)
+
+
+def main():
+    Flags.PARSER.add_argument(
+        '--locations', type=int, default=5000, help='Number of locations per day'
+    )
+    Flags.PARSER.add_argument(
+        '--days', type=int, default=365, help='Number of days in the frame'
+    )
+    Flags.PARSER.add_argument(
+        '--fields', type=int, default=2, help='Number of numeric fields'
+    )
+    Flags.PARSER.add_argument(
+        '--repeat', type=int, default=3, help='Number of timed runs per implementation'
+    )
+    Flags.InitArgs()
+
+    (df, numeric_fields) = build_synthetic_frame(
+        Flags.ARGS.locations, Flags.ARGS.days, Flags.ARGS.fields
+    )
+    # Shuffle the rows so the grouping cannot rely on the input being sorted.
+    df = df.sample(frac=1, random_state=0)
+    LOG.info('Built synthetic frame with %s rows', len(df))
+
+    args = (df, DIMENSION_NAMES, numeric_fields, LAT_LNG_FIELDS)
+    for (name, implementation) in (
+        ('legacy', build_legacy_dated_map_data),
+        ('columnar', build_dated_map_data),
+    ):
+        timings = timeit.repeat(
+            lambda: implementation(*args), number=1, repeat=Flags.ARGS.repeat
+        )
+        LOG.info('%s: best of %s runs: %.2fs', name, len(timings), min(timings))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
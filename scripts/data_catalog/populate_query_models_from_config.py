@@ -74,7 +74,9 @@ from web.server.app import (
     initialize_druid_context,
 )
 from web.server.data.data_access import Transaction
+from web.server.data.dimension_metadata import ENABLE_FIELD_METADATA_QUERY
 from web.server.data.druid_context import PopulatingDruidApplicationContext
+from web.server.data.population_util import DEFAULT_POPULATION_PARALLELISM
 from util.local_script_wrapper import local_main_wrapper
 
 
@@ -241,6 +243,14 @@ def main() -> None:
         default=False,
         help='Only populate dimension- and datasource-related tables.',
     )
+    parser.add_argument(
+        '--parallelism',
+        type=int,
+        required=False,
+        default=DEFAULT_POPULATION_PARALLELISM,
+        help='Number of Druid queries to run at the same time when computing '
+        'dimension metadata.',
+    )
     args = parser.parse_args()
 
     app = current_app
@@ -250,6 +260,7 @@ def main() -> None:
         datasource_config='LATEST_DATASOURCE',
         cls=PopulatingDruidApplicationContext,
         skip_grouped_sketch_sizes=True,
+        population_parallelism=args.parallelism,
     )
 
     # Use config files to generate mock query model data
@@ -260,7 +271,11 @@ def main() -> None:
         aggregation.CALENDAR_SETTINGS,
         aggregation_rules.CALCULATIONS_FOR_FIELD,
         calculated_indicators.CALCULATED_INDICATOR_CONSTITUENTS,
-        app.druid_context.dimension_metadata.field_metadata,
+        (
+            app.druid_context.dimension_metadata.field_metadata
+            if ENABLE_FIELD_METADATA_QUERY
+            else None
+        ),
     )
     LOG.info('Finished generating Query mock data')
 
@@ -4,6 +4,7 @@ import sys
 from pylib.base.flags import Flags
 
 from db.druid.update_db_datasource import update_db_datasource
+from web.server.data.population_util import DEFAULT_POPULATION_PARALLELISM
 from util.local_script_wrapper import local_main_wrapper
 
 
@@ -26,12 +27,21 @@ def setup_arguments() -> None:
         help='Whether to optimize the sketch sizes for high cardinality dimensions by '
         'calculating the sketch sizes needed for multiple dimensions at once',
     )
+    Flags.PARSER.add_argument(
+        '--parallelism',
+        type=int,
+        default=DEFAULT_POPULATION_PARALLELISM,
+        required=False,
+        help='Number of Druid queries to run at the same time when computing '
+        'dimension values and sketch sizes',
+    )
 
 
 def main() -> int:
     update_db_datasource(
         None if Flags.ARGS.all else (Flags.ARGS.datasource or 'LATEST_DATASOURCE'),
         Flags.ARGS.skip_grouped_sketch_sizes,
+        Flags.ARGS.parallelism,
     )
     return 0
 
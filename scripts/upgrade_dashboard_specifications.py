@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+'''Upgrade the stored specification of every dashboard to the latest schema version
+so that loading a dashboard no longer needs to run the schema upgrade functions.
+
+Dashboards are upgraded in batches. The specifications of each batch are upgraded
+in parallel worker processes and written back in a single transaction.
+'''
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from pylib.base.flags import Flags
+
+from log import LOG
+from models.alchemy.dashboard import Dashboard
+from models.python.dashboard.version import LATEST_VERSION
+from web.server.data.data_access import Transaction
+from web.server.errors import BadDashboardSpecification
+from web.server.routes.views.dashboard import (
+    format_and_upgrade_specification,
+    write_upgraded_specification,
+)
+from util.local_script_wrapper import local_main_wrapper
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_PROCESSES = 4
+
+
+def setup_arguments() -> None:
+    Flags.PARSER.add_argument(
+        '--batch_size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        required=False,
+        help='Number of dashboards to upgrade and write back in each transaction',
+    )
+    Flags.PARSER.add_argument(
+        '--processes',
+        type=int,
+        default=DEFAULT_PROCESSES,
+        required=False,
+        help='Number of processes to upgrade specifications with',
+    )
+    Flags.PARSER.add_argument(
+        '--dry_run',
+        action='store_true',
+        default=False,
+        required=False,
+        help='Upgrade the specifications without writing them back',
+    )
+
+
+def upgrade_specification(
+    specification: Dict[str, Any]
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    '''Upgrade a dashboard specification. Returns a tuple of the upgraded
+    specification and the upgrade error message (if the upgrade failed).'''
+    try:
+        return (format_and_upgrade_specification(specification), None)
+    except BadDashboardSpecification as e:
+        return (None, ' '.join(error.message for error in e.dashboard_errors))
+
+
+def get_outdated_dashboard_ids(session) -> List[int]:
+    # pylint: disable=no-member
+    query = (
+        session.query(Dashboard.id)
+        .filter(Dashboard.specification['version'].astext != LATEST_VERSION)
+        .order_by(Dashboard.id)
+    )
+    return [dashboard_id for (dashboard_id,) in query]
+
+
+def upgrade_batch(
+    dashboard_ids: List[int], executor: ProcessPoolExecutor, dry_run: bool
+) -> Tuple[int, Dict[str, str]]:
+    '''Upgrade the dashboards in the batch. Returns the number of dashboards
+    upgraded and a mapping from slug to error message for the failed upgrades.'''
+    upgraded_count = 0
+    errors = {}
+    with Transaction() as transaction:
+        session = transaction.run_raw()
+        # pylint: disable=no-member
+        dashboards = (
+            session.query(Dashboard.id, Dashboard.slug, Dashboard.specification)
+            .filter(Dashboard.id.in_(dashboard_ids))
+            .all()
+        )
+        results = executor.map(
+            upgrade_specification,
+            [dict(dashboard.specification) for dashboard in dashboards],
+        )
+        for dashboard, (specification, error) in zip(dashboards, results):
+            if error is not None:
+                errors[dashboard.slug] = error
+                continue
+
+            if dry_run or write_upgraded_specification(
+                session,
+                dashboard.id,
+                dashboard.specification['version'],
+                specification,
+            ):
+                upgraded_count += 1
+            else:
+                LOG.info('Dashboard %s was edited during the upgrade', dashboard.slug)
+    return (upgraded_count, errors)
+
+
+def main() -> int:
+    batch_size = Flags.ARGS.batch_size
+    dry_run = Flags.ARGS.dry_run
+    with Transaction(read_only=True) as transaction:
+        dashboard_ids = get_outdated_dashboard_ids(transaction.run_raw())
+
+    dashboard_count = len(dashboard_ids)
+    LOG.info('Upgrading %s dashboards to version %s', dashboard_count, LATEST_VERSION)
+    upgraded_count = 0
+    errors: Dict[str, str] = {}
+
+    # NOTE: Using the spawn start method so that the worker processes do not
+    # inherit the database connections of this process.
+    with ProcessPoolExecutor(
+        max_workers=Flags.ARGS.processes,
+        mp_context=multiprocessing.get_context('spawn'),
+    ) as executor:
+        for start in range(0, dashboard_count, batch_size):
+            (batch_upgraded_count, batch_errors) = upgrade_batch(
+                dashboard_ids[start : start + batch_size], executor, dry_run
+            )
+            upgraded_count += batch_upgraded_count
+            errors.update(batch_errors)
+            LOG.info(
+                '%s of %s dashboards processed',
+                min(start + batch_size, dashboard_count),
+                dashboard_count,
+            )
+
+    for slug, error in errors.items():
+        LOG.error('Unable to upgrade dashboard %s: %s', slug, error)
+    LOG.info(
+        '%s %s dashboards. %s failed',
+        'Would have upgraded' if dry_run else 'Upgraded',
+        upgraded_count,
+        len(errors),
+    )
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(local_main_wrapper(main, setup_arguments))
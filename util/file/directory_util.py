@@ -1,9 +1,11 @@
+import hashlib
 import os
 import subprocess
 
 from pylib.file.file_utils import FileUtils
 
-FILE_HASH_COMMAND = 'shasum "%s" | cut -f1 -d" "'
+# Size of the blocks read when streaming a file through the hash function.
+FILE_HASH_READ_SIZE = 4 * 1024 * 1024
 
 # Compute a reasonably accurate file hash for gzip files by combining
 # the CRC-32 hash and the uncompressed file size
@@ -25,13 +27,21 @@ def compute_file_hash(filename):
     Compute a reliable hash for the given file.
     '''
     assert os.path.isfile(filename), f'Invalid file: {filename}'
-    base_cmd = FILE_HASH_COMMAND
     # Special case for gzip files since two gzip files with the same content
     # will have different sha hashes. Use the internal CRC hash computed during
     # gzipping
     if filename[-3:] == '.gz':
-        base_cmd = GZIP_HASH_COMMAND
-    return subprocess.check_output(base_cmd % filename, shell=True, text=True).strip()
+        return subprocess.check_output(
+            GZIP_HASH_COMMAND % filename, shell=True, text=True
+        ).strip()
+
+    # NOTE: This produces the same SHA-1 digest as the `shasum` command while
+    # streaming the file in fixed size blocks.
+    file_hash = hashlib.sha1()
+    with open(filename, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(FILE_HASH_READ_SIZE), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
 
 
 def compute_dir_hash(selected_dir):
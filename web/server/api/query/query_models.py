@@ -1,14 +1,11 @@
 # pylint: disable=C0103
 from functools import wraps
-from http.client import BAD_REQUEST, NOT_FOUND
-from queue import Queue
-from threading import Thread
+from http.client import BAD_REQUEST, NOT_FOUND, UNAUTHORIZED
 from typing import Any, Dict, Optional
 
-from flask import current_app, request as flask_request, Response
+from flask import current_app, request as flask_request, Response, stream_with_context
 from flask_potion import fields
 from flask_potion.routes import Route
-import rapidjson
 import related
 from werkzeug.exceptions import abort
 
@@ -31,12 +28,16 @@ from web.server.query.data_quality.outliers_table import OutliersTable
 from web.server.query.data_quality.reporting_completeness_line_graph import (
     ReportingCompletenessLineGraph,
 )
+from web.server.query.batch import BatchQuery, run_query_batch
 from web.server.query.request import QueryRequest
 from web.server.query.visualizations.bar_graph import BarGraphVisualization
 from web.server.query.visualizations.hierarchy import HierarchyVisualization
 from web.server.query.visualizations.line_graph import LineGraphVisualization
 from web.server.query.visualizations.map import Map
 from web.server.query.visualizations.table import TableVisualization
+from web.server.routes.views.query_policy import build_user_authorization_filter
+from web.server.security.permissions import SuperUserPermission
+from web.server.util.json_stream import stream_json
 
 FIELD_SCHEMA = fields.Object(
     properties={'id': fields.String(), 'calculation': CALCULATION_SCHEMA}
@@ -55,6 +56,55 @@ OUTLIERS_VISUALIZATION_REQUEST = fields.Object(
     properties={'queryRequest': QUERY_REQUEST, 'outlierType': fields.String()}
 )
 
+BATCH_QUERY_REQUEST = fields.Object(
+    properties={
+        'queries': fields.Array(
+            fields.Object(
+                properties={
+                    'id': fields.String(),
+                    'visualizationType': fields.String(),
+                    'queryRequest': QUERY_REQUEST,
+                }
+            )
+        )
+    }
+)
+
+
+def _build_map(query_request, query_client, datasource):
+    configuration_module = current_app.zen_config
+    return Map(
+        query_request,
+        query_client,
+        datasource,
+        configuration_module.aggregation.DIMENSION_PARENTS,
+        configuration_module.aggregation.GEO_TO_LATLNG_FIELD,
+        configuration_module.aggregation.GEO_FIELD_ORDERING,
+    )
+
+
+# Mapping from the visualization types that can be requested in a batch to the
+# function building the visualization and whether join queries are allowed. The
+# types match the names of the individual query routes.
+BATCH_VISUALIZATIONS = {
+    'bar_graph': (BarGraphVisualization, True),
+    'line_graph': (LineGraphVisualization, True),
+    'hierarchy': (HierarchyVisualization, False),
+    'map': (_build_map, True),
+    'table': (TableVisualization, True),
+    'data_quality_table': (DataQualityTable, False),
+    'reporting_completeness_line_graph': (ReportingCompletenessLineGraph, False),
+    'field_reporting_stats': (FieldReportingStatsQuery, False),
+}
+
+
+def _to_query_request(request, joins_allowed):
+    if joins_allowed:
+        return QueryRequest.polymorphic_to_model(request)
+    if request['type'] == 'JOIN':
+        abort(BAD_REQUEST, 'Join queries at this endpoint are unsupported')
+    return related.to_model(QueryRequest, request)
+
 
 def deserialize_query_request(
     joins_allowed: Optional[bool] = False, request_key: Optional[str] = None
@@ -71,12 +121,7 @@ def deserialize_query_request(
             else:
                 request = raw_request
 
-            if joins_allowed:
-                query_request = QueryRequest.polymorphic_to_model(request)
-            elif request['type'] == 'JOIN':
-                abort(BAD_REQUEST, 'Join queries at this endpoint are unsupported')
-            else:
-                query_request = related.to_model(QueryRequest, request)
+            query_request = _to_query_request(request, joins_allowed)
 
             if request_key is not None:
                 return endpoint(self, raw_request, query_request)
@@ -97,29 +142,35 @@ class QueryResource(PrincipalResource):
     @Route.POST('/bar_graph', schema=QUERY_REQUEST, response_schema=fields.Any())
     @deserialize_query_request(joins_allowed=True)
     def bar_graph(self, query_request):
-        return BarGraphVisualization(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-        ).get_response()
+        return current_app.query_result_cache.get_response(
+            BarGraphVisualization(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+            ),
+        )
 
     @Route.POST('/line_graph', schema=QUERY_REQUEST, response_schema=fields.Any())
     @deserialize_query_request(joins_allowed=True)
     def line_graph(self, query_request):
-        return LineGraphVisualization(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-        ).get_response()
+        return current_app.query_result_cache.get_response(
+            LineGraphVisualization(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+            ),
+        )
 
     @Route.POST('/hierarchy', schema=QUERY_REQUEST, response_schema=fields.Any())
     @deserialize_query_request()
     def hierarchy(self, query_request):
-        return HierarchyVisualization(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-        ).get_response()
+        return current_app.query_result_cache.get_response(
+            HierarchyVisualization(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+            ),
+        )
 
     @Route.POST('/map', schema=QUERY_REQUEST, response_schema=fields.Any())
     @deserialize_query_request(joins_allowed=True)
@@ -129,14 +180,16 @@ class QueryResource(PrincipalResource):
         geo_to_lat_lng = configuration_module.aggregation.GEO_TO_LATLNG_FIELD
         dimension_parents = configuration_module.aggregation.DIMENSION_PARENTS
 
-        return Map(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-            dimension_parents,
-            geo_to_lat_lng,
-            geo_field_ordering,
-        ).get_response()
+        return current_app.query_result_cache.get_response(
+            Map(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+                dimension_parents,
+                geo_to_lat_lng,
+                geo_field_ordering,
+            ),
+        )
 
     def _table(self, request, disaggregated):
         raw_response = TableVisualization(
@@ -146,49 +199,21 @@ class QueryResource(PrincipalResource):
         ).get_response()
 
         if disaggregated:
-            return {
+            raw_response = {
                 'fields': raw_response['fields'],
-                'data': [
+                'data': (
                     point
                     for point in raw_response['data']
                     if any(point[field] is not None for field in raw_response['fields'])
-                ],
+                ),
             }
 
         # We want to stream the response to put data on wire faster and also to reduce memory
-        # footprint of having full serialized response in the memory. To achieve that we use
-        # `rapidjson`'s ability to stream the serialized data, but it's blocking, so to resolve
-        # it we run serialization in a thread and use this `Queue` to communicate between the
-        # serializer thread and producer thread (which is running the generator `serialize_thread`
-        queue = Queue()
-
-        class QueuedStream:
-            def __init__(self, queue):
-                self.queue = queue
-                self.buffer = b''
-
-            def write(self, value):
-                self.queue.put(value)
-
-            def close(self):
-                if self.buffer:
-                    self.queue.put(self.buffer)
-                self.queue.put(None)
-
-        dump_stream = QueuedStream(queue)
-
-        def serialize_thread(result, dump_stream):
-            # pylint: disable=c-extension-no-member
-            rapidjson.dump(result, dump_stream)
-            dump_stream.close()
-
-        Thread(target=serialize_thread, args=(raw_response, dump_stream)).run()
-
-        def response_stream(queue):
-            while chunk := queue.get():
-                yield chunk
-
-        return Response(response_stream(queue))
+        # footprint of having full serialized response in the memory. The table rows are
+        # built lazily by a generator and serialized on a separate thread, so rows are
+        # sent while later rows are still being produced. The serialized chunks are
+        # passed through a bounded buffer so memory use does not grow with the result.
+        return Response(stream_json(raw_response), mimetype='application/json')
 
     @Route.POST(
         '/table',
@@ -268,13 +293,16 @@ class QueryResource(PrincipalResource):
         # Data quality currently only queries one field at a time
         field_id = raw_field_to_query.id
 
-        data_quality_response = DataQualityReport(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-            geo_to_lat_lng,
-            dimension_parents,
-        ).get_response(include_outliers)
+        data_quality_response = current_app.query_result_cache.get_response(
+            DataQualityReport(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+                geo_to_lat_lng,
+                dimension_parents,
+            ),
+            include_outliers,
+        )
 
         return {'dataQuality': data_quality_response[field_id]}
 
@@ -283,11 +311,13 @@ class QueryResource(PrincipalResource):
     )
     @deserialize_query_request()
     def data_quality_table(self, query_request):
-        return DataQualityTable(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-        ).get_response()
+        return current_app.query_result_cache.get_response(
+            DataQualityTable(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+            ),
+        )
 
     @Route.POST(
         '/reporting_completeness_line_graph',
@@ -296,11 +326,13 @@ class QueryResource(PrincipalResource):
     )
     @deserialize_query_request()
     def reporting_completeness_line_graph(self, query_request):
-        return ReportingCompletenessLineGraph(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-        ).get_response()
+        return current_app.query_result_cache.get_response(
+            ReportingCompletenessLineGraph(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+            ),
+        )
 
     @Route.POST(
         '/outliers_box_plot',
@@ -309,12 +341,14 @@ class QueryResource(PrincipalResource):
     )
     @deserialize_query_request(request_key='queryRequest')
     def outliers_box_plot(self, raw_request, query_request):
-        return OutliersBoxPlot(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-            raw_request['outlierType'],
-        ).get_response()
+        return current_app.query_result_cache.get_response(
+            OutliersBoxPlot(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+                raw_request['outlierType'],
+            ),
+        )
 
     @Route.POST(
         '/outliers_line_graph',
@@ -323,12 +357,14 @@ class QueryResource(PrincipalResource):
     )
     @deserialize_query_request(request_key='queryRequest')
     def outliers_line_graph(self, raw_request, query_request):
-        return OutliersLineGraph(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-            raw_request['outlierType'],
-        ).get_response()
+        return current_app.query_result_cache.get_response(
+            OutliersLineGraph(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+                raw_request['outlierType'],
+            ),
+        )
 
     @Route.POST(
         '/outliers_table',
@@ -337,23 +373,78 @@ class QueryResource(PrincipalResource):
     )
     @deserialize_query_request(request_key='queryRequest')
     def outliers_table(self, raw_request, query_request):
-        return OutliersTable(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-            raw_request['outlierType'],
-        ).get_response()
+        return current_app.query_result_cache.get_response(
+            OutliersTable(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+                raw_request['outlierType'],
+            ),
+        )
 
     @Route.POST(
         '/field_reporting_stats', schema=QUERY_REQUEST, response_schema=fields.Any()
     )
     @deserialize_query_request()
     def field_reporting_stats(self, query_request):
-        return FieldReportingStatsQuery(
-            query_request,
-            current_app.query_client,
-            current_app.druid_context.current_datasource,
-        ).get_response()
+        return current_app.query_result_cache.get_response(
+            FieldReportingStatsQuery(
+                query_request,
+                current_app.query_client,
+                current_app.druid_context.current_datasource,
+            ),
+        )
+
+    @Route.POST(
+        '/batch',
+        schema=BATCH_QUERY_REQUEST,
+        response_schema=fields.Any(),
+        format_response=False,
+    )
+    def batch(self, raw_request):
+        '''Run several visualization queries (like the tiles of a dashboard) from a
+        single request. The user's query policies are resolved once for the whole
+        batch, the queries run concurrently, and each result is streamed back as a
+        line of newline-delimited JSON (`{"id": ..., "result": ...}`) as soon as it
+        is ready.
+        '''
+        authorization_filter = build_user_authorization_filter()
+        query_client = current_app.query_client.with_authorization_filter(
+            authorization_filter
+        )
+        datasource = current_app.druid_context.current_datasource
+
+        queries = []
+        for raw_query in raw_request['queries']:
+            visualization_type = raw_query['visualizationType']
+            if visualization_type not in BATCH_VISUALIZATIONS:
+                abort(
+                    BAD_REQUEST,
+                    f'Unsupported batch visualization type: {visualization_type}',
+                )
+
+            (build_visualization, joins_allowed) = BATCH_VISUALIZATIONS[
+                visualization_type
+            ]
+            query_request = _to_query_request(raw_query['queryRequest'], joins_allowed)
+            queries.append(
+                BatchQuery(
+                    raw_query['id'],
+                    build_visualization(query_request, query_client, datasource),
+                )
+            )
+
+        return Response(
+            stream_with_context(run_query_batch(queries, authorization_filter)),
+            mimetype='application/x-ndjson',
+        )
+
+    @Route.GET('/cache_stats', response_schema=fields.Any())
+    def cache_stats(self):
+        # only allow admins access to this functionality
+        if SuperUserPermission().can():
+            return current_app.query_result_cache.stats()
+        return None, UNAUTHORIZED
 
 
 RESOURCE_TYPES = [QueryResource]
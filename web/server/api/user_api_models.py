@@ -35,6 +35,7 @@ from web.server.routes.views.authorization import (
     AuthorizedOperation,
 )
 from web.server.routes.views.admin import send_reset_password
+from web.server.routes.views.query_policy import invalidate_authorization_filter_cache
 from web.server.api.user_api_schemas import (
     FRONTEND_USER_UPDATE_SCHEMA,
     INVITE_OBJECT_SCHEMA,
@@ -393,6 +394,7 @@ def invalidate_user_identity_cache(sender, role=None, group=None):
     user role change (deletion, addition)
     '''
     sender.get_permissions.delete_memoized()
+    invalidate_authorization_filter_cache(sender.id)
 
 
 RESOURCE_TYPES = [UserAclResource, UserResource]
@@ -26,6 +26,8 @@ from web.server.database.setup import (
 )
 from web.server.errors.error_handlers import register_for_error_events
 from web.server.migrations.util import RevisionStatus
+from web.server.query.offload_pool import QueryOffloadPool
+from web.server.query.result_cache import QueryResultCache
 from web.server.routes.views.query_policy import AuthorizedQueryClient
 from web.server.security.signal_handlers import register_for_signals
 from web.server.util.template_renderer import (
@@ -181,6 +183,22 @@ def _initialize_authorized_druid_client(app):
     app.query_client = AuthorizedQueryClient(app.query_client)
 
 
+def _initialize_query_result_cache(app):
+    app.query_result_cache = QueryResultCache(
+        app.cache, app.config.get('QUERY_DATA_CACHE_TIMEOUT')
+    )
+
+
+def _initialize_query_offload_pool(app, db):
+    # NOTE: The offload processes are forked from the server process, so they
+    # must not reuse its database connections.
+    app.query_offload_pool = QueryOffloadPool(
+        app,
+        app.config.get('QUERY_OFFLOAD_PROCESSES', 0),
+        initializer=lambda: db.engine.dispose(),
+    )
+
+
 def _create_app_internal(
     flask_config, instance_configuration, skip_db_check, force_druid_db_update
 ):
@@ -217,6 +235,8 @@ def _create_app_internal(
             _initialize_email_renderer(app)
             initialize_druid_context(app, datasource_config=None)
             _initialize_authorized_druid_client(app)
+            _initialize_query_result_cache(app)
+            _initialize_query_offload_pool(app, db)
             _initialize_query_data(app)
             _initialize_celery(app, instance_configuration)
             _initialize_notification_service(app, instance_configuration)
@@ -1,17 +1,51 @@
 from flask_caching import Cache
 
+REDIS_CACHE_TYPE = 'RedisCache'
+
+
+def _build_redis_client(cache_cfg):
+    '''Build a Redis client from the flask-caching Redis settings.'''
+    # NOTE: Deferring the import since Redis is not needed when developers
+    # use the filesystem cache.
+    # pylint: disable=import-outside-toplevel
+    import redis
+
+    redis_url = cache_cfg.get('CACHE_REDIS_URL')
+    if redis_url:
+        return redis.from_url(redis_url, db=cache_cfg.get('CACHE_REDIS_DB', 0))
+    return redis.Redis(
+        host=cache_cfg.get('CACHE_REDIS_HOST', 'localhost'),
+        port=cache_cfg.get('CACHE_REDIS_PORT', 6379),
+        password=cache_cfg.get('CACHE_REDIS_PASSWORD'),
+        db=cache_cfg.get('CACHE_REDIS_DB', 0),
+    )
+
 
 def initialize_cache(app):
     default_cfg = app.config['CACHES'].get('default')
     if not default_cfg:
         raise ValueError('CACHES must contain "default"')
+
+    # When the default cache is backed by Redis, its client is created here and
+    # passed to flask-caching as the cache host (which accepts a Redis client
+    # instance). This lets features the cache API does not cover, like pub/sub,
+    # share the cache's connection without reaching into the cache internals.
+    redis_client = None
+    default_cache_cfg = default_cfg
+    if default_cfg.get('CACHE_TYPE') == REDIS_CACHE_TYPE:
+        redis_client = _build_redis_client(default_cfg)
+        default_cache_cfg = {**default_cfg, 'CACHE_REDIS_HOST': redis_client}
+        default_cache_cfg.pop('CACHE_REDIS_URL', None)
+
     caches = {}
     default = None
     for alias in app.config['CACHES']:
         if alias != 'default':
-            caches[alias] = Cache(app, config=app.config['CACHES'][alias])
             if default_cfg is app.config['CACHES'][alias]:
-                default = caches[alias]
-    caches['default'] = default or Cache(app, config=default_cfg)
+                default = caches[alias] = Cache(app, config=default_cache_cfg)
+            else:
+                caches[alias] = Cache(app, config=app.config['CACHES'][alias])
+    caches['default'] = default or Cache(app, config=default_cache_cfg)
     app.caches = caches
     app.cache = caches['default']
+    app.redis_client = redis_client
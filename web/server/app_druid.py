@@ -1,9 +1,17 @@
 import os
 
 from db.druid.config import construct_druid_configuration
-from db.druid.query_client import DruidQueryClient_, DruidQueryRunner
+from db.druid.query_client import (
+    DEFAULT_MAX_CONCURRENT_QUERIES,
+    DruidQueryClient_,
+    DruidQueryRunner,
+)
 from db.druid.metadata import AbstractDruidMetadata, DruidMetadata_
-from web.server.data.druid_context import DruidApplicationContext
+from web.server.data.druid_context import (
+    DEFAULT_METADATA_REFRESH_INTERVAL,
+    DruidApplicationContext,
+)
+from web.server.data.population_util import DEFAULT_POPULATION_PARALLELISM
 from web.server.environment import OFFLINE_MODE
 from util.offline_mode import (
     MockDruidQueryClient,
@@ -18,6 +26,9 @@ def initialize_druid_context(
     # This should only be set if the cls is PopulatingDruidApplicationContext.
     # Otherwise, it's not used.
     skip_grouped_sketch_sizes: bool = False,
+    # Number of Druid queries to run at the same time when populating metadata.
+    # Like `skip_grouped_sketch_sizes`, only used by PopulatingDruidApplicationContext.
+    population_parallelism: int = DEFAULT_POPULATION_PARALLELISM,
 ):
     zen_configuration = app.zen_config
     # Pulling Data from Zen_Config Module
@@ -25,7 +36,13 @@ def initialize_druid_context(
     deployment_name = zen_configuration.general.DEPLOYMENT_NAME
 
     druid_configuration = construct_druid_configuration(druid_host)
-    system_query_client: DruidQueryRunner = DruidQueryClient_(druid_configuration)
+    system_query_client: DruidQueryRunner = DruidQueryClient_(
+        druid_configuration,
+        query_timeout=app.config.get('DRUID_QUERY_TIMEOUT'),
+        max_concurrent_queries=app.config.get(
+            'DRUID_MAX_CONCURRENT_QUERIES', DEFAULT_MAX_CONCURRENT_QUERIES
+        ),
+    )
     druid_metadata: AbstractDruidMetadata = DruidMetadata_(
         druid_configuration, system_query_client
     )
@@ -49,6 +66,10 @@ def initialize_druid_context(
         druid_configuration,
         datasource_config,
         skip_grouped_sketch_sizes,
+        metadata_refresh_interval=app.config.get(
+            'DATASOURCE_METADATA_REFRESH_INTERVAL', DEFAULT_METADATA_REFRESH_INTERVAL
+        ),
+        population_parallelism=population_parallelism,
     )
     app.query_client = app.system_query_client = system_query_client
 
@@ -3,6 +3,9 @@ from os import getenv
 
 DEFAULT_BROKER_URL = 'redis://redis:6379/'
 
+# How often dashboard thumbnails are pre-rendered in the background.
+PRERENDER_THUMBNAILS_INTERVAL_SEC = 3600
+
 
 def get_broker_url():
     redis_host = getenv('REDIS_HOST')
@@ -19,6 +22,12 @@ class CeleryConfig:
     task_serializer = 'json'
     result_serializer = 'json'
     MAILGUN_URL = 'https://api.mailgun.net/v3/{0}/messages'
-    TASKS_LIST = ['web.server.tasks.notifications']
+    TASKS_LIST = ['web.server.tasks.notifications', 'web.server.tasks.thumbnails']
     CELERY_ENABLE_UTC = True
     task_track_started = True
+    beat_schedule = {
+        'prerender-thumbnails': {
+            'task': 'prerender_thumbnails_task',
+            'schedule': PRERENDER_THUMBNAILS_INTERVAL_SEC,
+        },
+    }
@@ -167,6 +167,25 @@ class FlaskConfiguration:
             self.CACHES['default'] = self.CACHES['fs']
 
         self.QUERY_DATA_CACHE_TIMEOUT = 86400  # 1 day, is it the best value?
+        # Maximum number of seconds a single Druid query can run for. If unset,
+        # queries can run until Druid's own timeout is reached.
+        self.DRUID_QUERY_TIMEOUT = None
+        # Maximum number of Druid queries the system query client runs
+        # concurrently for a single process.
+        self.DRUID_MAX_CONCURRENT_QUERIES = 8
+        # Minimum number of seconds between checks for a new version of the
+        # current datasource's metadata.
+        self.DATASOURCE_METADATA_REFRESH_INTERVAL = 60
+        # Number of worker processes each server process starts to build query
+        # responses in, so that CPU heavy responses do not block the other requests
+        # served by the same gevent worker. Zero builds responses in process.
+        self.QUERY_OFFLOAD_PROCESSES = int(getenv('QUERY_OFFLOAD_PROCESSES', '0'))
+        # Minimum number of fields a query must sum over for it to be rewritten to
+        # group on the field dimension instead of computing one filtered aggregation
+        # per field. Zero disables the rewrite.
+        self.QUERY_FIELD_PIVOT_MIN_FIELDS = int(
+            getenv('QUERY_FIELD_PIVOT_MIN_FIELDS', '0')
+        )
 
         self.HASURA_HOST = getenv(
             'HASURA_HOST',
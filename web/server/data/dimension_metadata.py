@@ -7,6 +7,7 @@ from typing import Dict, Optional
 
 from pydruid.utils.aggregators import (
     build_aggregators,
+    count,
     filtered as filtered_aggregator,
     longmax,
     longmin,
@@ -21,22 +22,25 @@ from web.server.data.data_access import Transaction
 from web.server.data.dimension_metadata_util.compute_sketch_sizes import (
     compute_sketch_sizes,
 )
+from web.server.data.population_util import DEFAULT_POPULATION_PARALLELISM
 
-# When enabled, metadata for each raw field ID in the druid datasource will be
-# collected. This includes first/last event timestamp, the number of rows this field is
-# present in, and the non-null dimensions that exist for the field.
+# When enabled, the dimensions each field supports in the query models are restricted
+# to the non-null dimensions found for the field's raw field IDs in the field metadata.
+# NOTE: The field metadata itself is always collected when a datasource is
+# populated since it is used to describe fields without querying Druid.
 ENABLE_FIELD_METADATA_QUERY = False
 
 
 def create_field_metadata_query(datasource_name, dimensions, intervals):
     # NOTE: Sorting the dimensions so that the query hash is deterministic.
     aggregators = {
-        dim: filtered_aggregator(DimensionFilter(dim) is not None, longsum('count'))
+        dim: filtered_aggregator(DimensionFilter(dim) != '', longsum('count'))
         for dim in sorted(dimensions)
     }
     aggregators['firstEvent'] = longmin('__time')
     aggregators['lastEvent'] = longmax('__time')
     aggregators['count'] = longsum('count')
+    aggregators['rowCount'] = count('count')
     # TODO: Could possibly count the number of days data is reported for and
     # use that to estimate reporting rate. Then DQL wouldn't have to deduce it each
     # time.
@@ -64,7 +68,8 @@ class DimensionMetadata:
             user groups by the specified dimension.
         field_metadata: For each raw field ID in the database, determine which dimensions are
                         supported for that field ID, how many data points it has, and when the
-                        first and last events were reported.
+                        first and last events were reported. Computed with a single query when
+                        the datasource is populated.
     '''
 
     sketch_sizes: Optional[Dict[str, int]] = None
@@ -77,39 +82,48 @@ class DimensionMetadata:
         self._loaded = False
 
     def fetch_field_metadata(self, dimensions, interval):
-        LOG.debug('Fetching field metadata')
-        query = create_field_metadata_query(self._datasource.name, dimensions, interval)
+        LOG.info('Fetching field metadata')
+        query = create_field_metadata_query(
+            self._datasource.name, dimensions, [interval]
+        )
         result = self._query_client.run_raw_query(query)
 
         output = {}
         for row in result:
             event = row['event']
             field_id = event[FIELD_NAME]
-            valid_dimensions = {
-                dimension for dimension in dimensions if event[dimension] > 0
-            }
+            # NOTE: Storing the dimensions as a sorted list so that the
+            # metadata can be serialized to the database.
+            valid_dimensions = sorted(
+                dimension for dimension in dimensions if event.get(dimension, 0) > 0
+            )
             output[field_id] = {
                 'dimensions': valid_dimensions,
                 'firstEvent': event['firstEvent'],
                 'lastEvent': event['lastEvent'],
                 'count': event['count'],
+                'rowCount': event['rowCount'],
             }
-        LOG.debug('Finished fetching field metadata')
+        LOG.info('Finished fetching field metadata for %s fields', len(output))
         return output
 
-    def load_dimension_metadata(self):
+    def load_dimension_metadata(self, db_datasource=None):
+        '''Load the stored metadata for the datasource. If the datasource's db row
+        has already been loaded it can be passed in to avoid querying for it again.
+        '''
         if self._loaded:
             return
 
-        with Transaction() as transaction:
-            session = transaction.run_raw()
-        db_datasource = (
-            session.query(DruidDatasource)
-            .filter(
-                DruidDatasource.datasource == self._datasource.name,
+        if db_datasource is None:
+            with Transaction() as transaction:
+                session = transaction.run_raw()
+            db_datasource = (
+                session.query(DruidDatasource)
+                .filter(
+                    DruidDatasource.datasource == self._datasource.name,
+                )
+                .first()
             )
-            .first()
-        )
         if db_datasource is None:
             # TODO: add directions how to populate the db
             raise ValueError('Could not load dimension metadata from the db')
@@ -123,6 +137,7 @@ class DimensionMetadata:
         dimension_id_map,
         interval,
         skip_grouped_sketch_sizes: bool,
+        parallelism: int = DEFAULT_POPULATION_PARALLELISM,
     ):
         """
         Evaluates dimension metadata and populates DB with them for further (re)use.
@@ -136,7 +151,6 @@ class DimensionMetadata:
         LOG.info(
             'Fetching dimension metadata for %s dimensions', len(queryable_dimensions)
         )
-        meta_data = {}
         (
             self.sketch_sizes,
             self.grouped_dimension_sketch_sizes,
@@ -147,11 +161,9 @@ class DimensionMetadata:
             sorted(queryable_dimensions),
             dimension_id_map,
             skip_grouped_sketch_sizes,
+            parallelism,
         )
 
-        if ENABLE_FIELD_METADATA_QUERY:
-            meta_data['field_metadata'] = self.fetch_field_metadata(
-                queryable_dimensions, interval
-            )
+        self.field_metadata = self.fetch_field_metadata(queryable_dimensions, interval)
         self._loaded = True
         LOG.info('Finished fetching dimension metadata')
@@ -1,6 +1,7 @@
 # mypy: disallow_untyped_defs=True
 import itertools
-from typing import Dict, List, Tuple
+from functools import partial
+from typing import Callable, Dict, Hashable, List, Tuple
 
 from pydruid.utils.aggregators import (
     build_aggregators,
@@ -12,6 +13,10 @@ from pydruid.utils.filters import Dimension as DimensionFilter
 from db.druid.post_aggregations.theta_sketch import bound_sketch_size
 from db.druid.query_client import DruidQueryClient
 from log import LOG
+from web.server.data.population_util import (
+    DEFAULT_POPULATION_PARALLELISM,
+    run_population_queries,
+)
 
 
 def build_sketch_size(approximate_cardinality: float) -> int:
@@ -54,24 +59,14 @@ def compute_dimension_sketch_sizes(
     intervals: List[str],
     dimensions: List[str],
     batch_size: int = 8,
+    parallelism: int = DEFAULT_POPULATION_PARALLELISM,
 ) -> Dict[str, int]:
     '''Calculate the minimum sketch size to use for each dimension provided that will
     ensure a thetaSketch calculation using that dimension will produce an *exact*
     distinct count.
     '''
-    output = {}
-
-    # Batch the dimensions to reduce the number of queries issued and improve
-    # performance.
-    it = iter(sorted(dimensions))
-    # NOTE: it how it used to work and should work after
-    # pipeline's python is upgraded
-    # while dimension_batch := list(itertools.islice(it, batch_size)):
-    while True:
-        dimension_batch = list(itertools.islice(it, batch_size))
-        if not dimension_batch:
-            break
 
+    def compute_batch_sketch_sizes(dimension_batch: List[str]) -> Dict[str, int]:
         response = query_client.run_raw_query(
             {
                 'dataSource': datasource_name,
@@ -84,11 +79,39 @@ def compute_dimension_sketch_sizes(
             }
         )
         result = response[0]['result'] if response else {}
+        batch_output: Dict[str, int] = {}
         for dimension in dimension_batch:
             sketch_size = build_sketch_size(result.get(dimension, 0))
-            output[dimension] = sketch_size
+            batch_output[dimension] = sketch_size
             LOG.debug('Sketch size %s for dimension %s', sketch_size, dimension)
+        return batch_output
 
+    # Batch the dimensions to reduce the number of queries issued and improve
+    # performance.
+    batches: List[List[str]] = []
+    it = iter(sorted(dimensions))
+    # NOTE: it how it used to work and should work after
+    # pipeline's python is upgraded
+    # while dimension_batch := list(itertools.islice(it, batch_size)):
+    while True:
+        dimension_batch = list(itertools.islice(it, batch_size))
+        if not dimension_batch:
+            break
+        batches.append(dimension_batch)
+
+    batch_results = run_population_queries(
+        {
+            ', '.join(dimension_batch): partial(
+                compute_batch_sketch_sizes, dimension_batch
+            )
+            for dimension_batch in batches
+        },
+        'Computing sketch sizes',
+        parallelism,
+    )
+    output = {}
+    for batch_output in batch_results.values():
+        output.update(batch_output)
     return output
 
 
@@ -98,6 +121,7 @@ def compute_eligible_high_cardinality_dimension_groupings(
     intervals: List[str],
     dimensions: List[str],
     high_cardinality_dimensions: List[str],
+    parallelism: int = DEFAULT_POPULATION_PARALLELISM,
 ) -> Dict[str, List[str]]:
     '''Determine which high cardinality dimensions have non-null values for each of the
     groupable dimensions provided. Returns a mapping from groupable dimension to the
@@ -115,7 +139,7 @@ def compute_eligible_high_cardinality_dimension_groupings(
             DimensionFilter(dimension) != '', longsum('count')
         )
 
-    for high_cardinality_dimension in high_cardinality_dimensions:
+    def compute_non_null_counts(high_cardinality_dimension: str) -> dict:
         response = query_client.run_raw_query(
             {
                 'queryType': 'timeseries',
@@ -139,8 +163,20 @@ def compute_eligible_high_cardinality_dimension_groupings(
                 ),
             }
         )
-        result = response[0]['result'] if response else {}
+        return response[0]['result'] if response else {}
 
+    results = run_population_queries(
+        {
+            high_cardinality_dimension: partial(
+                compute_non_null_counts, high_cardinality_dimension
+            )
+            for high_cardinality_dimension in high_cardinality_dimensions
+        },
+        'Finding eligible dimension groupings',
+        parallelism,
+    )
+    for high_cardinality_dimension in high_cardinality_dimensions:
+        result = results[high_cardinality_dimension]
         for dimension in dimensions:
             if result.get(dimension, 0) > 0:
                 output[dimension].append(high_cardinality_dimension)
@@ -227,6 +263,7 @@ def compute_sketch_sizes_when_grouped(
     intervals: List[str],
     dimensions: List[str],
     high_cardinality_dimensions: List[str],
+    parallelism: int = DEFAULT_POPULATION_PARALLELISM,
 ) -> Dict[str, Dict[str, int]]:
     '''Calculate the maximum sketch size needed for a given high cardinality dimension
     when a query is grouped by at least one other dimension.
@@ -255,27 +292,18 @@ def compute_sketch_sizes_when_grouped(
     This method returns a dictionary mapping a dimension to a dictionary holding the
     sketch sizes that can be used for the high cardinality dimensions.
     '''
-    output = {}
     grouped_dimension_mapping = compute_eligible_high_cardinality_dimension_groupings(
         query_client,
         datasource_name,
         intervals,
         dimensions,
         high_cardinality_dimensions,
+        parallelism,
     )
 
-    # NOTE: Sorting the grouped dimensions so that the order that we fetch the
-    # metadata is the same across server restarts.
-    for grouped_dimension in sorted(grouped_dimension_mapping):
-        # NOTE: Sorting the high cardinality dimensions so that the query we
-        # run is identical across server restarts. If the query shape changes, we risk
-        # not being able to take advantage of Druid's cached values from previous runs.
-        eligible_high_cardinality_dimensions = sorted(
-            grouped_dimension_mapping[grouped_dimension]
-        )
-        if not eligible_high_cardinality_dimensions:
-            continue
-
+    def compute_grouped_sketch_sizes(
+        grouped_dimension: str, eligible_high_cardinality_dimensions: List[str]
+    ) -> Dict[str, int]:
         query = create_grouped_dimension_size_metadata_raw_query(
             datasource_name,
             intervals,
@@ -295,7 +323,30 @@ def compute_sketch_sizes_when_grouped(
                 sketch_sizes[high_cardinality_dimension] = build_sketch_size(
                     approximate_cardinality
                 )
+        return sketch_sizes
 
+    tasks: Dict[Hashable, Callable[[], Dict[str, int]]] = {}
+    # NOTE: Sorting the grouped dimensions so that the order that we fetch the
+    # metadata is the same across server restarts.
+    for grouped_dimension in sorted(grouped_dimension_mapping):
+        # NOTE: Sorting the high cardinality dimensions so that the query we
+        # run is identical across server restarts. If the query shape changes, we risk
+        # not being able to take advantage of Druid's cached values from previous runs.
+        eligible_high_cardinality_dimensions = sorted(
+            grouped_dimension_mapping[grouped_dimension]
+        )
+        if eligible_high_cardinality_dimensions:
+            tasks[grouped_dimension] = partial(
+                compute_grouped_sketch_sizes,
+                grouped_dimension,
+                eligible_high_cardinality_dimensions,
+            )
+
+    output = {}
+    grouped_results = run_population_queries(
+        tasks, 'Computing grouped sketch sizes', parallelism
+    )
+    for grouped_dimension, sketch_sizes in grouped_results.items():
         if sketch_sizes:
             LOG.debug(
                 'Optimized sketch sizes when grouping by dimension %s',
@@ -313,6 +364,7 @@ def compute_sketch_sizes(
     queryable_dimensions: List[str],
     dimension_id_map: Dict[str, str],
     skip_grouped_sketch_sizes: bool,
+    parallelism: int = DEFAULT_POPULATION_PARALLELISM,
 ) -> Tuple[Dict[str, int], Dict[str, Dict[str, int]]]:
     '''Calculate the minimum sketch size to use when querying for a dimension inside a
     theta or tuple sketch.
@@ -335,7 +387,11 @@ def compute_sketch_sizes(
 
     LOG.info('Building sketch sizes')
     sketch_sizes = compute_dimension_sketch_sizes(
-        query_client, datasource_name, intervals, sorted(sketch_dimensions)
+        query_client,
+        datasource_name,
+        intervals,
+        sorted(sketch_dimensions),
+        parallelism=parallelism,
     )
     LOG.info('Finished building sketch sizes')
 
@@ -359,6 +415,7 @@ def compute_sketch_sizes(
         intervals,
         queryable_dimensions,
         high_cardinality_dimensions,
+        parallelism,
     )
     LOG.info('Finished optimizing high cardinality dimension queries')
 
@@ -1,10 +1,15 @@
 from collections import defaultdict
+from functools import partial
 
 from pydruid.utils.filters import Dimension
 
 from config.druid_base import DEFAULT_DRUID_INTERVAL
 from db.druid.query_builder import GroupByQueryBuilder
 from log import LOG
+from web.server.data.population_util import (
+    DEFAULT_POPULATION_PARALLELISM,
+    run_population_queries,
+)
 from web.server.environment import OFFLINE_MODE
 from web.server.query.util import COUNT_AGGREGATION_NAME, COUNT_CALCULATION
 
@@ -42,11 +47,8 @@ class DimensionValuesLookup:
                 if dimension != '_all'
             ]
 
-    def load_dimensions_from_druid(self):
-        if self.dimension_map:
-            return
-
-        base_query = GroupByQueryBuilder(
+    def _build_dimension_query(self, dimension, dimensions):
+        query = GroupByQueryBuilder(
             datasource=self.datasource.name,
             granularity='all',
             grouping_fields=[],
@@ -54,45 +56,60 @@ class DimensionValuesLookup:
             calculation=COUNT_CALCULATION,
             optimize=False,
         )
-        for dimension in self.filter_dimensions:
-            dimensions = self.dimension_slices.get(dimension, [dimension])
-            base_query.dimensions = dimensions
-            # pylint: disable=singleton-comparison
-            base_query.query_filter = Dimension(dimension) != None
+        query.dimensions = dimensions
+        # pylint: disable=singleton-comparison
+        query.query_filter = Dimension(dimension) != None
+        return query
+
+    def _load_dimension_values(self, dimension):
+        dimensions = self.dimension_slices.get(dimension, [dimension])
+        LOG.info('Querying distinct %s from Druid...', dimensions)
+        query_result = self.query_client.run_query(
+            self._build_dimension_query(dimension, dimensions)
+        )
 
-            LOG.info('Querying distinct %s from Druid...', dimensions)
-            query_result = self.query_client.run_query(base_query)
+        output_rows = []
+        for row in query_result.result:
+            event = row['event']
+            output_row = dict(event)
+            del output_row[COUNT_AGGREGATION_NAME]
 
-            output_rows = []
-            for row in query_result.result:
-                event = row['event']
-                output_row = dict(event)
-                del output_row[COUNT_AGGREGATION_NAME]
+            # Create a display version of this dimension that includes
+            # the parent dimensions to help disambiguate dimension
+            # values that are the same with a different hierarchy
+            dimension_display = event[dimension]
+            num_dimensions = len(dimensions)
+            if num_dimensions > 1:
+                # NOTE: This logic matches logic used on the
+                # frontend in SelectFilter.jsx
+                start = num_dimensions - 1
+                disambiguation = [event[d] for d in dimensions[start::-1] if event[d]]
+                dimension_display = '%s (%s)' % (
+                    dimension_display,
+                    ', '.join(disambiguation),
+                )
 
-                # Create a display version of this dimension that includes
-                # the parent dimensions to help disambiguate dimension
-                # values that are the same with a different hierarchy
-                dimension_display = event[dimension]
-                num_dimensions = len(dimensions)
-                if num_dimensions > 1:
-                    # NOTE: This logic matches logic used on the
-                    # frontend in SelectFilter.jsx
-                    start = num_dimensions - 1
-                    disambiguation = [
-                        event[d] for d in dimensions[start::-1] if event[d]
-                    ]
-                    dimension_display = '%s (%s)' % (
-                        dimension_display,
-                        ', '.join(disambiguation),
-                    )
+            output_row[DISPLAY_FIELD] = dimension_display
+            output_rows.append(output_row)
 
-                output_row[DISPLAY_FIELD] = dimension_display
-                output_rows.append(output_row)
+        LOG.info('%s values loaded for dimension: %s', len(output_rows), dimension)
+        return sorted(output_rows, key=lambda a: a[DISPLAY_FIELD])
 
-            self.dimension_map[dimension] = sorted(
-                output_rows, key=lambda a: a[DISPLAY_FIELD]
-            )
+    def load_dimensions_from_druid(self, parallelism=DEFAULT_POPULATION_PARALLELISM):
+        if self.dimension_map:
+            return
 
-            LOG.info('%s values loaded for dimension: %s', len(output_rows), dimension)
+        # NOTE: Each dimension is queried separately so that the queries can be
+        # issued concurrently. The results are stored once all queries succeed so
+        # that a failure does not leave the lookup partially populated.
+        dimension_values = run_population_queries(
+            {
+                dimension: partial(self._load_dimension_values, dimension)
+                for dimension in self.filter_dimensions
+            },
+            'Loading dimension values',
+            parallelism,
+        )
+        self.dimension_map.update(dimension_values)
 
         LOG.info('Done preloading dimension values.')
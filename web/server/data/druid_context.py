@@ -1,5 +1,8 @@
+import os
+import time
 from functools import lru_cache
-from typing import Dict, Optional
+from threading import Lock, Thread
+from typing import Dict, Optional, Tuple
 
 from flask import current_app
 
@@ -16,14 +19,100 @@ from models.alchemy.query import DruidDatasource
 from web.server.configuration.settings import CUR_DATASOURCE_KEY, get_configuration
 from web.server.data.data_access import Transaction
 from web.server.data.dimension_values import DimensionValuesLookup
+from web.server.data.field_metadata import FieldMetadataIndex
+from web.server.data.population_util import DEFAULT_POPULATION_PARALLELISM
 from web.server.data.row_count import RowCountLookup
 from web.server.data.status import SourceStatus
 from web.server.data.time_boundary import DataTimeBoundary
 
+# Minimum number of seconds between checks for a new version of the current
+# datasource.
+DEFAULT_METADATA_REFRESH_INTERVAL = 60
+
+# Number of seconds the datasource rows are stored in the shared cache, so that all
+# server processes checking for a new datasource version share the same query.
+DATASOURCE_CACHE_TIMEOUT = 180
+
+
+def get_datasource_version(db_datasource: DruidDatasource) -> Tuple[str, object]:
+    return (db_datasource.datasource, db_datasource.last_modified)
+
+
+class DatasourceMetadataSnapshot:
+    '''The metadata for a single version of the current datasource. A snapshot is
+    built once per process for each version and is shared by all requests, so the
+    caches held by its lookups live for as long as the version is current.
+
+    The dimension metadata (and the field metadata index built from it) is only
+    loaded the first time it is used.
+    '''
+
+    def __init__(
+        self,
+        available_datasources: Dict[str, DruidDatasource],
+        db_datasource: DruidDatasource,
+        datasource: SiteDruidDatasource,
+        data_time_boundary: DataTimeBoundary,
+        row_count_lookup: RowCountLookup,
+        dimension_values_lookup: DimensionValuesLookup,
+        dimension_metadata,
+    ):
+        self.available_datasources = available_datasources
+        self.db_datasource = db_datasource
+        self.datasource = datasource
+        self.data_time_boundary = data_time_boundary
+        self.row_count_lookup = row_count_lookup
+        self.dimension_values_lookup = dimension_values_lookup
+        self.version = get_datasource_version(db_datasource)
+
+        self._dimension_metadata = dimension_metadata
+        self._field_metadata_index: Optional[FieldMetadataIndex] = None
+        self._dimension_metadata_lock = Lock()
+
+    def _load_dimension_metadata(self) -> FieldMetadataIndex:
+        field_metadata_index = self._field_metadata_index
+        if field_metadata_index is None:
+            with self._dimension_metadata_lock:
+                if self._field_metadata_index is None:
+                    self._dimension_metadata.load_dimension_metadata(self.db_datasource)
+                    self._field_metadata_index = FieldMetadataIndex(
+                        self._dimension_metadata.field_metadata
+                    )
+                field_metadata_index = self._field_metadata_index
+        return field_metadata_index
+
+    @property
+    def dimension_metadata(self):
+        self._load_dimension_metadata()
+        return self._dimension_metadata
+
+    @property
+    def field_metadata_index(self) -> FieldMetadataIndex:
+        return self._load_dimension_metadata()
+
+
+class _SnapshotState:
+    '''The metadata snapshot of a single process. The state is recreated after a
+    fork since the refresh thread and lock cannot be shared with the parent.'''
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = Lock()
+        self.snapshot: Optional[DatasourceMetadataSnapshot] = None
+        self.checked_at = 0.0
+        self.refreshing = False
+
 
 class DruidApplicationContext:
     '''A class that contains and produces metadata related to the currently
     loaded Druid datasource.
+
+    The metadata is stored in a per-process `DatasourceMetadataSnapshot` that is
+    built when the process first needs it. At most once every
+    `metadata_refresh_interval` seconds, a background thread checks whether the
+    selected datasource or its `last_modified` timestamp changed and, if so, builds
+    and swaps in a new snapshot. Requests keep using the previous snapshot while the
+    new one is built.
     '''
 
     def __init__(
@@ -34,6 +123,8 @@ class DruidApplicationContext:
         druid_port_configuration: BaseDruidConfig,
         datasource_config: Optional[str],
         skip_grouped_sketch_sizes: bool,
+        metadata_refresh_interval: float = DEFAULT_METADATA_REFRESH_INTERVAL,
+        population_parallelism: int = DEFAULT_POPULATION_PARALLELISM,
     ):
         self.druid_metadata = druid_metadata
         self.druid_port_configuration = druid_port_configuration
@@ -42,23 +133,118 @@ class DruidApplicationContext:
         self._query_client = query_client
         self._last_used_datasource: Optional[str] = None
         self._skip_grouped_sketch_sizes = skip_grouped_sketch_sizes
+        self._metadata_refresh_interval = metadata_refresh_interval
+        self._population_parallelism = population_parallelism
+        self._snapshot_state: Optional[_SnapshotState] = None
 
     @property
     def datasource_config(self):
         return self._datasource_config or get_configuration(CUR_DATASOURCE_KEY)
 
     def __repr__(self):
-        # Neccessary so `get_current_db_datasource` memoization varies with deployment
-        # as those use different databases and thus different datasources
+        # Neccessary so `_load_cached_available_datasources` memoization varies with
+        # deployment as those use different databases and thus different datasources
         return f'<{self.__class__.__name__} object for {self._deployment_name}>'
 
-    @lru_cache(1)
-    def _get_row_count_lookup(self, datasource):
+    def _get_snapshot_state(self) -> _SnapshotState:
+        state = self._snapshot_state
+        if state is None or state.pid != os.getpid():
+            state = self._snapshot_state = _SnapshotState()
+        return state
+
+    @property
+    def metadata_snapshot(self) -> DatasourceMetadataSnapshot:
+        state = self._get_snapshot_state()
+        snapshot = state.snapshot
+        if snapshot is None:
+            # NOTE: Requests that arrive while the first snapshot is being
+            # built wait for it instead of building their own.
+            with state.lock:
+                if state.snapshot is None:
+                    state.snapshot = self._build_metadata_snapshot()
+                    state.checked_at = time.monotonic()
+                return state.snapshot
+
+        if time.monotonic() - state.checked_at >= self._metadata_refresh_interval:
+            self._start_snapshot_refresh(state)
+        return snapshot
+
+    def _start_snapshot_refresh(self, state: _SnapshotState) -> None:
+        with state.lock:
+            if state.refreshing:
+                return
+            state.refreshing = True
+
+        # pylint: disable=protected-access
+        app = current_app._get_current_object()
+        Thread(
+            target=self._refresh_metadata_snapshot, args=(app, state), daemon=True
+        ).start()
+
+    def _refresh_metadata_snapshot(self, app, state: _SnapshotState) -> None:
+        try:
+            with app.app_context():
+                available_datasources = self._load_cached_available_datasources()
+                db_datasource = self._select_db_datasource(available_datasources)
+                if get_datasource_version(db_datasource) != state.snapshot.version:
+                    LOG.info(
+                        'Datasource version changed. Rebuilding metadata snapshot for %s',
+                        db_datasource.datasource,
+                    )
+                    state.snapshot = self._build_metadata_snapshot(
+                        available_datasources, db_datasource
+                    )
+                else:
+                    # The set of datasources can change without the current
+                    # datasource changing.
+                    state.snapshot.available_datasources = available_datasources
+        # NOTE: A failed refresh should never break requests. The previous
+        # snapshot is kept and the refresh is retried after the next interval.
+        # pylint: disable=broad-except
+        except Exception:
+            LOG.exception('Unable to refresh datasource metadata snapshot')
+        finally:
+            state.checked_at = time.monotonic()
+            state.refreshing = False
+
+    def _build_metadata_snapshot(
+        self,
+        available_datasources: Optional[Dict[str, DruidDatasource]] = None,
+        db_datasource: Optional[DruidDatasource] = None,
+    ) -> DatasourceMetadataSnapshot:
+        if available_datasources is None:
+            available_datasources = self._load_cached_available_datasources()
+        if db_datasource is None:
+            db_datasource = self._select_db_datasource(available_datasources)
+
+        datasource = SiteDruidDatasource.build(db_datasource.datasource)
+        data_time_boundary = DataTimeBoundary(
+            self._query_client,
+            datasource,
+            {
+                'timestamp': '',
+                'result': {
+                    'minTime': db_datasource.min_date.isoformat(),
+                    'maxTime': db_datasource.max_date.isoformat(),
+                },
+            },
+        )
+        return DatasourceMetadataSnapshot(
+            available_datasources,
+            db_datasource,
+            datasource,
+            data_time_boundary,
+            self._build_row_count_lookup(datasource),
+            self._build_dimension_values_lookup(datasource),
+            self._build_dimension_metadata(datasource),
+        )
+
+    def _build_row_count_lookup(self, datasource):
         return RowCountLookup(self._query_client, datasource)
 
     @property
     def row_count_lookup(self):
-        return self._get_row_count_lookup(self.current_datasource)
+        return self.metadata_snapshot.row_count_lookup
 
     @lru_cache(1)
     def _get_data_status_information(self, datasource):
@@ -77,21 +263,22 @@ class DruidApplicationContext:
 
     @property
     def data_time_boundary(self):
-        selected_datasource = self.current_db_datasource
-        return DataTimeBoundary(
-            self._query_client,
-            self.current_datasource,
-            {
-                'timestamp': '',
-                'result': {
-                    'minTime': selected_datasource.min_date.isoformat(),
-                    'maxTime': selected_datasource.max_date.isoformat(),
-                },
-            },
-        )
+        return self.metadata_snapshot.data_time_boundary
+
+    @property
+    def field_metadata_index(self) -> FieldMetadataIndex:
+        return self.metadata_snapshot.field_metadata_index
 
     @property
     def available_datasources(self) -> Dict[str, DruidDatasource]:
+        return self.metadata_snapshot.available_datasources
+
+    def _load_cached_available_datasources(self) -> Dict[str, DruidDatasource]:
+        return current_app.cache.memoize(timeout=DATASOURCE_CACHE_TIMEOUT)(
+            self._load_available_datasources
+        )()
+
+    def _load_available_datasources(self) -> Dict[str, DruidDatasource]:
         with Transaction() as transaction:
             druid_datasources = (
                 transaction.run_raw()
@@ -103,22 +290,19 @@ class DruidApplicationContext:
 
     @property
     def current_datasource(self) -> SiteDruidDatasource:
-        return SiteDruidDatasource.build(self.current_db_datasource.datasource)
+        return self.metadata_snapshot.datasource
 
     @property
     def current_db_datasource(self) -> DruidDatasource:
-        return self.get_current_db_datasource()
-
-    @property
-    def get_current_db_datasource(self):
-        return current_app.cache.memoize(timeout=180)(self._get_current_db_datasource)
+        return self.metadata_snapshot.db_datasource
 
-    def _get_current_db_datasource(self) -> DruidDatasource:
+    def _select_db_datasource(
+        self, available_datasources: Dict[str, DruidDatasource]
+    ) -> DruidDatasource:
         # If an admin selected 'LATEST_DATASOURCE' in the admin app, app will always
         # select the most recent datasource. Otherwise, we will use the datasource
         # the admin selected and default to most recent datasource if datasource
         # doesn't exist.
-        available_datasources = self.available_datasources
         datasource_config = self.datasource_config
         if datasource_config in available_datasources:
             datasource = available_datasources[datasource_config]
@@ -145,8 +329,7 @@ class DruidApplicationContext:
             self._last_used_datasource = datasource.datasource
         return datasource
 
-    @lru_cache(1)
-    def _get_dimension_values_lookup(self, datasource):
+    def _build_dimension_values_lookup(self, datasource):
         zen_configuration = current_app.zen_config
         return DimensionValuesLookup(
             self._query_client,
@@ -159,10 +342,9 @@ class DruidApplicationContext:
 
     @property
     def dimension_values_lookup(self):
-        return self._get_dimension_values_lookup(self.current_datasource)
+        return self.metadata_snapshot.dimension_values_lookup
 
-    @lru_cache(1)
-    def _get_dimension_metadata(self, datasource):
+    def _build_dimension_metadata(self, datasource):
         # NOTE: defer this import because pipelines still have python that
         # don't support walrus operator and parsing of some of the imports down
         # the road fails pipeline. Can be moved back to the top when pipelines are
@@ -174,9 +356,7 @@ class DruidApplicationContext:
 
     @property
     def dimension_metadata(self):
-        dimension_metadata = self._get_dimension_metadata(self.current_datasource)
-        dimension_metadata.load_dimension_metadata()
-        return dimension_metadata
+        return self.metadata_snapshot.dimension_metadata
 
 
 class PopulatingDruidApplicationContext(DruidApplicationContext):
@@ -186,10 +366,14 @@ class PopulatingDruidApplicationContext(DruidApplicationContext):
     # pylint: disable=invalid-overridden-method
     @cached_property
     def dimension_values_lookup(self):
-        dimension_values = super().dimension_values_lookup
-        dimension_values.load_dimensions_from_druid()
+        dimension_values = self._build_dimension_values_lookup(self.current_datasource)
+        dimension_values.load_dimensions_from_druid(self._population_parallelism)
         return dimension_values
 
+    @cached_property
+    def row_count_lookup(self):
+        return self._build_row_count_lookup(self.current_datasource)
+
     @cached_property
     def current_datasource(self):
         if self._datasource_config == 'LATEST_DATASOURCE':
@@ -206,12 +390,17 @@ class PopulatingDruidApplicationContext(DruidApplicationContext):
 
     @cached_property
     def dimension_metadata(self):
-        dimension_metadata = self._get_dimension_metadata(self.current_datasource)
+        dimension_metadata = self._build_dimension_metadata(self.current_datasource)
         dimension_metadata.populate_dimension_metadata(
             current_app.zen_config.aggregation.DIMENSION_CATEGORIES,
             current_app.zen_config.aggregation.DIMENSION_ID_MAP,
             # pylint: disable=no-member
             self.data_time_boundary.get_full_time_interval(),
             self._skip_grouped_sketch_sizes,
+            self._population_parallelism,
         )
         return dimension_metadata
+
+    @cached_property
+    def field_metadata_index(self):
+        return FieldMetadataIndex(self.dimension_metadata.field_metadata)
@@ -0,0 +1,109 @@
+# mypy: disallow_untyped_defs=True
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+from typing_extensions import TypedDict
+
+from pydruid.utils.filters import Filter
+
+from config.druid_base import FIELD_NAME
+from web.server.data.time_boundary import DateTimeInterval
+
+
+class FieldMetadataEntry(TypedDict):
+    # Dimensions that have a non-null value for at least one row of the field.
+    dimensions: List[str]
+    # Millisecond timestamps of the first and last event reported for the field.
+    firstEvent: int
+    lastEvent: int
+    # Sum of the ingested row `count` metric for the field.
+    count: int
+    # Number of Druid rows stored for the field.
+    rowCount: int
+
+
+def _get_filter_field_ids(druid_filter: dict) -> Optional[Set[str]]:
+    filter_type = druid_filter.get('type')
+    if 'extractionFn' in druid_filter:
+        return None
+    if filter_type == 'selector' and druid_filter.get('dimension') == FIELD_NAME:
+        return {druid_filter['value']}
+    if filter_type == 'in' and druid_filter.get('dimension') == FIELD_NAME:
+        return set(druid_filter['values'])
+    if filter_type == 'or':
+        output: Set[str] = set()
+        for child_filter in druid_filter['fields']:
+            child_field_ids = _get_filter_field_ids(child_filter)
+            if child_field_ids is None:
+                return None
+            output.update(child_field_ids)
+        return output
+    return None
+
+
+def get_filter_field_ids(query_filter: Optional[Filter]) -> Optional[Set[str]]:
+    '''Find the raw field IDs that the query filter matches. Returns None if the
+    filter matches anything other than exactly the rows of a set of raw field IDs,
+    since the field metadata can then not be used to describe the filtered rows.
+    '''
+    if query_filter is None:
+        return None
+    return _get_filter_field_ids(Filter.build_filter(query_filter))
+
+
+class FieldMetadataIndex:
+    '''In-memory index of the metadata for each raw field ID in a datasource. The
+    metadata is computed once per datasource when it is populated so that requests
+    describing a field do not need to query Druid.
+    '''
+
+    def __init__(self, field_metadata: Optional[Dict[str, FieldMetadataEntry]]):
+        self._field_metadata = field_metadata or {}
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._field_metadata)
+
+    def get_field_metadata(self, field_id: str) -> Optional[FieldMetadataEntry]:
+        return self._field_metadata.get(field_id)
+
+    def get_field_ids(self, query_filter: Optional[Filter]) -> Optional[Set[str]]:
+        '''Find the raw field IDs matched by the query filter. Returns None if the
+        index cannot be used to describe the filtered rows.
+        '''
+        if not self.loaded:
+            return None
+        return get_filter_field_ids(query_filter)
+
+    def _get_entries(self, field_ids: Iterable[str]) -> List[FieldMetadataEntry]:
+        # NOTE: Field IDs missing from the index have no data in the datasource.
+        return [
+            self._field_metadata[field_id]
+            for field_id in field_ids
+            if field_id in self._field_metadata
+        ]
+
+    def get_time_boundary(self, field_ids: Iterable[str]) -> Optional[DateTimeInterval]:
+        '''Returns the min/max timestamp across the given fields.'''
+        entries = self._get_entries(field_ids)
+        if not entries:
+            return None
+
+        return {
+            'min': datetime.utcfromtimestamp(
+                min(entry['firstEvent'] for entry in entries) / 1000.0
+            ),
+            'max': datetime.utcfromtimestamp(
+                max(entry['lastEvent'] for entry in entries) / 1000.0
+            ),
+        }
+
+    def get_row_count(self, field_ids: Iterable[str]) -> int:
+        '''Returns the number of Druid rows stored across the given fields.'''
+        return sum(entry['rowCount'] for entry in self._get_entries(field_ids))
+
+    def get_supported_dimensions(self, field_ids: Iterable[str]) -> Set[str]:
+        '''Returns the dimensions with non-null values for any of the given fields.'''
+        output: Set[str] = set()
+        for entry in self._get_entries(field_ids):
+            output.update(entry['dimensions'])
+        return output
@@ -0,0 +1,47 @@
+# mypy: disallow_untyped_defs=True
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Generic, Hashable, Optional, TypeVar
+
+ValueType = TypeVar('ValueType')
+
+# Default number of entries held by the metadata lookup caches.
+DEFAULT_LRU_CACHE_SIZE = 5000
+
+
+class LRUCache(Generic[ValueType]):
+    '''Thread safe, size bounded cache that evicts the least recently used entry
+    once `max_size` entries are stored.'''
+
+    def __init__(self, max_size: int = DEFAULT_LRU_CACHE_SIZE):
+        assert max_size > 0, 'Cache must be able to hold at least one entry'
+        self.max_size = max_size
+        self._entries: 'OrderedDict[Hashable, ValueType]' = OrderedDict()
+        self._lock = Lock()
+
+    def __contains__(self, key: Any) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self, key: Hashable, default: Optional[ValueType] = None
+    ) -> Optional[ValueType]:
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key: Hashable, value: ValueType) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
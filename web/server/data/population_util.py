@@ -0,0 +1,98 @@
+# mypy: disallow_untyped_defs=True
+import time
+from concurrent import futures
+from typing import Callable, Dict, Hashable, TypeVar
+
+import requests
+
+from db.druid.errors import DruidQueryCancelledError, DruidQueryError
+from log import LOG
+
+ResultType = TypeVar('ResultType')
+
+# Default number of Druid queries the metadata population jobs run at the same time.
+DEFAULT_POPULATION_PARALLELISM = 4
+
+# Number of times a failed population query is retried before giving up.
+DEFAULT_POPULATION_QUERY_RETRIES = 2
+
+# Number of seconds to wait before the first retry. The wait doubles for each
+# subsequent retry.
+POPULATION_RETRY_BACKOFF_SECONDS = 2.0
+
+
+def _run_with_retry(
+    key: Hashable,
+    task: Callable[[], ResultType],
+    description: str,
+    max_retries: int,
+) -> ResultType:
+    attempt = 0
+    while True:
+        try:
+            return task()
+        except DruidQueryCancelledError:
+            raise
+        except (DruidQueryError, requests.exceptions.RequestException):
+            if attempt >= max_retries:
+                raise
+            backoff = POPULATION_RETRY_BACKOFF_SECONDS * 2**attempt
+            attempt += 1
+            LOG.warning(
+                '%s for %s failed. Retrying in %.0fs (attempt %s of %s)',
+                description,
+                key,
+                backoff,
+                attempt,
+                max_retries,
+                exc_info=True,
+            )
+            time.sleep(backoff)
+
+
+def run_population_queries(
+    tasks: Dict[Hashable, Callable[[], ResultType]],
+    description: str,
+    parallelism: int = DEFAULT_POPULATION_PARALLELISM,
+    max_retries: int = DEFAULT_POPULATION_QUERY_RETRIES,
+) -> Dict[Hashable, ResultType]:
+    '''Run the Druid queries of a metadata population job. Each task is a function
+    taking no arguments that issues the queries for a single key (like a dimension)
+    and returns its result. At most `parallelism` tasks run at the same time and
+    failed tasks are retried up to `max_retries` times. Progress and timing are
+    logged for each key. Returns a mapping from key to task result.
+    '''
+    assert parallelism > 0, 'At least one population query must be able to run'
+    task_count = len(tasks)
+    output: Dict[Hashable, ResultType] = {}
+
+    def run_task(key: Hashable) -> ResultType:
+        start = time.perf_counter()
+        result = _run_with_retry(key, tasks[key], description, max_retries)
+        LOG.info(
+            '%s for %s finished in %.2fs', description, key, time.perf_counter() - start
+        )
+        return result
+
+    if parallelism == 1 or task_count <= 1:
+        for key in tasks:
+            output[key] = run_task(key)
+            LOG.info('%s: %s of %s complete', description, len(output), task_count)
+        return output
+
+    with futures.ThreadPoolExecutor(
+        max_workers=min(parallelism, task_count),
+        thread_name_prefix='druid-population',
+    ) as executor:
+        pending = {executor.submit(run_task, key): key for key in tasks}
+        try:
+            for future in futures.as_completed(pending):
+                output[pending[future]] = future.result()
+                LOG.info('%s: %s of %s complete', description, len(output), task_count)
+        finally:
+            # If a task failed, skip the tasks that have not started yet.
+            for future in pending:
+                future.cancel()
+
+    # Return the results in the same order as the tasks.
+    return {key: output[key] for key in tasks}
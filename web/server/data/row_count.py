@@ -1,4 +1,4 @@
-from collections import defaultdict
+from web.server.data.lru_cache import DEFAULT_LRU_CACHE_SIZE, LRUCache
 
 COUNT_QUERY = {
     'queryType': 'timeseries',
@@ -10,13 +10,18 @@ COUNT_QUERY = {
 
 
 class RowCountLookup:
-    def __init__(self, druid_query_client, datasource):
-        self.row_count_cache = defaultdict(int)
+    def __init__(
+        self, druid_query_client, datasource, cache_size=DEFAULT_LRU_CACHE_SIZE
+    ):
+        # Map from cache key to row count. Bounded since there is an entry for
+        # every field that has been requested.
+        self.row_count_cache = LRUCache(cache_size)
         self.datasource = datasource
         self.druid_query_client = druid_query_client
 
     def get_row_count(self, query_filter=None, cache_key=None):
-        if cache_key not in self.row_count_cache:
+        cached_output = self.row_count_cache.get(cache_key)
+        if cached_output is None:
             query = dict(COUNT_QUERY)
             query['dataSource'] = self.datasource.name
             if query_filter:
@@ -27,7 +32,7 @@ class RowCountLookup:
                 return 0
 
             output = int(result[0]['result']['count'])
-            if not cache_key:
-                return output
-            self.row_count_cache[cache_key] = output
-        return self.row_count_cache[cache_key]
+            if cache_key:
+                self.row_count_cache.set(cache_key, output)
+            return output
+        return cached_output
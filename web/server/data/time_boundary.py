@@ -1,6 +1,6 @@
 # mypy: disallow_untyped_defs=True
 from datetime import datetime, timedelta
-from typing import Dict, Optional, cast
+from typing import Optional, cast
 from typing_extensions import TypedDict
 
 from pydruid.utils.filters import Dimension as DimensionFilter
@@ -8,6 +8,7 @@ from db.druid.query_client import DruidQueryClient_
 from db.druid.util import DRUID_DATE_FORMAT, build_time_interval
 from db.druid.datasource import DruidDatasource
 from log import LOG
+from web.server.data.lru_cache import DEFAULT_LRU_CACHE_SIZE, LRUCache
 
 # The ISO8601 format to seconds precision for datetime.
 ISO_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
@@ -50,13 +51,15 @@ class DataTimeBoundary:
         query_client: DruidQueryClient_,
         datasource: DruidDatasource,
         time_boundary: Optional[TimeBoundaryQueryResult] = None,
+        cache_size: int = DEFAULT_LRU_CACHE_SIZE,
     ):
         self.datasource = datasource
         self.query_client = query_client
         self.time_boundary = time_boundary
 
-        # Map from cache key to response.
-        self.time_boundary_cache: Dict[str, DateTimeInterval] = {}
+        # Map from cache key to response. Bounded since there is an entry for every
+        # field and dimension value that has been requested.
+        self.time_boundary_cache: LRUCache[DateTimeInterval] = LRUCache(cache_size)
 
     def load_time_boundary_from_druid(self) -> None:
         """Set time_boundary to the event dict from the time boundary query"""
@@ -74,7 +77,8 @@ class DataTimeBoundary:
     def get_filtered_time_boundary(
         self, query_filter: DimensionFilter = None, cache_key: Optional[str] = None
     ) -> Optional[DateTimeInterval]:
-        if cache_key not in self.time_boundary_cache:
+        cached_output = self.time_boundary_cache.get(cache_key)
+        if cached_output is None:
             query = dict(construct_time_boundary_query(self.datasource.name))
             if query_filter:
                 query['filter'] = query_filter.build_filter()
@@ -88,10 +92,10 @@ class DataTimeBoundary:
                 'min': _datetime_from_iso(result[0]['result']['minTime']),
                 'max': _datetime_from_iso(result[0]['result']['maxTime']),
             }
-            if not cache_key:
-                return output
-            self.time_boundary_cache[cache_key] = output
-        return self.time_boundary_cache[cache_key]
+            if cache_key:
+                self.time_boundary_cache.set(cache_key, output)
+            return output
+        return cached_output
 
     def get_min_data_date(self) -> str:
         """Return a string of format YYYY-MM-DD that was the minimum data date."""
@@ -0,0 +1,76 @@
+# mypy: disallow_untyped_defs=True
+'''Run a batch of query visualizations (like all the tiles of a dashboard)
+concurrently from a single request.
+'''
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional
+
+import rapidjson
+from flask import copy_current_request_context, current_app
+from pydruid.utils.filters import Filter
+
+from log import LOG
+from web.server.query.visualizations.base import QueryBase
+
+
+class BatchQuery(NamedTuple):
+    # Caller supplied identifier used to match each result with its query.
+    id: str
+    visualization: QueryBase
+
+
+def _serialize_line(value: Any) -> str:
+    # pylint: disable=c-extension-no-member
+    return f'{rapidjson.dumps(value, default=str)}\n'
+
+
+def _iter_concurrently(query_client: Any, tasks: List[Any]) -> Iterator[Any]:
+    # NOTE: Query clients that cannot run tasks concurrently (like the
+    # offline mode client) run them serially.
+    if hasattr(query_client, 'iter_concurrently'):
+        yield from query_client.iter_concurrently(tasks)
+        return
+    for idx, task in enumerate(tasks):
+        yield (idx, task())
+
+
+def run_query_batch(
+    queries: List[BatchQuery], authorization_filter: Optional[Filter]
+) -> Iterator[str]:
+    '''Run each query's visualization concurrently and yield each result as a line
+    of newline-delimited JSON as soon as it completes. Results are yielded in
+    completion order, not request order. A query that fails produces an error line
+    instead of failing the whole batch.
+
+    The visualizations must have been built with a query client that applies
+    `authorization_filter` so that the user's query policies are only resolved once
+    for the whole batch.
+    '''
+    query_result_cache = current_app.query_result_cache
+    query_client = current_app.system_query_client
+
+    def build_task(query: BatchQuery) -> Callable[[], str]:
+        def run_query() -> str:
+            try:
+                response = query_result_cache.get_authorized_response(
+                    query.visualization, authorization_filter
+                )
+                return _serialize_line({'id': query.id, 'result': response})
+            # NOTE: A single broken tile should not prevent the rest of the
+            # batch from being returned.
+            # pylint: disable=broad-except
+            except Exception:
+                LOG.exception('Batched query %s failed', query.id)
+                return _serialize_line({'id': query.id, 'error': 'Unable to run query'})
+
+        return copy_current_request_context(run_query)
+
+    # NOTE: The queries run on the Druid query client's shared, bounded
+    # executor. If the client disconnects before the batch is complete, closing
+    # the results skips the queries that have not started yet and cancels the
+    # Druid queries that are still running.
+    results = _iter_concurrently(query_client, [build_task(query) for query in queries])
+    try:
+        for (_, line) in results:
+            yield line
+    finally:
+        results.close()
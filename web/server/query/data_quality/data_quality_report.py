@@ -1,16 +1,17 @@
 # mypy: disallow_untyped_defs=True
-from datetime import datetime
-from typing import Any, List, Dict, Optional
+from datetime import datetime, timedelta
+from typing import Any, List, Dict, Optional, Set
 
 import pandas as pd
 
 from flask import current_app
 from db.druid.query_builder import GroupByQueryBuilder
-from db.druid.util import DRUID_DATE_FORMAT
+from db.druid.util import DRUID_DATE_FORMAT, build_time_interval
 from db.druid.datasource import SiteDruidDatasource
 
 from web.server.query.data_quality.data_quality_score import (
     score,
+    score_batch,
     FAILED_QUALITY_SCORE,
 )
 from web.server.query.data_quality.data_quality_util import (
@@ -58,38 +59,53 @@ def build_dimension_level_response(
     # NOTE: The dimension level response is only used to power the map so
     # we filter out dimension values without latitudes/longitudes.
     filtered_df = df[df[lat_lng_fields].notnull().all(1)]
-
-    # Find the unique keys since we need to build a single result for each key.
-    keys = filtered_df['key'].unique()
+    if filtered_df.empty:
+        return {}
+
+    # Get the first row for each key. This is used to extract values that are
+    # constant for the same key such as latitude, longitude and the dimension
+    # values. The keys are in the order they first appear.
+    first_rows = filtered_df.drop_duplicates('key')
+    keys = first_rows['key']
+
+    # Pivot the report counts into a keys x dates matrix. Dates where a key has
+    # no reports are filled with zeros. If a key has multiple rows for the same
+    # date, the last row is used.
+    counts = (
+        filtered_df.drop_duplicates(['key', 'dates'], keep='last')
+        .pivot(index='key', columns='dates', values=num_reports_key)
+        .reindex(index=keys, columns=all_report_dates)
+        .fillna(0)
+        .to_numpy(dtype=float)
+    )
+
+    # NOTE: The first report date is the absolute first report and is not
+    # subject to the time filter. If a key is missing from the unfiltered results,
+    # fall back to the first date it reported in the filtered results.
+    first_report_dates = (
+        no_date_filter_df.groupby('key')['dates']
+        .min()
+        .dt.tz_localize(None)
+        .reindex(keys)
+        .fillna(filtered_df.groupby('key')['dates'].min().dt.tz_localize(None))
+    )
+
+    scores = score_batch(
+        all_report_dates, counts, list(first_report_dates), end_interval_date
+    )
 
     output: Dict[str, DimensionLevel] = {}
-    for key in keys:
-        df_slice = filtered_df[filtered_df['key'] == key]
-
-        # Get the first row with a given key. This is used to extract value
-        # that are constant for the same key such as latitutde, longitude and
-        # the dimension values.
-        first_row = df_slice.iloc[0]
-
-        lat = first_row[lat_field]
-        lng = first_row[lng_field]
-
-        dimensions = {}
-        for dimension in dimension_names:
-            dimensions[dimension] = first_row[dimension]
-
-        raw_counts = list(df_slice[num_reports_key])
-        report_dates = list(df_slice['dates'])
-        counts = get_report_counts(all_report_dates, report_dates, raw_counts)
-
-        first_report_date = min(
-            list(no_date_filter_df[no_date_filter_df['key'] == key]['dates'])
-        ).tz_localize(None)
-
+    for (key, lat, lng, dimension_values, quality_score) in zip(
+        keys,
+        first_rows[lat_field],
+        first_rows[lng_field],
+        first_rows[dimension_names].itertuples(index=False, name=None),
+        scores,
+    ):
         output[key] = {
-            **score(all_report_dates, counts, first_report_date, end_interval_date),  # type: ignore
+            **quality_score,  # type: ignore
             'geo': {'lat': lat, 'lng': lng},
-            'dimensions': dimensions,
+            'dimensions': dict(zip(dimension_names, dimension_values)),
             'outlierAnalysis': outliers_response_for_field.get(
                 key, FAILED_OUTLIERS_REPONSE
             ),
@@ -287,6 +303,29 @@ class DataQualityReport(QueryBase):
 
         return output
 
+    def get_reported_intervals(self, full_intervals: List[str]) -> List[str]:
+        '''Narrow the full time intervals to the span the requested fields have
+        data for, using the field metadata computed when the datasource was populated.
+        '''
+        field_metadata_index = current_app.druid_context.field_metadata_index
+        raw_field_ids: Set[str] = set()
+        for field in self.request.fields:
+            field_ids = field_metadata_index.get_field_ids(
+                field.calculation.filter.to_druid()
+            )
+            if field_ids is None:
+                return full_intervals
+            raw_field_ids.update(field_ids)
+
+        time_boundary = field_metadata_index.get_time_boundary(raw_field_ids)
+        if time_boundary is None:
+            return full_intervals
+        return [
+            build_time_interval(
+                time_boundary['min'], time_boundary['max'] + timedelta(days=1)
+            )
+        ]
+
     def get_no_date_filter_df(self) -> pd.DataFrame:
         intervals = [
             current_app.druid_context.data_time_boundary.get_full_time_interval()
@@ -302,11 +341,13 @@ class DataQualityReport(QueryBase):
         druid_grouping_selection = parse_groups_for_query(
             self.request.groups, intervals
         )
+        # NOTE: The granularity is built from the full intervals so that the
+        # time buckets are unchanged when the query intervals are narrowed.
         query = GroupByQueryBuilder(
             datasource=self.datasource.name,
             granularity=druid_grouping_selection.granularity,
             grouping_fields=druid_grouping_selection.dimensions,
-            intervals=intervals,
+            intervals=self.get_reported_intervals(intervals),
             calculation=self.request.build_calculation(),
         )
 
@@ -336,16 +377,22 @@ class DataQualityReport(QueryBase):
     def get_response(
         self, include_outliers: bool = False
     ) -> Dict[str, Dict[str, DimensionLevel]]:
-        outliers_response = None
+        # NOTE: These queries are independent of each other, so they are
+        # run concurrently.
+        sub_queries = {
+            'df': self.get_df,
+            'no_date_filter_df': self.get_no_date_filter_df,
+            'no_geo_filter_df': self.get_no_geo_filter_df,
+        }
         if include_outliers:
-            outliers_report = OutliersReport(
+            sub_queries['outliers'] = lambda: OutliersReport(
                 self.original_request, self.query_client, self.datasource
-            )
-            outliers_response = outliers_report.get_response()
+            ).get_response()
+        results = self.run_sub_queries(sub_queries)
 
         return self.build_response(
-            self.get_df(),
-            self.get_no_date_filter_df(),
-            self.get_no_geo_filter_df(),
-            outliers_response,
+            results['df'],
+            results['no_date_filter_df'],
+            results['no_geo_filter_df'],
+            results.get('outliers'),
         )
@@ -1,13 +1,13 @@
 # mypy: disallow_untyped_defs=True
 from builtins import range
 import math
-from typing import TYPE_CHECKING, TypedDict, List
+from typing import TYPE_CHECKING, TypedDict, List, Sequence
 
 import numpy as np
+import pandas as pd
 from scipy import stats
 
 if TYPE_CHECKING:
-    import pandas as pd
     import datetime
 
 
@@ -86,6 +86,8 @@ SCORE_WEIGHTS = {
 FRESHNESS_SCORE_DECAY_RATE = 0.5
 AGE_SCORE_DECAY_RATE = 0.05
 
+NANOSECONDS_PER_DAY = 24 * 60 * 60 * 10**9
+
 
 def clamp(value: float, smallest: float, largest: float) -> float:
     return max(smallest, min(value, largest))
@@ -230,3 +232,166 @@ def score(
             'totalReports': int(total_reports),
         },
     }
+
+
+def _clamp_array(values: np.ndarray, smallest: float, largest: float) -> np.ndarray:
+    # NOTE: `clamp` returns `smallest` for NaN values since every comparison
+    # with NaN is False. Match that behavior here.
+    return np.where(np.isnan(values), smallest, np.clip(values, smallest, largest))
+
+
+def _row_modes(report_counts: np.ndarray) -> np.ndarray:
+    '''Compute the most common value of each row. Ties are resolved with the
+    smallest value, matching `stats.mode`.'''
+    (num_rows, num_cols) = report_counts.shape
+    sorted_counts = np.sort(report_counts, axis=1)
+    is_run_start = np.ones(sorted_counts.shape, dtype=bool)
+    is_run_start[:, 1:] = sorted_counts[:, 1:] != sorted_counts[:, :-1]
+
+    run_starts = np.flatnonzero(is_run_start)
+    run_lengths = np.diff(np.append(run_starts, num_rows * num_cols))
+    run_rows = run_starts // num_cols
+
+    # Order the runs by row, then longest run first, then smallest value first.
+    order = np.lexsort((run_starts, -run_lengths, run_rows))
+    ordered_rows = run_rows[order]
+    is_first_run = np.ones(len(order), dtype=bool)
+    is_first_run[1:] = ordered_rows[1:] != ordered_rows[:-1]
+    return sorted_counts.ravel()[run_starts[order[is_first_run]]]
+
+
+def score_batch(
+    dates: List['pd.Timestamp'],
+    report_counts: np.ndarray,
+    first_report_dates: Sequence['pd.Timestamp'],
+    end_interval_date: 'datetime.datetime',
+) -> List[QualityScore]:
+    '''Compute the `score` of many report count series at once. `report_counts` is
+    a matrix with a row for each series and a column for each date in `dates`, and
+    `first_report_dates` holds the first report date for each row.
+    '''
+    num_rows = report_counts.shape[0]
+    if len(dates) < 5:
+        return [FAILED_QUALITY_SCORE] * num_rows
+    if not num_rows:
+        return []
+
+    report_counts = np.asarray(report_counts, dtype=float)
+    num_dates = len(dates)
+    # Dates are compared as nanoseconds since the epoch.
+    date_values = np.array([date.value for date in dates], dtype=np.int64)
+    date_timestamps = [date.timestamp() for date in dates]
+    first_report_values = np.array(
+        [date.value for date in first_report_dates], dtype=np.int64
+    )
+    end_interval_value = pd.Timestamp(end_interval_date).value
+
+    # Find the index of the last date that has a report and is no later than the
+    # end of the interval. Default to the first date if there is none.
+    has_report = (report_counts > 0) & (date_values <= end_interval_value)
+    last_report_idx = num_dates - 1 - np.argmax(has_report[:, ::-1], axis=1)
+    last_report_idx[~has_report.any(axis=1)] = 0
+    last_report_values = date_values[last_report_idx]
+
+    reporting_period = get_reporting_period(dates)
+    age_in_days = (last_report_values - first_report_values) // NANOSECONDS_PER_DAY
+    last_report_age_in_days = (
+        end_interval_value - last_report_values
+    ) // NANOSECONDS_PER_DAY
+
+    # Least squares slope of the report counts over their index, computed the same
+    # way as `stats.linregress`.
+    x_centered = np.arange(num_dates) - (num_dates - 1) / 2
+    average_report_counts = report_counts.mean(axis=1)
+    y_centered = report_counts - average_report_counts[:, np.newaxis]
+    completeness_slopes = (y_centered @ x_centered / num_dates) / (
+        np.dot(x_centered, x_centered) / num_dates
+    )
+    report_count_stds = report_counts.std(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        age_scores = (
+            1 - np.exp(-AGE_SCORE_DECAY_RATE * (age_in_days / reporting_period))
+        ) * SCORE_WEIGHTS['AGE']
+        freshness_scores = (
+            np.exp(
+                -FRESHNESS_SCORE_DECAY_RATE
+                * (last_report_age_in_days / reporting_period)
+            )
+            * SCORE_WEIGHTS['FRESHNESS']
+        )
+        completeness_trend_scores = (
+            _clamp_array(completeness_slopes / average_report_counts, -1, 0)
+            * SCORE_WEIGHTS['COMPLETENESS_TREND']
+        )
+        reporting_completeness_scores = np.round(
+            _clamp_array(1 - report_count_stds / average_report_counts, 0, 1)
+            * SCORE_WEIGHTS['COMPLETENESS']
+        )
+    indicator_characteristics_scores = (
+        freshness_scores + age_scores + completeness_trend_scores
+    )
+
+    end_interval_timestamp = end_interval_date.timestamp()
+    first_date_timestamp = date_timestamps[0]
+    output: List[QualityScore] = []
+    for (
+        idx,
+        last_idx,
+        first_report_date,
+        age_score,
+        freshness_score,
+        slope,
+        total_reports,
+        average_report_count,
+        min_report_count,
+        max_report_count,
+        mode_report_count,
+        report_count_std,
+        reporting_completeness_score,
+    ) in zip(
+        range(num_rows),
+        last_report_idx.tolist(),
+        first_report_dates,
+        age_scores.tolist(),
+        freshness_scores.tolist(),
+        completeness_slopes.tolist(),
+        report_counts.sum(axis=1).tolist(),
+        average_report_counts.tolist(),
+        report_counts.min(axis=1).tolist(),
+        report_counts.max(axis=1).tolist(),
+        _row_modes(report_counts).tolist(),
+        report_count_stds.tolist(),
+        reporting_completeness_scores.tolist(),
+    ):
+        output.append(
+            {
+                'indicatorCharacteristics': {
+                    'ageScore': age_score,
+                    'completenessTrendIsUp': slope >= 0,
+                    'endIntervalTimestamp': end_interval_timestamp,
+                    'firstEverReportTimestamp': first_report_date.timestamp(),
+                    'freshnessScore': freshness_score,
+                    'lastReportTimestamp': date_timestamps[last_idx],
+                    'maxAgeScore': SCORE_WEIGHTS['AGE'],
+                    'maxFreshnessScore': SCORE_WEIGHTS['FRESHNESS'],
+                    'maxScore': SCORE_WEIGHTS['FRESHNESS'] + SCORE_WEIGHTS['AGE'],
+                    'reportingPeriod': reporting_period,
+                    'success': True,
+                    'score': round(indicator_characteristics_scores[idx]),
+                },
+                'reportingCompleteness': {
+                    'averageReportCount': int(average_report_count),
+                    'firstReportTimestamp': first_date_timestamp,
+                    'maxReportCount': int(max_report_count),
+                    'maxScore': SCORE_WEIGHTS['COMPLETENESS'],
+                    'minReportCount': int(min_report_count),
+                    'modeReportCount': int(mode_report_count),
+                    'reportCountStd': round(report_count_std, 1),
+                    'score': int(reporting_completeness_score),
+                    'success': True,
+                    'totalReports': int(total_reports),
+                },
+            }
+        )
+    return output
@@ -10,6 +10,7 @@ from db.druid.calculations.unique_calculations import ThetaSketchUniqueCountCalc
 from web.server.query.data_quality.data_quality_util import build_query_filter
 from web.server.query.request import parse_groups_for_query
 from web.server.query.visualizations.base import QueryBase
+from web.server.query.visualizations.util import clean_df_for_json_export
 
 
 MILLISECONDS_IN_DAY = 24 * 60 * 60 * 1000
@@ -76,14 +77,16 @@ class DataQualityTable(QueryBase):
             dimension_filter=query_filter,
         )
 
-    def build_response(self, df):
+    # pylint: disable=arguments-differ
+    def build_response(self, df, no_geo_filter_df=None):
         '''Build the query response result from the result dataframe.'''
         if df.empty:
             return []
 
         # Create a no geo filter dataframe to allow us to retrive the total
         # number of reporting periods
-        no_geo_filter_df = self.get_no_geo_filter_df()
+        if no_geo_filter_df is None:
+            no_geo_filter_df = self.get_no_geo_filter_df()
 
         # NOTE: Right now, data quality only supports one field. Build the
         # output format as if there is a single field to query.
@@ -104,6 +107,16 @@ class DataQualityTable(QueryBase):
             report['geographyHierarchy'] = locations[i]
         return reports
 
+    def get_response(self):
+        # NOTE: The no geo filter query does not depend on the main query, so
+        # they are run concurrently.
+        results = self.run_sub_queries(
+            {'df': self.get_df, 'no_geo_filter_df': self.get_no_geo_filter_df}
+        )
+        return self.build_response(
+            clean_df_for_json_export(results['df']), results['no_geo_filter_df']
+        )
+
     def get_no_geo_filter_df(self):
         intervals = self.request.build_intervals()
         druid_grouping_selection = parse_groups_for_query(
@@ -1,5 +1,5 @@
 # mypy: disallow_untyped_defs=True
-from typing import Optional
+from typing import List, Optional
 
 from pandas import DataFrame
 
@@ -30,6 +30,9 @@ class OutliersBoxPlot(OutliersBase):
             self.grouping_dimension_ids()[0] if self.grouping_dimension_ids() else None
         )
 
+    def cache_key_parts(self) -> List[object]:
+        return [self.outlier_type]
+
     def build_response(self, df: DataFrame) -> dict:
         if df.empty:
             return {'data': [], 'dimensions': []}
@@ -1,4 +1,6 @@
 # mypy: disallow_untyped_defs=True
+from typing import List
+
 import pandas as pd
 
 from db.druid.datasource import SiteDruidDatasource
@@ -26,6 +28,9 @@ class OutliersLineGraph(QueryBase):
         super().__init__(request, query_client, datasource, False)
         self.outlier_type = outlier_type
 
+    def cache_key_parts(self) -> List[object]:
+        return [self.outlier_type]
+
     def build_df(self, raw_df: pd.DataFrame) -> pd.DataFrame:
         if raw_df.empty:
             return raw_df
@@ -1,4 +1,6 @@
 # mypy: disallow_untyped_defs=True
+from typing import List
+
 from pandas import DataFrame
 
 from db.druid.datasource import DruidDatasource
@@ -24,6 +26,9 @@ class OutliersTable(OutliersBase):
         super().__init__(request, query_client, datasource)
         self.outlier_type = outlier_type
 
+    def cache_key_parts(self) -> List[object]:
+        return [self.outlier_type]
+
     def build_response(self, df: DataFrame) -> dict:
         if df.empty:
             return {'data': [], 'dimensions': []}
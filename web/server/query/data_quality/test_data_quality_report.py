@@ -0,0 +1,129 @@
+import importlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask
+
+from config.loader import import_configuration_module
+from web.server.query.data_quality.data_quality_score import score
+from web.server.query.data_quality.test_data_quality_score import (
+    _assert_scores_equal,
+)
+
+DATES = list(pd.date_range('2021-01-01', periods=12, freq='MS'))
+END_INTERVAL_DATE = datetime(2021, 12, 15)
+LAT_LNG_FIELDS = ['lat', 'lng']
+DIMENSION_NAMES = ['RegionName', 'FacilityName']
+
+
+@pytest.fixture(name='report')
+def report_fixture():
+    # NOTE: The outlier queries used by the data quality report read the
+    # deployment configuration from the Flask app when they are imported.
+    app = Flask(__name__)
+    app.zen_config = import_configuration_module('harmony_demo')
+    with app.app_context():
+        return importlib.import_module(
+            'web.server.query.data_quality.data_quality_report'
+        )
+
+
+def _build_frames():
+    generator = np.random.default_rng(2)
+    rows = []
+    for idx in range(30):
+        key = f'Facility {idx}'
+        report_probability = generator.uniform(0.1, 1)
+        for date in DATES:
+            if generator.random() < report_probability:
+                rows.append(
+                    {
+                        'key': key,
+                        'RegionName': f'Region {idx % 4}',
+                        'FacilityName': key,
+                        # Keys without a latitude are not included in the response.
+                        'lat': np.nan if idx % 7 == 3 else float(idx),
+                        'lng': -float(idx),
+                        'dates': date,
+                        'field': float(generator.integers(0, 20)),
+                    }
+                )
+    df = pd.DataFrame(rows)
+    no_date_filter_df = pd.DataFrame(
+        {
+            'key': [*df['key'], *df['key'].unique()],
+            'dates': [
+                *df['dates'],
+                *(
+                    DATES[0] - pd.Timedelta(days=int(days))
+                    for days in generator.integers(0, 400, df['key'].nunique())
+                ),
+            ],
+        }
+    )
+    no_date_filter_df['dates'] = no_date_filter_df['dates'].dt.tz_localize('UTC')
+    return (df, no_date_filter_df)
+
+
+def _build_expected_response(report, df, no_date_filter_df):
+    '''Score each key on its own, the way the response was built before scoring was
+    vectorized.'''
+    filtered_df = df[df[LAT_LNG_FIELDS].notnull().all(1)]
+    output = {}
+    for key in filtered_df['key'].unique():
+        df_slice = filtered_df[filtered_df['key'] == key]
+        first_row = df_slice.iloc[0]
+        counts = report.get_report_counts(
+            DATES, list(df_slice['dates']), list(df_slice['field'])
+        )
+        first_report_date = min(
+            no_date_filter_df[no_date_filter_df['key'] == key]['dates']
+        ).tz_localize(None)
+        output[key] = {
+            **score(DATES, counts, first_report_date, END_INTERVAL_DATE),
+            'geo': {'lat': first_row['lat'], 'lng': first_row['lng']},
+            'dimensions': {name: first_row[name] for name in DIMENSION_NAMES},
+            'outlierAnalysis': report.FAILED_OUTLIERS_REPONSE,
+        }
+    return output
+
+
+def test_dimension_level_response_matches_per_key_scores(report):
+    (df, no_date_filter_df) = _build_frames()
+    expected = _build_expected_response(report, df, no_date_filter_df)
+    actual = report.build_dimension_level_response(
+        df,
+        DATES,
+        no_date_filter_df,
+        'field',
+        LAT_LNG_FIELDS,
+        DIMENSION_NAMES,
+        END_INTERVAL_DATE,
+        {},
+    )
+
+    assert list(actual) == list(expected)
+    assert len(actual) < df['key'].nunique()
+    for (key, expected_value) in expected.items():
+        actual_value = actual[key]
+        for section in ('geo', 'dimensions', 'outlierAnalysis'):
+            assert actual_value.pop(section) == expected_value.pop(section), key
+        _assert_scores_equal(expected_value, actual_value)
+
+
+def test_dimension_level_response_without_locations(report):
+    (df, no_date_filter_df) = _build_frames()
+    df['lat'] = np.nan
+    response = report.build_dimension_level_response(
+        df,
+        DATES,
+        no_date_filter_df,
+        'field',
+        LAT_LNG_FIELDS,
+        DIMENSION_NAMES,
+        END_INTERVAL_DATE,
+        {},
+    )
+    assert response == {}
@@ -0,0 +1,88 @@
+import math
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from web.server.query.data_quality.data_quality_score import (
+    FAILED_QUALITY_SCORE,
+    score,
+    score_batch,
+)
+
+DATES = list(pd.date_range('2021-01-01', periods=8, freq='MS'))
+END_INTERVAL_DATE = datetime(2021, 7, 15)
+FIRST_REPORT_DATE = pd.Timestamp('2020-06-01')
+
+
+def _assert_scores_equal(expected, actual):
+    assert expected.keys() == actual.keys()
+    for (section, expected_values) in expected.items():
+        actual_values = actual[section]
+        assert expected_values.keys() == actual_values.keys()
+        for (key, expected_value) in expected_values.items():
+            actual_value = actual_values[key]
+            assert type(actual_value) is type(expected_value), (section, key)
+            if isinstance(expected_value, float) and math.isnan(expected_value):
+                assert math.isnan(actual_value), (section, key)
+            else:
+                assert actual_value == pytest.approx(expected_value), (section, key)
+
+
+def _assert_batch_matches_score(report_counts, first_report_dates):
+    report_counts = np.array(report_counts, dtype=float)
+    actual = score_batch(DATES, report_counts, first_report_dates, END_INTERVAL_DATE)
+    assert len(actual) == len(report_counts)
+    for (row, first_report_date, actual_score) in zip(
+        report_counts, first_report_dates, actual
+    ):
+        expected = score(DATES, list(row), first_report_date, END_INTERVAL_DATE)
+        _assert_scores_equal(expected, actual_score)
+
+
+def test_score_batch_matches_score():
+    generator = np.random.default_rng(1)
+    report_counts = generator.integers(0, 20, size=(50, len(DATES)))
+    first_report_dates = [
+        FIRST_REPORT_DATE + pd.Timedelta(days=int(days))
+        for days in generator.integers(0, 200, size=len(report_counts))
+    ]
+    _assert_batch_matches_score(report_counts, first_report_dates)
+
+
+def test_score_batch_matches_score_with_nan_scores():
+    # Keys without any reports have an average report count of zero, which makes
+    # the completeness scores NaN before they are clamped. Reports after the end
+    # of the interval are not used as the last report date.
+    report_counts = [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 5],
+        [3, 0, 0, 0, 0, 0, 0, 0],
+        [0.5, 0, 0, 0, 0, 0, 0, 0],
+    ]
+    _assert_batch_matches_score(report_counts, [FIRST_REPORT_DATE] * 4)
+
+
+def test_score_batch_matches_score_with_mode_ties():
+    report_counts = [
+        [1, 1, 2, 2, 3, 3, 4, 4],
+        [4, 4, 3, 3, 2, 2, 1, 1],
+        [7, 2, 7, 2, 5, 5, 9, 9],
+        [6, 5, 4, 3, 2, 1, 0, 8],
+        [2, 2, 2, 2, 2, 2, 2, 2],
+    ]
+    _assert_batch_matches_score(report_counts, [FIRST_REPORT_DATE] * 5)
+
+
+def test_score_batch_without_rows():
+    report_counts = np.zeros((0, len(DATES)))
+    assert score_batch(DATES, report_counts, [], END_INTERVAL_DATE) == []
+
+
+def test_score_batch_without_enough_dates():
+    report_counts = np.ones((3, 4))
+    scores = score_batch(
+        DATES[:4], report_counts, [FIRST_REPORT_DATE] * 3, END_INTERVAL_DATE
+    )
+    assert scores == [FAILED_QUALITY_SCORE] * 3
@@ -0,0 +1,238 @@
+# mypy: disallow_untyped_defs=True
+'''Pool of persistent worker processes that CPU heavy query post-processing can be
+dispatched to.
+
+Gunicorn runs gevent workers, so a request that parses a large Druid response or
+builds a large pandas response blocks every other request handled by the same worker
+until it finishes. Dispatching that work to a separate process keeps the worker's
+event loop free to serve other requests.
+
+The worker processes are forked from the gunicorn worker the first time the pool is
+used, so they share the fully initialized flask application and only the task and its
+result need to be sent between processes. Both are pickled with the highest pickle
+protocol, which sends numpy and pandas buffers without copying them through an
+intermediate representation.
+'''
+import multiprocessing
+import os
+import pickle
+import queue
+import traceback
+from multiprocessing.connection import Connection, wait
+from threading import Lock
+from typing import Any, Callable, List, Optional, TypeVar
+
+from log import LOG
+
+ResultType = TypeVar('ResultType')
+
+# Set in the worker processes so that tasks dispatching more work to the pool run it
+# in process instead of starting a nested pool.
+_IS_OFFLOAD_WORKER = False
+
+
+class QueryOffloadError(Exception):
+    '''Raised when an offloaded task could not be run by a worker process.'''
+
+
+class QueryOffloadSerializationError(QueryOffloadError):
+    '''Raised when a task cannot be sent to a worker process because it cannot be
+    pickled. The task has not started, so it can safely be run in process instead.'''
+
+
+def _serialize_result(status: str, value: Any) -> bytes:
+    try:
+        return pickle.dumps((status, value), protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:  # pylint: disable=broad-except
+        # NOTE: Some exceptions (and results) cannot be pickled. Send the
+        # formatted traceback instead so the caller still sees what went wrong.
+        return pickle.dumps(
+            ('error', QueryOffloadError(traceback.format_exc())),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+
+def _worker_main(
+    task_reader: Connection,
+    result_writer: Connection,
+    app: Any,
+    initializer: Optional[Callable[[], None]],
+) -> None:
+    global _IS_OFFLOAD_WORKER  # pylint: disable=global-statement
+    _IS_OFFLOAD_WORKER = True
+    with app.app_context():
+        if initializer:
+            initializer()
+
+        while True:
+            try:
+                payload = task_reader.recv_bytes()
+            except (EOFError, OSError):
+                # The parent process has exited.
+                return
+
+            (task, args) = pickle.loads(payload)
+            try:
+                output = _serialize_result('ok', task(*args))
+            except BaseException as e:  # pylint: disable=broad-except
+                output = _serialize_result('error', e)
+            result_writer.send_bytes(output)
+
+
+class _Worker:
+    def __init__(
+        self,
+        context: Any,
+        app: Any,
+        initializer: Optional[Callable[[], None]],
+    ) -> None:
+        # NOTE: Using two one way pipes instead of a duplex pipe since duplex
+        # pipes are built on sockets, which are non-blocking when gevent has
+        # patched the socket module.
+        (task_reader, self.task_writer) = context.Pipe(duplex=False)
+        (self.result_reader, result_writer) = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=_worker_main,
+            args=(task_reader, result_writer, app, initializer),
+            name='query-offload',
+            daemon=True,
+        )
+        self.process.start()
+        task_reader.close()
+        result_writer.close()
+        self.failed = False
+
+    def run(self, payload: bytes) -> Any:
+        # NOTE: The worker is marked as failed until the task's result has been
+        # read. If the wait is interrupted (like by a gevent Timeout or the client
+        # disconnecting), the result is still pending in the pipe and would be
+        # received by the next caller, so the worker must be replaced instead of
+        # reused.
+        self.failed = True
+        self.task_writer.send_bytes(payload)
+
+        # NOTE: Waiting with `multiprocessing.connection.wait` instead of
+        # blocking on `recv_bytes` so that gevent can switch to other requests
+        # while the task runs. When the worker exits, its sentinel becomes ready.
+        wait([self.result_reader, self.process.sentinel])
+        try:
+            (status, value) = pickle.loads(self.result_reader.recv_bytes())
+        except (EOFError, OSError) as e:
+            self.process.join(timeout=1)
+            raise QueryOffloadError(
+                f'Query offload worker exited with code {self.process.exitcode}'
+            ) from e
+
+        self.failed = False
+        if status == 'error':
+            raise value
+        return value
+
+    def is_healthy(self) -> bool:
+        return not self.failed and self.process.is_alive()
+
+    def stop(self) -> None:
+        self.task_writer.close()
+        self.result_reader.close()
+        # NOTE: A failed worker can still be running the task it was interrupted
+        # in, so it is not given time to exit on its own.
+        if not self.failed:
+            self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1)
+
+
+class QueryOffloadPool:
+    '''A fixed size pool of worker processes that run tasks (module level functions
+    and their picklable arguments) inside the flask application context. A process
+    count of zero disables the pool and tasks run in the calling process.
+    '''
+
+    def __init__(
+        self,
+        app: Any,
+        processes: int,
+        initializer: Optional[Callable[[], None]] = None,
+    ) -> None:
+        '''
+        Args:
+            app: The flask application the worker processes run tasks with.
+            processes: Number of worker processes to start in each server process.
+            initializer: Optional. Called in each worker process after it starts,
+                for example to discard database connections inherited from the
+                parent process.
+        '''
+        self.app = app
+        self.processes = processes
+        self.initializer = initializer
+
+        self._workers: List[_Worker] = []
+        self._idle_workers: 'queue.Queue[_Worker]' = queue.Queue()
+        self._pid: Optional[int] = None
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0 and not _IS_OFFLOAD_WORKER
+
+    def _start_worker(self) -> _Worker:
+        return _Worker(multiprocessing.get_context('fork'), self.app, self.initializer)
+
+    def _ensure_started(self) -> None:
+        # NOTE: Processes are started lazily, and restarted after a fork, so
+        # that each gunicorn worker has its own pool forked from its own state.
+        pid = os.getpid()
+        with self._lock:
+            if self._pid == pid:
+                return
+
+            LOG.info('Starting %s query offload processes', self.processes)
+            self._workers = [self._start_worker() for _ in range(self.processes)]
+            self._idle_workers = queue.Queue()
+            for worker in self._workers:
+                self._idle_workers.put(worker)
+            self._pid = pid
+
+    def _replace_worker(self, worker: _Worker) -> _Worker:
+        LOG.warning('Replacing query offload process %s', worker.process.pid)
+        worker.stop()
+        replacement = self._start_worker()
+        with self._lock:
+            self._workers = [
+                replacement if existing is worker else existing
+                for existing in self._workers
+            ]
+        return replacement
+
+    def run(self, task: Callable[..., ResultType], *args: Any) -> ResultType:
+        '''Run `task(*args)` in a worker process and return its result. Exceptions
+        raised by the task are raised in the calling process.
+        '''
+        if not self.enabled:
+            return task(*args)
+
+        try:
+            payload = pickle.dumps((task, args), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            raise QueryOffloadSerializationError(
+                f'Unable to pickle offloaded task: {e}'
+            ) from e
+
+        self._ensure_started()
+        worker = self._idle_workers.get()
+        try:
+            return worker.run(payload)
+        finally:
+            if not worker.is_healthy():
+                worker = self._replace_worker(worker)
+            self._idle_workers.put(worker)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                for worker in self._workers:
+                    worker.stop()
+            self._workers = []
+            self._idle_workers = queue.Queue()
+            self._pid = None
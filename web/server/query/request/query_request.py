@@ -82,6 +82,9 @@ class QueryRequest(build_polymorphic_base()):  # type: ignore[misc]
             subtotal_dimensions=druid_grouping_selection.subtotal_dimensions,
             subtotal_result_label=SUBTOTAL_RESULT_LABEL,
             filter_non_aggregated_rows=filter_non_aggregated_rows,
+            field_pivot_min_fields=current_app.config.get(
+                'QUERY_FIELD_PIVOT_MIN_FIELDS', 0
+            ),
         )
 
     def grouping_dimensions(self) -> List[GroupingDimension]:
@@ -0,0 +1,194 @@
+# mypy: disallow_untyped_defs=True
+'''Cache for query endpoint responses.
+
+Identical dashboards are frequently refreshed by many users at once. Each response is
+cached under a key built from the normalized query request, the visualization that
+builds the response and the query policy filter of the requesting user. Keys also
+include the version of the current datasource so all entries are invalidated when a
+new datasource is loaded.
+
+Concurrent identical requests inside the same process are coalesced so that only one
+of them issues the Druid query while the others wait for its result. Only successful
+results are shared. If the computation fails (or is cancelled, for example when the
+request that started it is killed), the waiting requests compute the result again.
+'''
+import hashlib
+import json
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Optional
+
+import related
+from flask import current_app
+from pydruid.utils.filters import Filter
+
+from db.druid.util import EmptyFilter
+from log import LOG
+from web.server.query.visualizations.base import QueryBase
+from web.server.routes.views.query_policy import build_user_authorization_filter
+
+# Bump this value when the format of cached responses changes so that stale entries
+# are not reused.
+CACHE_KEY_VERSION = 1
+CACHE_KEY_PREFIX = 'query-result'
+
+
+def _canonicalize(value: Any) -> Any:
+    '''Sort the unordered parts of a built Druid filter (the values of `in` filters)
+    so that equivalent filters produce the same key.'''
+    if isinstance(value, dict):
+        output = {key: _canonicalize(inner) for key, inner in value.items()}
+        if output.get('type') == 'in' and isinstance(output.get('values'), list):
+            output['values'] = sorted(output['values'], key=str)
+        return output
+    if isinstance(value, (list, tuple)):
+        return [_canonicalize(inner) for inner in value]
+    return value
+
+
+def _serialize_filter(query_filter: Optional[Filter]) -> Any:
+    if query_filter is None or isinstance(query_filter, EmptyFilter):
+        return None
+    return _canonicalize(Filter.build_filter(query_filter))
+
+
+def build_cache_key(
+    visualization: QueryBase, authorization_filter: Any, *args: Any
+) -> str:
+    '''Build a stable hash for the response `visualization` would produce.'''
+    db_datasource = current_app.druid_context.current_db_datasource
+    key_data = {
+        'version': CACHE_KEY_VERSION,
+        'datasource': db_datasource.datasource,
+        'datasource_modified': db_datasource.last_modified,
+        'visualization': type(visualization).__name__,
+        'request': related.to_dict(visualization.request),
+        'authorization_filter': authorization_filter,
+        'extra': [*visualization.cache_key_parts(), *args],
+    }
+    serialized_key = json.dumps(key_data, sort_keys=True, default=str)
+    digest = hashlib.sha256(serialized_key.encode('utf-8')).hexdigest()
+    return f'{CACHE_KEY_PREFIX}-{digest}'
+
+
+class _InFlightRequest:
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result: Any = None
+        self.succeeded = False
+
+
+class QueryResultCache:
+    '''Cache query responses in one of the `app.caches` backends (Redis in
+    production, filesystem in development) and coalesce concurrent identical
+    requests.'''
+
+    def __init__(self, backend: Any, timeout: Optional[int] = None):
+        self.backend = backend
+        self.timeout = timeout
+        self._in_flight: Dict[str, _InFlightRequest] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'inFlight': len(self._in_flight),
+            }
+
+    def _record_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def _get(self, key: str) -> Any:
+        try:
+            return self.backend.get(key)
+        # NOTE: A broken cache backend should never break the query
+        # endpoints. Fall back to running the query.
+        # pylint: disable=broad-except
+        except Exception:
+            self._record_error()
+            LOG.exception('Unable to read query result cache entry')
+            return None
+
+    def _set(self, key: str, value: Any) -> None:
+        try:
+            self.backend.set(key, value, timeout=self.timeout)
+        # pylint: disable=broad-except
+        except Exception:
+            self._record_error()
+            LOG.exception('Unable to store query result cache entry')
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        '''Return the cached value for `key`. If no value is cached, compute it, or
+        wait for the identical computation already running in this process.'''
+        value = self._get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        while True:
+            with self._lock:
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    in_flight = _InFlightRequest()
+                    self._in_flight[key] = in_flight
+                    self.misses += 1
+                    break
+                self.coalesced += 1
+
+            in_flight.done.wait()
+            if in_flight.succeeded:
+                return in_flight.result
+            # NOTE: The computation being waited on failed. Its error belongs to
+            # the request that ran it (and might be a cancellation of that
+            # request), so try again instead of raising it here.
+
+        try:
+            value = compute()
+            if value is not None:
+                self._set(key, value)
+            in_flight.result = value
+            in_flight.succeeded = True
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            in_flight.done.set()
+
+    def get_response(self, visualization: QueryBase, *args: Any) -> Any:
+        '''Return `visualization.get_response(*args)`, using the cached response
+        when an identical request has already been computed for a user with the same
+        query policy restrictions.'''
+        if not visualization.CACHE_RESPONSE:
+            return visualization.get_offloaded_response(*args)
+
+        return self.get_authorized_response(
+            visualization, build_user_authorization_filter(), *args
+        )
+
+    def get_authorized_response(
+        self,
+        visualization: QueryBase,
+        authorization_filter: Optional[Filter],
+        *args: Any,
+    ) -> Any:
+        '''Same as `get_response` but uses an authorization filter that has already
+        been resolved for the current user.'''
+        if not visualization.CACHE_RESPONSE:
+            return visualization.get_offloaded_response(*args)
+
+        key = build_cache_key(
+            visualization, _serialize_filter(authorization_filter), *args
+        )
+        return self.get_or_compute(
+            key,
+            lambda: visualization.get_offloaded_response(*args),
+        )
@@ -0,0 +1,49 @@
+import os
+import time
+
+import pytest
+from flask import Flask
+
+from web.server.query import offload_pool
+from web.server.query.offload_pool import QueryOffloadPool
+
+
+def _get_pid_after(delay, value):
+    time.sleep(delay)
+    return (os.getpid(), value)
+
+
+@pytest.fixture(name='pool')
+def pool_fixture():
+    pool = QueryOffloadPool(Flask(__name__), 1)
+    yield pool
+    pool.shutdown()
+
+
+def test_run_returns_task_result(pool):
+    (pid, value) = pool.run(_get_pid_after, 0, 'value')
+    assert value == 'value'
+    assert pid != os.getpid()
+
+    # The same worker process is reused for the next task.
+    assert pool.run(_get_pid_after, 0, 'next') == (pid, 'next')
+
+
+def test_interrupted_worker_is_replaced(pool, monkeypatch):
+    (pid, _) = pool.run(_get_pid_after, 0, 'first')
+
+    def interrupt(*args):
+        raise KeyboardInterrupt()
+
+    # Interrupt the wait while the task is still running, like a gevent Timeout or
+    # a disconnected client would.
+    with monkeypatch.context() as patch:
+        patch.setattr(offload_pool, 'wait', interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            pool.run(_get_pid_after, 0.2, 'interrupted')
+
+    # The next caller must receive its own result, not the pending result of the
+    # interrupted task.
+    (next_pid, value) = pool.run(_get_pid_after, 0, 'next')
+    assert value == 'next'
+    assert next_pid != pid
@@ -0,0 +1,99 @@
+import time
+from threading import Event, Thread
+
+import pytest
+
+from web.server.query.result_cache import QueryResultCache
+
+
+class DictCacheBackend:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.values[key] = value
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline, 'Timed out waiting for condition'
+        time.sleep(0.001)
+
+
+def _start_waiter(cache, key, compute):
+    output = {}
+
+    def run():
+        try:
+            output['result'] = cache.get_or_compute(key, compute)
+        except BaseException as e:  # pylint: disable=broad-except
+            output['error'] = e
+
+    thread = Thread(target=run)
+    thread.start()
+    _wait_for(lambda: cache.stats()['coalesced'] == 1)
+    return (thread, output)
+
+
+def test_waiters_share_successful_result():
+    cache = QueryResultCache(DictCacheBackend())
+    release_leader = Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release_leader.wait()
+        return 'result'
+
+    leader = Thread(target=cache.get_or_compute, args=('key', compute))
+    leader.start()
+    _wait_for(lambda: calls)
+    (waiter, output) = _start_waiter(cache, 'key', compute)
+
+    release_leader.set()
+    leader.join()
+    waiter.join()
+    assert output == {'result': 'result'}
+    assert len(calls) == 1
+    assert cache.get_or_compute('key', compute) == 'result'
+    assert cache.stats() == {
+        'hits': 1,
+        'misses': 1,
+        'coalesced': 1,
+        'errors': 0,
+        'inFlight': 0,
+    }
+
+
+@pytest.mark.parametrize('error_type', [ValueError, KeyboardInterrupt])
+def test_waiters_recompute_when_leader_fails(error_type):
+    cache = QueryResultCache(DictCacheBackend())
+    release_leader = Event()
+    leader_output = {}
+
+    def fail():
+        release_leader.wait()
+        raise error_type('leader failed')
+
+    def run_leader():
+        try:
+            cache.get_or_compute('key', fail)
+        except BaseException as e:  # pylint: disable=broad-except
+            leader_output['error'] = e
+
+    leader = Thread(target=run_leader)
+    leader.start()
+    _wait_for(lambda: cache.stats()['inFlight'] == 1)
+    (waiter, output) = _start_waiter(cache, 'key', lambda: 'recomputed')
+
+    release_leader.set()
+    leader.join()
+    waiter.join()
+    assert isinstance(leader_output['error'], error_type)
+    assert output == {'result': 'recomputed'}
+    assert cache.stats()['misses'] == 2
+    assert cache.backend.values == {'key': 'recomputed'}
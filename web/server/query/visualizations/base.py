@@ -1,15 +1,24 @@
 # mypy: disallow_untyped_defs=True
+import copy
+import time
 from abc import ABC, abstractmethod
-from typing import List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, TypeVar, Union
 
 import numpy as np
 import pandas as pd
 
+from flask import (
+    copy_current_request_context,
+    current_app,
+    has_app_context,
+    has_request_context,
+)
 from pydruid.utils.dimensions import DimensionSpec
 
 from data.query.models import GroupingGranularity
 from data.query.models.calculation import SyntheticCalculation
 from log import LOG
+from web.server.query.offload_pool import QueryOffloadSerializationError
 from web.server.query.request import QueryRequest
 from web.server.query.visualizations.util import clean_df_for_json_export
 from web.server.routes.views.query_policy import AuthorizedQueryClient
@@ -19,6 +28,39 @@ from db.druid.query_builder import GroupByQueryBuilder
 
 TIMESTAMP_COLUMN = 'timestamp'
 
+ResultType = TypeVar('ResultType')
+
+
+def _with_flask_context(task: Callable[[], ResultType]) -> Callable[[], ResultType]:
+    '''Wrap the task so that it runs with the current flask request or application
+    context when it is called from a different thread.'''
+    if has_request_context():
+        return copy_current_request_context(task)
+    if not has_app_context():
+        return task
+
+    # pylint: disable=protected-access
+    app = current_app._get_current_object()
+
+    def run_with_app_context() -> ResultType:
+        with app.app_context():
+            return task()
+
+    return run_with_app_context
+
+
+def _build_offloaded_response(
+    visualization: 'QueryBase',
+    query: GroupByQueryBuilder,
+    pydruid_query: Any,
+    raw_result: List[Any],
+) -> object:
+    '''Parse the raw Druid result of the visualization's query and build the
+    visualization's response from it. Runs inside a query offload worker process.'''
+    pydruid_query.result = query.parse(raw_result)
+    raw_df = visualization.build_result_df(query, pydruid_query)
+    return visualization.build_response_from_raw_df(raw_df)
+
 
 def detect_alternate_granularity(
     dimensions: List[Union[str, DimensionSpec]]
@@ -62,6 +104,18 @@ class QueryBase(ABC):
     that dataframe into a suitable response format is left up to the inheriting
     class in the build_response abstract method.'''
 
+    # Whether the response can be stored in the query result cache. Responses that
+    # are streamed lazily to the client should not be cached since caching would
+    # require materializing the full response.
+    CACHE_RESPONSE = True
+
+    # Whether the response can be built in the query offload process pool. The
+    # visualization is pickled and sent to a worker process, so all of its
+    # attributes other than the query client must be picklable. The response is
+    # pickled to be sent back, so responses that are built lazily and streamed to
+    # the client should not be offloaded.
+    OFFLOAD_RESPONSE = True
+
     def __init__(
         self,
         request: QueryRequest,
@@ -74,23 +128,35 @@ class QueryBase(ABC):
         self.datasource = datasource
         self.fill_intermediate_dates = fill_intermediate_dates
 
-    def _run_query(self) -> pd.DataFrame:
-        '''Run the built query and return the results in a dataframe.'''
-        df = None
-
+    def _build_runnable_query(self) -> Optional[GroupByQueryBuilder]:
+        '''Build the query to run, or None if no query should be issued and the
+        result is empty.'''
         if self.request.filter and not self.request.filter.is_valid():
             LOG.info(
                 'Encountered invalid filter, returning empty dataframe: %s',
                 self.request.filter,
             )
-            return pd.DataFrame()
+            return None
 
         # Cowardly refuse to issue a query if no fields have been selected since
         # druid won't be able to return results.
-        if self.request.fields:
-            query = self.build_query()
-            result = self.query_client.run_query(query)
-            df = result.export_pandas(self.fill_intermediate_dates)
+        if not self.request.fields:
+            return None
+        return self.build_query()
+
+    def _run_query(self) -> pd.DataFrame:
+        '''Run the built query and return the results in a dataframe.'''
+        query = self._build_runnable_query()
+        if query is None:
+            return pd.DataFrame()
+
+        result = self.query_client.run_query(query)
+        return self.build_result_df(query, result)
+
+    def build_result_df(self, query: GroupByQueryBuilder, result: Any) -> pd.DataFrame:
+        '''Build the raw query response dataframe from the pydruid query holding the
+        parsed query result.'''
+        df = result.export_pandas(self.fill_intermediate_dates)
 
         # pydruid doesn't return a DataFrame if the result is empty
         # TODO: Handle empty results more cleanly. Potentially show
@@ -136,6 +202,51 @@ class QueryBase(ABC):
 
         return df
 
+    def run_sub_queries(
+        self, sub_queries: Dict[str, Callable[[], Any]]
+    ) -> Dict[str, Any]:
+        '''Run independent sub-queries (functions taking no arguments that query
+        through `self.query_client`) concurrently on the query client's shared
+        executor and return a mapping from sub-query name to result.
+
+        The current user's authorization filter is resolved once before the
+        sub-queries start, and `self.query_client` is replaced with a client that
+        applies it while they run, since the sub-queries run outside of the current
+        request.
+        '''
+        names = list(sub_queries)
+        visualization_name = type(self).__name__
+
+        def build_task(name: str) -> Callable[[], Any]:
+            sub_query = sub_queries[name]
+
+            def run_sub_query() -> Any:
+                start = time.perf_counter()
+                try:
+                    return sub_query()
+                finally:
+                    LOG.info(
+                        '%s sub-query %s finished in %.3fs',
+                        visualization_name,
+                        name,
+                        time.perf_counter() - start,
+                    )
+
+            return _with_flask_context(run_sub_query)
+
+        query_client = self.query_client
+        if not hasattr(query_client, 'run_concurrently'):
+            return {name: sub_queries[name]() for name in names}
+
+        self.query_client = query_client.preauthorize()
+        try:
+            results = query_client.run_concurrently(
+                [build_task(name) for name in names]
+            )
+        finally:
+            self.query_client = query_client
+        return dict(zip(names, results))
+
     def build_query(self) -> GroupByQueryBuilder:
         '''Convert the request into a Druid query.'''
         return self.request.to_druid_query(self.datasource.name)
@@ -149,9 +260,67 @@ class QueryBase(ABC):
         self,
     ) -> object:
         '''Return the formatted query response to send to the frontend.'''
-        df = clean_df_for_json_export(self.get_df())
+        return self.build_response_from_raw_df(self._run_query())
+
+    def build_response_from_raw_df(self, raw_df: pd.DataFrame) -> object:
+        '''Build the formatted query response from the raw query response
+        dataframe.'''
+        df = clean_df_for_json_export(self.build_df(raw_df))
         return self.build_response(df)
 
+    def get_offloaded_response(self, *args: Any) -> object:
+        '''Return `self.get_response(*args)`. When the query offload process pool is
+        enabled, the query is issued from this process (waiting on Druid does not
+        block other requests) and only parsing the Druid result and building the
+        response, the CPU heavy parts of the request, run in one of the pool's worker
+        processes. Worker processes are therefore only held while there is CPU work
+        to do.
+        '''
+        offload_pool = getattr(current_app, 'query_offload_pool', None)
+        if (
+            offload_pool is None
+            or not offload_pool.enabled
+            or not self.OFFLOAD_RESPONSE
+            # NOTE: Visualizations building their response from multiple queries
+            # are built in process.
+            or type(self).get_response is not QueryBase.get_response
+            or not hasattr(self.query_client, 'fetch_query')
+        ):
+            return self.get_response(*args)
+
+        query = self._build_runnable_query()
+        if query is None:
+            return self.get_response(*args)
+
+        (pydruid_query, raw_result) = self.query_client.fetch_query(query)
+        raw_result = list(raw_result)
+
+        visualization = copy.copy(self)
+        visualization.query_client = None  # type: ignore[assignment]
+        try:
+            return offload_pool.run(
+                _build_offloaded_response,
+                visualization,
+                query,
+                pydruid_query,
+                raw_result,
+            )
+        except QueryOffloadSerializationError:
+            LOG.warning(
+                'Unable to offload %s response, building it in process',
+                type(self).__name__,
+                exc_info=True,
+            )
+            pydruid_query.result = query.parse(raw_result)
+            return self.build_response_from_raw_df(
+                self.build_result_df(query, pydruid_query)
+            )
+
+    def cache_key_parts(self) -> List[object]:
+        '''Values, in addition to the request, that change the response this
+        query produces. They are included in the query result cache key.'''
+        return []
+
     def build_df(self, raw_df: pd.DataFrame) -> pd.DataFrame:
         '''Process the raw query response dataframe.'''
         return raw_df
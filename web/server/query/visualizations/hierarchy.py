@@ -1,4 +1,4 @@
-from typing import List, TypedDict, Union, Dict
+from typing import Dict, List, TypedDict, Union
 
 import pandas as pd
 
@@ -6,7 +6,6 @@ from db.druid.datasource import DruidDatasource
 from data.query.models import GroupingDimension, GroupingGranularity
 from web.server.query.request import QueryRequest, SUBTOTAL_RESULT_LABEL
 from web.server.query.visualizations.base import QueryBase
-from web.server.query.visualizations.util import join_str_columns
 from web.server.routes.views.query_policy import AuthorizedQueryClient
 
 
@@ -46,51 +45,6 @@ def rewrite_hierarchy_groups(
     return output
 
 
-def attach_parent_node_metadata(
-    df: pd.DataFrame, groups: List[str], level_idx: int
-) -> None:
-    '''Add metadata to each subtotal result to make building a tree easier.
-    Columns added:
-        key: The ID of a subtotal result that children nodes will point to.
-        level_idx: The index of this level to make sorting by level easier.
-        name: The display name for each subtotal result.
-        dimension: The dimension level this subtotal result represents values for.
-        parent: The parent ID that this subtotal result is located beneath.
-    '''
-    current_level = groups[level_idx]
-    is_root = level_idx == 0
-    subtotal_filter = df[current_level] == SUBTOTAL_RESULT_LABEL
-
-    # Assign a key to each subtotal result at this level.
-    df.loc[subtotal_filter, 'key'] = join_str_columns(
-        df[subtotal_filter], groups[: level_idx + 1]
-    )
-    df.loc[subtotal_filter, 'level_idx'] = level_idx
-
-    # NOTE: This is somewhat counterintuitive. The actual grouping level a
-    # subtotal value represents is a level higher than than our current level. This is
-    # because values are reported at the n + 1 lower level by druid when it calculates
-    # subtotals.
-    true_level = groups[level_idx - 1] if not is_root else ''
-
-    # Use the parent dimension name as the node's name. If we are on the root level and
-    # have no parent, set Overall as the name.
-    df.loc[subtotal_filter, 'name'] = (
-        df[subtotal_filter][true_level] if not is_root else 'Overall'
-    )
-
-    # Set the dimension ID for each non-root level.
-    df.loc[subtotal_filter, 'dimension'] = true_level
-
-    # Update the parent ID to point to the true parent. The original parent ID was set
-    # only for the lowest (leaf) level nodes.
-    df.loc[subtotal_filter, 'parent'] = (
-        join_str_columns(df[subtotal_filter], groups[: level_idx - 1] + ['suffix'])
-        if not is_root
-        else ''
-    )
-
-
 class Node(TypedDict):
     '''A node in the hierarchy tree that has children.'''
 
@@ -144,6 +98,83 @@ def build_zero_grouping_response(
     }
 
 
+def _build_node_key(values: tuple) -> tuple:
+    '''Build the key identifying the node with the given dimension values. Null
+    (NaN) values are replaced with None since NaN values are never equal to each
+    other.'''
+    # NOTE: `value != value` is only True for NaN.
+    # pylint: disable=comparison-with-itself
+    return tuple(None if value != value else value for value in values)
+
+
+def build_hierarchy_tree(
+    df: pd.DataFrame, groups: List[str], metric_fields: List[str]
+) -> Node:
+    '''Build the hierarchy tree in a single pass over the query result rows.
+
+    Subtotal rows are marked by the query parser with SUBTOTAL_RESULT_LABEL in the
+    first dimension that the subtotal grouping excludes, so a row labelled at
+    `groups[i]` is a node on level `i` (the root is level 0 and the leaves, which have
+    no label, are on level `len(groups)`). The name of a node is the value of the
+    dimension one level above the label.
+
+    Druid returns the rows in blocks: the full grouping first, followed by each
+    subtotal grouping from the most granular to the root, with each block sorted by
+    dimension values (see `SubtotalConfig.get_subtotal_dimension`). Walking the rows
+    in reverse therefore visits every parent before its children, and the children
+    of a level appear in the same order as the parents on the level above. Each
+    child is attached to the parent indexed by the child's dimension values on the
+    levels above it.
+    '''
+    leaf_level = len(groups)
+    dimension_rows = list(zip(*[df[group].tolist() for group in groups]))
+    metric_rows = (
+        list(zip(*[df[field].tolist() for field in metric_fields]))
+        if metric_fields
+        else [()] * len(df)
+    )
+
+    # The nodes on each non-leaf level, keyed by the dimension values that identify
+    # them.
+    level_nodes: List[Dict[tuple, Node]] = [{} for _ in groups]
+    visited_nodes: List[Node] = []
+    root = None
+    for row_idx in range(len(dimension_rows) - 1, -1, -1):
+        values = dimension_rows[row_idx]
+        level = next(
+            (idx for idx, value in enumerate(values) if value == SUBTOTAL_RESULT_LABEL),
+            leaf_level,
+        )
+        node: Node = {
+            'children': [],
+            'metrics': dict(zip(metric_fields, metric_rows[row_idx])),
+            'name': values[level - 1] if level else 'Overall',
+            'dimension': groups[level - 1] if level else '',
+        }
+        visited_nodes.append(node)
+
+        if level < leaf_level:
+            level_nodes[level][_build_node_key(values[:level])] = node
+
+        if not level:
+            root = node
+            continue
+
+        parent_key = _build_node_key(values[: level - 1])
+        parent = level_nodes[level - 1].get(parent_key)
+        if parent is None:
+            raise ValueError(f'Hierarchy parent node does not exist: {parent_key}')
+        parent['children'].append(node)
+
+    # Children were attached in reverse order. Restore the original result order.
+    for node in visited_nodes:
+        node['children'].reverse()
+
+    if root is None:
+        raise ValueError('Hierarchy query result is missing the root subtotal row')
+    return root
+
+
 class HierarchyVisualization(QueryBase):
     '''Class to process the pandas dataframe returned from a druid query into a
     hierarchical data format.
@@ -162,33 +193,6 @@ class HierarchyVisualization(QueryBase):
         new_request = request.copy(groups=rewrite_hierarchy_groups(request.groups))
         super().__init__(new_request, query_client, datasource)
 
-    def build_df(self, raw_df: pd.DataFrame) -> pd.DataFrame:
-        if raw_df.empty:
-            return raw_df
-
-        groups = self.grouping_order()
-        if not groups:
-            # NOTE: Nation level queries will have a different dataframe format
-            # since building the response dict is much easier.
-            return raw_df
-
-        # Add a suffix column to make building parent IDs easier. All parent IDs will
-        # contain the SUBTOTAL_RESULT_LABEL.
-        raw_df['suffix'] = SUBTOTAL_RESULT_LABEL
-        # Set the parent ID that each leaf node should point to.
-        raw_df['parent'] = join_str_columns(raw_df, groups[:-1] + ['suffix'])
-        # Set the display name and dimension level for each leaf node. The leaf level is
-        # the last group in the list.
-        leaf_level = groups[-1]
-        raw_df['name'] = raw_df[leaf_level]
-        raw_df['dimension'] = leaf_level
-
-        # Add the metadata for each non-leaf level.
-        for i, _ in enumerate(groups):
-            attach_parent_node_metadata(raw_df, groups, i)
-
-        return raw_df
-
     def build_response(
         self, df: pd.DataFrame
     ) -> Union[ZeroGroupingResponse, EmptyResponse, HierarchicalResponse]:
@@ -201,61 +205,8 @@ class HierarchyVisualization(QueryBase):
         if not groups:
             return build_zero_grouping_response(df, metric_fields)
 
-        tree: Dict[str, Node] = {}
-
-        # All leaf nodes do not have a key. They only have a parent node to point to.
-        leaf_filter = ~df['key'].notnull()
-
-        # Index the subtotal dataframe by the unique `key` column.
-        subtotal_df = (
-            df[~leaf_filter]
-            # Reset the index so we can preserve the original sort order of results
-            # within each level.
-            .reset_index()
-            # Sort the results by level then original sort order.
-            .sort_values(['level_idx', 'index'])
-            .drop('index', 'columns')
-            .set_index('key')
-        )
-
-        columns = ['parent', 'name', 'dimension']
-        subtotal_metrics = subtotal_df[metric_fields].to_dict('index')
-
-        # Loop over each non-leaf node and store it in the tree.
-        for key, value in subtotal_df[columns].to_dict('index').items():
-            parent = value.pop('parent')
-            node: Node = {
-                'children': [],
-                'metrics': subtotal_metrics[key],
-                'name': value.get('name'),
-                'dimension': value.get('dimension'),
-            }
-            tree[key] = node
-            # If this node also has a parent, add it as a child of that parent. The
-            # parent is guaranteed to exist because we are iterating from lowest level
-            # to highest level.
-            if parent:
-                tree[parent]['children'].append(node)
-
-        # Build and store all leaf nodes.
-        leaf_df = df[leaf_filter]
-        leaf_metrics = leaf_df[metric_fields].to_dict('records')
-        for i, row in enumerate(leaf_df[columns].to_dict('records')):
-            parent = row.pop('parent')
-            node = {
-                'metrics': leaf_metrics[i],
-                'name': row.get('name'),
-                'dimension': row.get('dimension'),
-                # Not all nodes will have children, we introduce an empty list,
-                # TypedDict doesn't like optional keys, and we can't yet use
-                # https://peps.python.org/pep-0655/ which would simplfy a lot
-                # of this.
-                'children': row.get('children', []),
-            }
-            tree[parent]['children'].append(node)
-
         # Return only the root as the result since it can be traversed to reach each
         # level.
-        root = tree[SUBTOTAL_RESULT_LABEL]
-        response: HierarchicalResponse = {'levels': self.grouping_order(), 'root': root}
+        root = build_hierarchy_tree(df, groups, metric_fields)
+        response: HierarchicalResponse = {'levels': groups, 'root': root}
         return response
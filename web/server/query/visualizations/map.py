@@ -1,3 +1,4 @@
+from itertools import repeat
 from typing import List, Optional
 
 from data.query.models import GroupingDimension, GroupingGranularity
@@ -11,42 +12,83 @@ LNG_FIELD = 'lng'
 ZERO_VAL = '0.0'
 
 
-def build_map_data_point_generator(dimension_names, numeric_fields, lat_lng_fields):
-    '''Build a dynamic class that DataFrame.to_dict can use to convert the
-    dataframe's intermediary format into the MapDataPoint format.
+def _to_coordinate(value):
+    if value and value != ZERO_VAL:
+        return value
+    return 0
+
+
+def _iter_column_rows(columns, row_count):
+    if not columns:
+        return repeat((), row_count)
+    return zip(*columns)
+
+
+def build_map_data_points(df, dimension_names, numeric_fields, lat_lng_fields):
+    '''Convert the dataframe into a list of MapDataPoint dicts. The values are
+    read column by column so that no intermediate dict is built for each row.
     '''
     (lat_field, lng_field) = lat_lng_fields or (None, None)
+    row_count = len(df)
+
+    def get_coordinates(field):
+        if field is None or field not in df:
+            return repeat(0, row_count)
+        return map(_to_coordinate, df[field].tolist())
+
+    dimension_rows = _iter_column_rows(
+        [df[dimension].tolist() for dimension in dimension_names], row_count
+    )
+    metric_rows = _iter_column_rows(
+        [df[field].tolist() for field in numeric_fields], row_count
+    )
+    return [
+        {
+            'dimensions': dict(zip(dimension_names, dimension_values)),
+            'metrics': dict(zip(numeric_fields, metric_values)),
+            LAT_FIELD: lat,
+            LNG_FIELD: lng,
+        }
+        for (dimension_values, metric_values, lat, lng) in zip(
+            dimension_rows,
+            metric_rows,
+            get_coordinates(lat_field),
+            get_coordinates(lng_field),
+        )
+    ]
 
-    class MapDataPoint(dict):
-        def __init__(self, values):
-            raw_dict = dict(values)
-            dimensions = {}
-            for dimension in dimension_names:
-                dimensions[dimension] = raw_dict[dimension]
-
-            metrics = {}
-            for field in numeric_fields:
-                metrics[field] = raw_dict[field]
-
-            lat = 0
-            lng = 0
-            raw_lat = raw_dict.get(lat_field)
-            raw_lng = raw_dict.get(lng_field)
-            if raw_lat and raw_lat != ZERO_VAL:
-                lat = raw_lat
-            if raw_lng and raw_lng != ZERO_VAL:
-                lng = raw_lng
-
-            super().__init__(
-                {
-                    'dimensions': dimensions,
-                    'metrics': metrics,
-                    LAT_FIELD: lat,
-                    LNG_FIELD: lng,
-                }
-            )
 
-    return MapDataPoint
+def build_dated_map_data(df, dimension_names, numeric_fields, lat_lng_fields):
+    '''Group the dataframe rows by timestamp in a single pass and build the
+    `datedData` points for each date. Dates are sorted and rows within a date keep
+    their original order. Rows without a timestamp are dropped.
+    '''
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    import pandas as pd
+
+    (codes, dates) = pd.factorize(df[TIMESTAMP_COLUMN], sort=True)
+
+    # NOTE: Null timestamps are given a code of -1. They cannot be placed on a
+    # date, so drop them before counting the rows for each date.
+    has_date = codes >= 0
+    if not has_date.all():
+        df = df[has_date]
+        codes = codes[has_date]
+    counts = np.bincount(codes, minlength=len(dates))
+
+    # NOTE: Druid results are usually already ordered by timestamp, in which
+    # case the frame does not need to be reordered.
+    if len(codes) > 1 and (np.diff(codes) < 0).any():
+        df = df.take(np.argsort(codes, kind='stable'))
+
+    points = build_map_data_points(df, dimension_names, numeric_fields, lat_lng_fields)
+    data = []
+    offset = 0
+    for (date, count) in zip(dates, counts.tolist()):
+        data.append({'date': date, 'datedData': points[offset : offset + count]})
+        offset += count
+    return data
 
 
 def get_most_granular_dimension(dimension_list, mappable_dimension_priority):
@@ -63,16 +105,6 @@ def get_most_granular_dimension(dimension_list, mappable_dimension_priority):
     return None
 
 
-def build_map_response(df, dimension_names, numeric_fields, lat_lng_fields):
-    data = []
-    if not df.empty:
-        data_point_generator = build_map_data_point_generator(
-            dimension_names, numeric_fields, lat_lng_fields
-        )
-        data = df.to_dict('records', data_point_generator)
-    return {'data': data}
-
-
 def compute_mappable_dimension_priority(geo_field_ordering, geo_to_lat_lng):
     # The mappable dimension priority order is:
     # - All dimensions that are mappable that *do not* exist in GEO_FIELD_ORDERING
@@ -187,20 +219,9 @@ class Map(QueryBase):
 
         data = []
         if not df.empty:
-            dates = sorted(df[TIMESTAMP_COLUMN].unique())
-
-            for date in dates:
-                dated_df = df[df['timestamp'] == date]
-                dated_data = build_map_response(
-                    dated_df,
-                    self._dimension_names,
-                    numeric_fields,
-                    self._lat_lng_fields,
-                )
-
-                dated_dict = {'date': date, 'datedData': dated_data['data']}
-
-                data.append(dated_dict)
+            data = build_dated_map_data(
+                df, self._dimension_names, numeric_fields, self._lat_lng_fields
+            )
 
         # Have the backend pass a restriction for the admin boundaries based on the
         # user's query. These lists will contain locations to include or exclude based
@@ -8,6 +8,12 @@ class TableVisualization(QueryBase):
     for the table and scorecard visualization.
     '''
 
+    # NOTE: Table responses are streamed row by row and can be very large,
+    # so they are not stored in the query result cache or built in the query
+    # offload process pool, which would both require materializing every row.
+    CACHE_RESPONSE = False
+    OFFLOAD_RESPONSE = False
+
     def build_response(self, df):
         '''Output data stored as a list of rows.'''
         output_dimensions = self.grouping_order()
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from web.server.query.request import SUBTOTAL_RESULT_LABEL
+from web.server.query.visualizations.hierarchy import build_hierarchy_tree
+
+TOTAL = SUBTOTAL_RESULT_LABEL
+
+
+def _build_df(rows):
+    return pd.DataFrame(rows, columns=['region', 'district', 'field'])
+
+
+def _summarize(node):
+    return (
+        node['dimension'],
+        node['name'],
+        node['metrics']['field'],
+        [_summarize(child) for child in node['children']],
+    )
+
+
+def test_build_hierarchy_tree_attaches_children_in_result_order():
+    df = _build_df(
+        [
+            ['A', 'a1', 1],
+            ['A', 'a2', 2],
+            ['B', 'b1', 3],
+            [np.nan, 'n1', 4],
+            ['A', TOTAL, 3],
+            ['B', TOTAL, 3],
+            [np.nan, TOTAL, 4],
+            [TOTAL, TOTAL, 10],
+        ]
+    )
+    root = build_hierarchy_tree(df, ['region', 'district'], ['field'])
+    assert _summarize(root) == (
+        '',
+        'Overall',
+        10,
+        [
+            ('region', 'A', 3, [('district', 'a1', 1, []), ('district', 'a2', 2, [])]),
+            ('region', 'B', 3, [('district', 'b1', 3, [])]),
+            ('region', root['children'][2]['name'], 4, [('district', 'n1', 4, [])]),
+        ],
+    )
+
+
+def test_build_hierarchy_tree_with_unordered_parents():
+    # Children are attached by key, so the result does not depend on the subtotal
+    # rows being in the same order as the leaf rows.
+    df = _build_df(
+        [
+            ['B', 'b1', 3],
+            ['A', 'a1', 1],
+            ['B', 'b2', 5],
+            ['A', TOTAL, 1],
+            ['B', TOTAL, 8],
+            [TOTAL, TOTAL, 9],
+        ]
+    )
+    root = build_hierarchy_tree(df, ['region', 'district'], ['field'])
+    assert _summarize(root)[3] == [
+        ('region', 'A', 1, [('district', 'a1', 1, [])]),
+        ('region', 'B', 8, [('district', 'b1', 3, []), ('district', 'b2', 5, [])]),
+    ]
+
+
+def test_build_hierarchy_tree_with_missing_rows():
+    with pytest.raises(ValueError, match='parent node does not exist'):
+        build_hierarchy_tree(
+            _build_df([['A', 'a1', 1], [TOTAL, TOTAL, 1]]),
+            ['region', 'district'],
+            ['field'],
+        )
+
+    with pytest.raises(ValueError, match='missing the root'):
+        build_hierarchy_tree(_build_df([]), ['region', 'district'], ['field'])
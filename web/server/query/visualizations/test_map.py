@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+from web.server.query.visualizations.base import TIMESTAMP_COLUMN
+from web.server.query.visualizations.map import (
+    LAT_FIELD,
+    LNG_FIELD,
+    ZERO_VAL,
+    build_dated_map_data,
+)
+
+
+def _build_df(timestamps):
+    return pd.DataFrame(
+        {
+            'timestamp': timestamps,
+            'region': [f'region_{idx}' for idx in range(len(timestamps))],
+            'lat': ['1.5'] * len(timestamps),
+            'lng': ['0.0'] * len(timestamps),
+            'field': np.arange(len(timestamps), dtype=float),
+        }
+    )
+
+
+def _get_dated_regions(data):
+    return [
+        (dated['date'], [point['dimensions']['region'] for point in dated['datedData']])
+        for dated in data
+    ]
+
+
+def test_build_dated_map_data_groups_rows_by_sorted_date():
+    df = _build_df(['2021-02-01', '2021-01-01', '2021-02-01', '2021-01-01'])
+    data = build_dated_map_data(df, ['region'], ['field'], ['lat', 'lng'])
+    assert _get_dated_regions(data) == [
+        ('2021-01-01', ['region_1', 'region_3']),
+        ('2021-02-01', ['region_0', 'region_2']),
+    ]
+    assert data[0]['datedData'][0] == {
+        'dimensions': {'region': 'region_1'},
+        'metrics': {'field': 1.0},
+        'lat': '1.5',
+        'lng': 0,
+    }
+
+
+def test_build_dated_map_data_drops_null_timestamps():
+    df = _build_df(['2021-02-01', np.nan, '2021-01-01', None, '2021-02-01'])
+    data = build_dated_map_data(df, ['region'], ['field'], ['lat', 'lng'])
+    assert _get_dated_regions(data) == [
+        ('2021-01-01', ['region_2']),
+        ('2021-02-01', ['region_0', 'region_4']),
+    ]
+
+    assert build_dated_map_data(_build_df([np.nan, None]), ['region'], [], []) == []
+
+
+def _build_expected_dated_map_data(df, dimension_names, numeric_fields):
+    '''Filter the dataframe once per date and build each point from its row, the
+    way the map data was built before the dates were grouped in a single pass.'''
+    data = []
+    for date in sorted(df[TIMESTAMP_COLUMN].unique()):
+        points = []
+        for row in df[df[TIMESTAMP_COLUMN] == date].to_dict('records'):
+            (lat, lng) = (row['lat'], row['lng'])
+            points.append(
+                {
+                    'dimensions': {name: row[name] for name in dimension_names},
+                    'metrics': {field: row[field] for field in numeric_fields},
+                    LAT_FIELD: lat if lat and lat != ZERO_VAL else 0,
+                    LNG_FIELD: lng if lng and lng != ZERO_VAL else 0,
+                }
+            )
+        data.append({'date': date, 'datedData': points})
+    return data
+
+
+def test_build_dated_map_data_matches_per_date_points():
+    generator = np.random.default_rng(3)
+    row_count = 300
+    df = pd.DataFrame(
+        {
+            'timestamp': generator.choice(
+                ['2021-01-01', '2021-02-01', '2021-03-01', '2021-04-01'], row_count
+            ),
+            'region': generator.choice(['A', 'B', None], row_count),
+            'district': [f'district_{idx}' for idx in range(row_count)],
+            'lat': generator.choice(['1.5', ZERO_VAL, '', None], row_count),
+            'lng': generator.choice(['-2.25', ZERO_VAL], row_count),
+            'field_0': generator.random(row_count),
+            'field_1': generator.integers(0, 10, row_count).astype(float),
+        }
+    )
+    df.loc[::11, 'field_1'] = np.nan
+
+    dimension_names = ['region', 'district']
+    numeric_fields = ['field_0', 'field_1']
+    actual = build_dated_map_data(df, dimension_names, numeric_fields, ['lat', 'lng'])
+    expected = _build_expected_dated_map_data(df, dimension_names, numeric_fields)
+    assert len(actual) == 4
+    assert [dated['date'] for dated in actual] == [dated['date'] for dated in expected]
+    for (actual_dated, expected_dated) in zip(actual, expected):
+        pd.testing.assert_frame_equal(
+            pd.json_normalize(actual_dated['datedData']),
+            pd.json_normalize(expected_dated['datedData']),
+        )
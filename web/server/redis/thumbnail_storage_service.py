@@ -1,12 +1,24 @@
 import base64
 import time
+from datetime import timedelta
 
 from flask import current_app
 
+from log import LOG
 from web.server.routes.page_renderer import PageRendererRouter
 
 EXPIRATION_SEC = 1209600  # Update thumbnail image every 2 weeks.
 PENDING_STATE_TIMEOUT = 600
+PENDING_STATE = 'PENDING'
+
+# Maximum number of seconds a waiter sleeps before checking the thumbnail value
+# again. Completion is normally signalled through Redis pub/sub so this only bounds
+# the wait when a message is missed (like when the rendering process dies and the
+# pending state expires).
+READY_RECHECK_SEC = 30
+
+# Interval used when the cache is not backed by Redis and waiters must poll.
+PENDING_POLL_SEC = 1
 
 
 # Render dashboard image and encode into base64 string. Then decode to utf-8
@@ -21,19 +33,113 @@ def get_thumbnail_storage_name(name):
     return f'thumbnail_{name}'
 
 
+def _get_redis_client():
+    '''Return the Redis client backing the app cache, or None when the cache uses a
+    different backend (like the filesystem cache in development).'''
+    return current_app.redis_client
+
+
+def _get_redis_key(storage_key):
+    key_prefix = getattr(current_app.cache.cache, 'key_prefix', None) or ''
+    return f'{key_prefix}{storage_key}'
+
+
+def _get_ready_channel(storage_key):
+    return f'{_get_redis_key(storage_key)}_ready'
+
+
+def _publish_ready(storage_key):
+    redis_client = _get_redis_client()
+    if redis_client is not None:
+        redis_client.publish(_get_ready_channel(storage_key), '1')
+
+
+def _wait_for_thumbnail(storage_key):
+    '''Wait until the thumbnail stored at `storage_key` is no longer pending and
+    return its value.'''
+    cache = current_app.cache
+    redis_client = _get_redis_client()
+    if redis_client is None:
+        while (value := cache.get(storage_key)) == PENDING_STATE:
+            time.sleep(PENDING_POLL_SEC)
+        return value
+
+    # NOTE: Subscribe before checking the value so that a render finishing between
+    # the check and the subscription still wakes this waiter up. Waiting on the
+    # subscription yields to other greenlets under gevent.
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(_get_ready_channel(storage_key))
+        while (value := cache.get(storage_key)) == PENDING_STATE:
+            pubsub.get_message(timeout=READY_RECHECK_SEC)
+    finally:
+        pubsub.close()
+    return value
+
+
+def render_item(key):
+    '''Render the thumbnail for the dashboard with slug `key` and store it. Waiters
+    for the thumbnail are notified once rendering finishes, even if it failed.
+    Returns the base64 encoded image, or an empty string if rendering failed.'''
+    cache = current_app.cache
+    storage_key = get_thumbnail_storage_name(key)
+    new_base64_img = ''
+    try:
+        new_base64_img = fetch_base64_image(key)
+    finally:
+        if new_base64_img:
+            cache.set(storage_key, new_base64_img, timeout=EXPIRATION_SEC)
+        elif cache.get(storage_key) == PENDING_STATE:
+            # Clear the pending state so that waiters do not block until it expires.
+            cache.delete(storage_key)
+        _publish_ready(storage_key)
+    return new_base64_img
+
+
+def get_thumbnail_age(key):
+    '''Return the approximate time elapsed since the stored thumbnail for `key` was
+    rendered, based on its remaining time to live. Returns None if no thumbnail is
+    stored or its age cannot be determined.'''
+    redis_client = _get_redis_client()
+    if redis_client is None:
+        return None
+
+    ttl = redis_client.ttl(_get_redis_key(get_thumbnail_storage_name(key)))
+    # Negative values mean the key does not exist or has no expiration.
+    if ttl is None or ttl < 0 or ttl > EXPIRATION_SEC:
+        return None
+    return timedelta(seconds=EXPIRATION_SEC - ttl)
+
+
+def prerender_item(key):
+    '''Render the thumbnail for `key` in the background unless it is already being
+    rendered. Returns True if the thumbnail was rendered.'''
+    cache = current_app.cache
+    storage_key = get_thumbnail_storage_name(key)
+    value = cache.get(storage_key)
+    # NOTE: If a thumbnail already exists, it keeps being served until the new one
+    # is stored instead of making readers wait on the pending state.
+    if value == PENDING_STATE or (
+        value is None
+        and not cache.add(storage_key, PENDING_STATE, timeout=PENDING_STATE_TIMEOUT)
+    ):
+        LOG.info('Thumbnail for %s is already being rendered', key)
+        return False
+    return bool(render_item(key))
+
+
 # Retrieves value from redis and renders new image if key doesn't exist.
 def retrieve_item(key):
     cache = current_app.cache
     storage_key = get_thumbnail_storage_name(key)
-    while (value := cache.get(storage_key)) == 'PENDING':
-        time.sleep(1)
-
-    if value:
+    value = cache.get(storage_key)
+    if value and value != PENDING_STATE:
         return value
 
-    cache.set(storage_key, "PENDING", timeout=PENDING_STATE_TIMEOUT)
-    new_base64_img = fetch_base64_image(key)
-    if new_base64_img:
-        cache.set(storage_key, new_base64_img, timeout=EXPIRATION_SEC)
-        return new_base64_img
-    return ""
+    # NOTE: Only one request claims the pending state and renders the image. The
+    # others wait for it to finish and do not retry if rendering failed.
+    if value is None and cache.add(
+        storage_key, PENDING_STATE, timeout=PENDING_STATE_TIMEOUT
+    ):
+        return render_item(key)
+    return _wait_for_thumbnail(storage_key) or ''
@@ -5,10 +5,12 @@ import json
 import traceback
 import related
 import sqlalchemy
+from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
 from slugify import slugify
 
-from flask import current_app, g, url_for
+from flask import current_app, g, has_app_context, url_for
 from flask_user import current_user
 
 from log import LOG
@@ -23,6 +25,7 @@ from models.python.dashboard import (
     PREVIOUS_SCHEMA_VERSION_MAP,
     VERSION_TO_DOWNGRADE_FUNCTION,
 )
+from models.python.dashboard.version import LATEST_VERSION
 from models.python.dashboard.latest.model import (
     DashboardItemHolder,
 )
@@ -46,6 +49,14 @@ from web.server.routes.views.page_renderer import (
 from web.server.util.util import get_user_string, get_dashboard_title
 
 
+def _get_logger():
+    # NOTE: The upgrade functions are also used by scripts that run outside of a
+    # flask application context.
+    if has_app_context() and hasattr(g, 'request_logger'):
+        return g.request_logger
+    return LOG
+
+
 def _get_specification_version(specification):
     version = specification.get('version')
 
@@ -68,7 +79,7 @@ def _get_specification_version(specification):
 
 
 def upgrade_dashboard_specification(specification):
-    logger = g.request_logger if hasattr(g, 'request_logger') else LOG
+    logger = _get_logger()
     version = _get_specification_version(specification)
     next_version = NEXT_SCHEMA_VERSION_MAP.get(version)
     logger.debug(
@@ -156,6 +167,12 @@ def add_item_holder_to_dashboard(dashboard: Dashboard, raw_item_holder: dict):
 
 
 def convert_and_upgrade_specification(dashboard_specification):
+    # NOTE: Specifications that are already on the latest version do not need
+    # to be copied since the upgrade functions, which modify the specification in
+    # place, will not run.
+    if dashboard_specification.get('version') == LATEST_VERSION:
+        return dashboard_specification
+
     raw_specification = json.loads(json.dumps(dashboard_specification))
     raw_specification = upgrade_dashboard_specification(raw_specification)
     return raw_specification
@@ -168,7 +185,7 @@ def format_and_upgrade_specification(
         final_specification = convert_and_upgrade_specification(dashboard_specification)
         return related.to_dict(final_specification)
     except ValueError as e:
-        logger = g.request_logger if hasattr(g, 'request_logger') else LOG
+        logger = _get_logger()
         title = get_dashboard_title(dashboard_specification)
         message = (
             'Could not load specification for Dashboard \'{title}\'. '
@@ -180,6 +197,66 @@ def format_and_upgrade_specification(
         raise BadDashboardSpecification([error]) from e
 
 
+def write_upgraded_specification(
+    session, dashboard_id: int, source_version: str, specification: Dict[str, Any]
+) -> bool:
+    '''Store the upgraded specification of a dashboard. The specification is only
+    written if the stored specification is still on `source_version`, so that an
+    edit saved while the upgrade ran is not overwritten. Returns True if the
+    specification was written.
+    '''
+    # pylint: disable=no-member
+    updated_count = (
+        session.query(Dashboard)
+        .filter(
+            Dashboard.id == dashboard_id,
+            Dashboard.specification['version'].astext == source_version,
+        )
+        .update(
+            {
+                Dashboard.specification: specification,
+                # NOTE: Upgrading the schema is not an edit of the dashboard, so
+                # keep the last modified time the same.
+                Dashboard.last_modified: Dashboard.last_modified,
+            },
+            synchronize_session=False,
+        )
+    )
+    return updated_count > 0
+
+
+def persist_upgraded_specification(dashboard: Dashboard) -> None:
+    '''Upgrade the stored specification of a dashboard to the latest version and
+    write it back so that later loads of the dashboard skip the upgrade.
+    '''
+    source_version = dashboard.specification.get('version')
+    if source_version == LATEST_VERSION:
+        return
+
+    try:
+        specification = format_and_upgrade_specification(dashboard.specification)
+    except BadDashboardSpecification:
+        # The error is surfaced when the specification is formatted for the
+        # response.
+        return
+
+    with Transaction() as transaction:
+        if write_upgraded_specification(
+            transaction.run_raw(), dashboard.id, source_version, specification
+        ):
+            _get_logger().info(
+                'Stored dashboard %s specification upgraded from version %s',
+                dashboard.slug,
+                source_version,
+            )
+    # NOTE: Avoid reloading the specification that was just written.
+    set_committed_value(
+        dashboard,
+        'specification',
+        MutableDict.coerce('specification', specification),
+    )
+
+
 class SpecificationTuple(TypedDict):
     slug: str
     specification: Dict[str, Any]
@@ -360,6 +437,11 @@ class DashboardManager(AuthorizationResourceManager):
         authorization_item.label = title
         authorization_item.resource_type_id = ResourceTypeEnum.DASHBOARD.value
 
+    def read(self, id):  # pylint: disable=redefined-builtin
+        dashboard = super().read(id)
+        persist_upgraded_specification(dashboard)
+        return dashboard
+
     def create_dashboard(
         self, slug: str, specification: dict, user_id: Optional[int] = None
     ) -> Dashboard:
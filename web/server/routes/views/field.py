@@ -97,12 +97,20 @@ class FieldsApi:
 
         # TODO: These values will be underreported for time interval
         # aggregations. Fix this.
-        time_boundary = druid_context.data_time_boundary.get_field_time_boundary(
-            field_id, query.query_filter
-        )
-        total_count = druid_context.row_count_lookup.get_row_count(
-            query.query_filter, field_id
-        )
+        # NOTE: Prefer the field metadata computed when the datasource was
+        # populated so that describing a field does not need to query Druid.
+        field_metadata_index = druid_context.field_metadata_index
+        raw_field_ids = field_metadata_index.get_field_ids(query.query_filter)
+        if raw_field_ids is not None:
+            time_boundary = field_metadata_index.get_time_boundary(raw_field_ids)
+            total_count = field_metadata_index.get_row_count(raw_field_ids)
+        else:
+            time_boundary = druid_context.data_time_boundary.get_field_time_boundary(
+                field_id, query.query_filter
+            )
+            total_count = druid_context.row_count_lookup.get_row_count(
+                query.query_filter, field_id
+            )
         if not time_boundary or not total_count:
             return FieldSummary(field_id, 0)
 
@@ -1,14 +1,18 @@
 '''This module is responsible for managing CRUD requests against the Query Policy API and also for
 converting query policies into Druid Filters which are used to restrict query access.
 '''
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from functools import wraps
 from datetime import datetime
+from threading import Lock
 
 from flask import g, current_app
 from pydruid.utils.filters import Dimension, Filter
 
-from db.druid.util import EmptyFilter
+from db.druid.query_builder_util.optimization.filter_optimizations import (
+    optimize_query_filter,
+)
+from db.druid.util import CompiledFilter, EmptyFilter
 from models.python.permissions import QueryNeed
 from web.server.security.permissions import (
     SuperUserPermission,
@@ -51,6 +55,9 @@ HIERARCHICAL = 'hierarchical'
 # dimension has no value. Therefore we cannot filter for an empty string.
 NO_FILTER_VAL = '__NO_VAL__'
 
+# Maximum number of compiled authorization filters that are cached per process.
+AUTHORIZATION_FILTER_CACHE_SIZE = 1000
+
 
 def apply_authorization_filters():
     '''A decorator that applies filters to the run query method of a DruidQueryClient that
@@ -60,16 +67,11 @@ def apply_authorization_filters():
     def filter_query(run_query):
         @wraps(run_query)
         def filter_query_inner(self, query):
-            if SuperUserPermission().can() or is_public_dashboard_user():
-                # NOTE: Since we are not using the standard authorization path, it is
-                # possible that Site Administrator queries may be inadvertently filtered.
-                # All other users will be expected to have a defined Query Policy to control what
-                # data they are allowed to view.
-                # NOTE: We also skip this for unregistered users when
-                # public access is turned on
+            authorization_filter = build_user_authorization_filter()
+            if authorization_filter is None:
                 return run_query(self, query)
 
-            updated_query = restrict_query_filter_to_user_permissions(query)
+            updated_query = _apply_authorization_filter(query, authorization_filter)
             return run_query(self, updated_query)
 
         return filter_query_inner
@@ -77,13 +79,152 @@ def apply_authorization_filters():
     return filter_query
 
 
+def build_user_authorization_filter():
+    '''Returns the Druid filter restricting the data the current user is allowed to
+    query, or None if the user can query all data.
+    '''
+    if SuperUserPermission().can() or is_public_dashboard_user():
+        # NOTE: Since we are not using the standard authorization path, it is
+        # possible that Site Administrator queries may be inadvertently filtered.
+        # All other users will be expected to have a defined Query Policy to control what
+        # data they are allowed to view.
+        # NOTE: We also skip this for unregistered users when
+        # public access is turned on
+        return None
+    return get_compiled_authorization_filter(g.identity)
+
+
 def restrict_query_filter_to_user_permissions(query, user_identity=None):
     '''Returns a Druid filter that has been injected with a security filter that
     accounts for the QueryPolicies a given user has been given.
     '''
     user_identity = user_identity or g.identity
-    authorization_filter = _construct_authorization_filter(user_identity)
+    authorization_filter = get_compiled_authorization_filter(user_identity)
+    return _apply_authorization_filter(query, authorization_filter)
+
 
+class CompiledAuthorizationFilterCache:
+    '''Thread safe LRU cache of compiled authorization filters. Filters are keyed by
+    the query needs they were built from, so users holding the same query
+    policies share the same entry. The keys used by each identity are tracked so
+    the entries can be invalidated when the identity's permissions change.
+    '''
+
+    def __init__(self, max_size=AUTHORIZATION_FILTER_CACHE_SIZE):
+        self.max_size = max_size
+        # Mapping from key to a tuple of (compiled filter, IDs of the identities
+        # that have used the entry).
+        self._entries = OrderedDict()
+        self._identity_keys = defaultdict(set)
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, identity_id, compiled_filter):
+        with self._lock:
+            entry = self._entries.get(key)
+            identity_ids = entry[1] if entry else set()
+            identity_ids.add(identity_id)
+            self._entries[key] = (compiled_filter, identity_ids)
+            self._entries.move_to_end(key)
+            self._identity_keys[identity_id].add(key)
+            while len(self._entries) > self.max_size:
+                (evicted_key, (_, evicted_identity_ids)) = self._entries.popitem(
+                    last=False
+                )
+                for evicted_identity_id in evicted_identity_ids:
+                    self._discard_identity_key(evicted_identity_id, evicted_key)
+
+    def _discard_identity_key(self, identity_id, key):
+        keys = self._identity_keys.get(identity_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._identity_keys[identity_id]
+
+    def invalidate(self, identity_id):
+        with self._lock:
+            for key in self._identity_keys.pop(identity_id, ()):
+                entry = self._entries.pop(key, None)
+                if entry is None:
+                    continue
+                for other_identity_id in entry[1]:
+                    if other_identity_id != identity_id:
+                        self._discard_identity_key(other_identity_id, key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._identity_keys.clear()
+
+
+_COMPILED_AUTHORIZATION_FILTERS = CompiledAuthorizationFilterCache()
+
+
+def invalidate_authorization_filter_cache(identity_id):
+    '''Remove the compiled authorization filters built for the identity. This should
+    be called whenever the identity's roles, groups or query policies change.
+    '''
+    _COMPILED_AUTHORIZATION_FILTERS.invalidate(identity_id)
+
+
+def _build_query_needs_key(query_needs):
+    '''Build a hashable key from the query needs and the config that controls how
+    the needs are converted into a Druid filter. Sets are used instead of sorting and
+    serializing the permitted values since users can hold thousands of them.
+    '''
+    needs_key = frozenset(
+        frozenset(
+            (
+                dimension_filter.dimension_name,
+                frozenset(dimension_filter.include_values),
+                frozenset(dimension_filter.exclude_values),
+                dimension_filter.all_values,
+            )
+            for dimension_filter in query_need.dimension_filters
+        )
+        for query_need in query_needs
+    )
+    return (
+        needs_key,
+        frozenset(current_app.zen_config.filters.AUTHORIZABLE_DIMENSIONS),
+        frozenset(current_app.zen_config.datatypes.HIERARCHICAL_DIMENSIONS),
+    )
+
+
+def _compile_filter(authorization_filter):
+    if isinstance(authorization_filter, EmptyFilter):
+        return authorization_filter
+    return CompiledFilter(
+        Filter.build_filter(optimize_query_filter(authorization_filter))
+    )
+
+
+def get_compiled_authorization_filter(user_identity):
+    '''Returns the authorization filter for the user identity (see
+    `_construct_authorization_filter`). The filter is built, optimized and serialized
+    once and then reused for every query until the user's query needs change.
+    '''
+    query_needs = enumerate_query_needs(user_identity)
+    key = _build_query_needs_key(query_needs)
+    compiled_filter = _COMPILED_AUTHORIZATION_FILTERS.get(key)
+    if compiled_filter is None:
+        compiled_filter = _compile_filter(
+            _build_authorization_filter_from_needs(query_needs)
+        )
+        _COMPILED_AUTHORIZATION_FILTERS.set(
+            key, getattr(user_identity, 'id', None), compiled_filter
+        )
+    return compiled_filter
+
+
+def _apply_authorization_filter(query, authorization_filter):
     # Take the logical AND of the original query filter with all the filters
     # referring to the query policies held by the user.
     if authorization_filter and not isinstance(authorization_filter, EmptyFilter):
@@ -150,7 +291,10 @@ def _construct_authorization_filter(user_identity):
     ANDed to form a full_filter.
     authorization filter.
     '''
-    query_needs = enumerate_query_needs(user_identity)
+    return _build_authorization_filter_from_needs(enumerate_query_needs(user_identity))
+
+
+def _build_authorization_filter_from_needs(query_needs):
     category_map = _categorize_query_needs_type(query_needs)
 
     simple_dimension_to_filters_map = _categorize_query_needs(category_map[SIMPLE])
@@ -319,6 +463,14 @@ def construct_query_need_from_policy(query_policy):
     return QueryNeed(query_policy.dimension_filters)
 
 
+def _run_concurrently(query_client, tasks):
+    # NOTE: Query clients that cannot run tasks concurrently (like the
+    # offline mode client) run them serially.
+    if hasattr(query_client, 'run_concurrently'):
+        return query_client.run_concurrently(tasks)
+    return [task() for task in tasks]
+
+
 class AuthorizedQueryClient:
     def __init__(self, query_client):
         self.query_client = query_client
@@ -327,5 +479,54 @@ class AuthorizedQueryClient:
     def run_query(self, query):
         return self.query_client.run_query(query)
 
+    @apply_authorization_filters()
+    def fetch_query(self, query):
+        return self.query_client.fetch_query(query)
+
+    def run_raw_query(self, query):
+        return self.query_client.run_raw_query(query)
+
+    def run_concurrently(self, tasks):
+        '''Run each task (a function taking no arguments) concurrently and return
+        the task results in order. Tasks run outside of the current request, so they
+        should query through a client returned by `preauthorize`.
+        '''
+        return _run_concurrently(self.query_client, tasks)
+
+    def with_authorization_filter(self, authorization_filter):
+        '''Returns a query client that restricts queries with an authorization filter
+        that has already been resolved for the current user. This avoids resolving
+        the user's query policies again for every query in a batch, and lets the
+        queries run outside of the request that resolved the filter.
+        '''
+        return PreauthorizedQueryClient(self.query_client, authorization_filter)
+
+    def preauthorize(self):
+        '''Returns a query client restricted by the current user's authorization
+        filter that can be used outside of the current request.'''
+        return self.with_authorization_filter(build_user_authorization_filter())
+
+
+class PreauthorizedQueryClient:
+    def __init__(self, query_client, authorization_filter):
+        self.query_client = query_client
+        self.authorization_filter = authorization_filter
+
+    def run_query(self, query):
+        if self.authorization_filter is not None:
+            query = _apply_authorization_filter(query, self.authorization_filter)
+        return self.query_client.run_query(query)
+
+    def fetch_query(self, query):
+        if self.authorization_filter is not None:
+            query = _apply_authorization_filter(query, self.authorization_filter)
+        return self.query_client.fetch_query(query)
+
     def run_raw_query(self, query):
         return self.query_client.run_raw_query(query)
+
+    def run_concurrently(self, tasks):
+        return _run_concurrently(self.query_client, tasks)
+
+    def preauthorize(self):
+        return self
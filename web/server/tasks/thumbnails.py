@@ -0,0 +1,107 @@
+from datetime import timedelta
+
+from flask import current_app
+import sqlalchemy as sa
+
+from config import settings
+from log import LOG
+from models.alchemy.dashboard import Dashboard
+from web.server.data.data_access import get_db_adapter
+from web.server.redis.thumbnail_storage_service import (
+    EXPIRATION_SEC,
+    PENDING_STATE,
+    get_thumbnail_age,
+    get_thumbnail_storage_name,
+    prerender_item,
+)
+from web.server.workers import celery_app
+
+# Dashboards edited within this many days have their thumbnails pre-rendered.
+RECENTLY_EDITED_DAYS = 7
+
+# Number of most viewed dashboards to keep pre-rendered thumbnails for.
+MOST_VIEWED_DASHBOARD_COUNT = 50
+
+# Thumbnails expiring within this many seconds are rendered again ahead of time.
+REFRESH_BEFORE_EXPIRY_SEC = 2 * 24 * 3600
+
+
+def get_prerender_dashboards():
+    '''Return a mapping from slug to the time elapsed since the last edit for the
+    recently edited and the most viewed dashboards.'''
+    # NOTE: `last_modified` is set with the database clock (`now()` stored
+    # in the database session's timezone), which does not have to match the UTC
+    # clock of this process. Measure the time since the last edit on the database
+    # clock instead.
+    db_now = get_db_adapter().session.query(sa.func.localtimestamp()).scalar()
+    edited_since = db_now - timedelta(days=RECENTLY_EDITED_DAYS)
+    # pylint: disable=no-member
+    query = Dashboard.query.with_entities(Dashboard.slug, Dashboard.last_modified)
+    recently_edited = query.filter(Dashboard.last_modified >= edited_since).all()
+    most_viewed = (
+        query.order_by(Dashboard.total_views.desc())
+        .limit(MOST_VIEWED_DASHBOARD_COUNT)
+        .all()
+    )
+    return {
+        slug: db_now - last_modified
+        for (slug, last_modified) in recently_edited + most_viewed
+    }
+
+
+def needs_prerender(slug, edit_age):
+    '''Determine if the thumbnail of a dashboard is missing, older than the last
+    edit of the dashboard (which happened `edit_age` ago) or about to expire.'''
+    value = current_app.cache.get(get_thumbnail_storage_name(slug))
+    if value is None:
+        return True
+    if value == PENDING_STATE:
+        return False
+
+    thumbnail_age = get_thumbnail_age(slug)
+    if thumbnail_age is None:
+        return False
+
+    # NOTE: Comparing elapsed times instead of timestamps since the edit time
+    # comes from the database clock and the thumbnail age from the Redis TTL.
+    return thumbnail_age > edit_age or thumbnail_age > timedelta(
+        seconds=EXPIRATION_SEC - REFRESH_BEFORE_EXPIRY_SEC
+    )
+
+
+@celery_app.register_task
+class PrerenderThumbnailsTask(celery_app.Task):  # type: ignore[name-defined]
+    '''Render the thumbnails of recently edited and frequently viewed dashboards
+    before they are requested so that the dashboard list does not wait on them.'''
+
+    name = 'prerender_thumbnails_task'
+    ignore_result = True
+
+    # pylint: disable=W0221
+    def run(self, *args, **kwargs):
+        if not settings.URLBOX_API_KEY:
+            LOG.info('Skipping thumbnail pre-rendering since no renderer is set up')
+            return
+
+        flask_app = celery_app.conf['flask_app']
+        # NOTE: Rendering builds external dashboard URLs, so it needs a request
+        # context pointing at the deployment.
+        base_url = flask_app.zen_config.general.DEPLOYMENT_BASE_URL
+        with flask_app.test_request_context(base_url=base_url):
+            dashboards = get_prerender_dashboards()
+            rendered_count = 0
+            for slug, edit_age in dashboards.items():
+                if not needs_prerender(slug, edit_age):
+                    continue
+                try:
+                    if prerender_item(slug):
+                        rendered_count += 1
+                    else:
+                        LOG.warning('Unable to pre-render thumbnail for %s', slug)
+                except Exception:  # pylint: disable=broad-except
+                    LOG.exception('Failed to pre-render thumbnail for %s', slug)
+            LOG.info(
+                'Pre-rendered %s thumbnails for %s dashboards',
+                rendered_count,
+                len(dashboards),
+            )
@@ -0,0 +1,107 @@
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Any, Iterator
+
+import rapidjson
+
+from log import LOG
+
+# Size of each serialized chunk rapidjson hands to the stream.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Maximum number of serialized chunks that can be waiting to be sent. Once the buffer
+# is full, the serializer blocks until the client has consumed a chunk, so the memory
+# used by a streamed response is bounded by roughly `chunk_size * max_buffered_chunks`
+# instead of by the size of the full response.
+DEFAULT_MAX_BUFFERED_CHUNKS = 16
+
+# How often (in seconds) a blocked serializer checks if the stream has been closed.
+_CLOSED_CHECK_INTERVAL = 1
+
+
+class StreamClosedError(Exception):
+    '''Raised inside the serializer thread when the consumer of the stream has gone
+    away (for example, the client disconnected).'''
+
+
+class _QueuedStream:
+    '''File-like object that rapidjson writes serialized chunks into. Each chunk is
+    pushed onto a bounded queue, providing backpressure to the serializer when the
+    consumer falls behind.'''
+
+    def __init__(self, queue: Queue, closed: Event):
+        self.queue = queue
+        self.closed = closed
+
+    def write(self, value: Any) -> None:
+        while True:
+            if self.closed.is_set():
+                raise StreamClosedError()
+            try:
+                self.queue.put(value, timeout=_CLOSED_CHECK_INTERVAL)
+                return
+            except Full:
+                continue
+
+
+class _SerializationError:
+    def __init__(self, exception: Exception):
+        self.exception = exception
+
+
+# Sentinel marking the end of the serialized output.
+_END_OF_STREAM = None
+
+
+def stream_json(
+    result: Any,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_buffered_chunks: int = DEFAULT_MAX_BUFFERED_CHUNKS,
+) -> Iterator[Any]:
+    '''Serialize `result` to JSON concurrently with sending it. Serialization runs on a
+    separate thread (a greenlet under gevent) and the serialized chunks are yielded as
+    soon as they are produced. Generators inside `result` are consumed lazily by
+    rapidjson, so rows can be sent while they are still being built.
+    '''
+    queue: Queue = Queue(maxsize=max_buffered_chunks)
+    closed = Event()
+    stream = _QueuedStream(queue, closed)
+
+    def serialize():
+        try:
+            # pylint: disable=c-extension-no-member
+            rapidjson.dump(result, stream, chunk_size=chunk_size)
+        except StreamClosedError:
+            return
+        # pylint: disable=broad-except
+        except Exception as e:
+            LOG.exception('Unable to serialize streamed JSON response')
+            output: Any = _SerializationError(e)
+        else:
+            output = _END_OF_STREAM
+
+        # Deliver the final marker unless the consumer has already gone away.
+        try:
+            stream.write(output)
+        except StreamClosedError:
+            pass
+
+    Thread(target=serialize, daemon=True).start()
+
+    try:
+        while True:
+            chunk = queue.get()
+            if chunk is _END_OF_STREAM:
+                return
+            if isinstance(chunk, _SerializationError):
+                raise chunk.exception
+            yield chunk
+    finally:
+        # Release the serializer if it is blocked on a full queue because the
+        # consumer stopped reading before the end of the stream.
+        closed.set()
+        while True:
+            try:
+                queue.get_nowait()
+            except Empty:
+                break